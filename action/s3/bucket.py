@@ -1,9 +1,76 @@
 import urllib
+from xml.etree import cElementTree
 
 from action.s3.key import Key
 from utilities.exception import UnsuccessfulRequestError
 
 
+def page_keys(matching_keys, is_truncated, next_marker):
+    """
+    :param matching_keys:   Keys and common prefixes of a page of a listing
+    :param is_truncated:    Whether more pages follow
+    :param next_marker:     NextMarker of the page, if any
+    :return:                (matching keys of the page in lexicographical order,
+                            marker of the next page or None if it is the last
+                            one)
+    """
+    matching_keys.sort()
+    if not is_truncated or not matching_keys:
+        return matching_keys, None
+
+    # the next page starts after the last key of this one
+    return matching_keys, (next_marker or matching_keys[-1]).strip()
+
+
+class ListPageParser(object):
+    """
+    Target of a cElementTree.XMLParser collecting the keys of a
+    ListBucketResult page while it is fed, so that neither the page nor its
+    document tree is held as a whole. The parser returns the result of
+    page_keys when closed
+    """
+
+    def __init__(self):
+        self.matching_keys = []
+        self.is_truncated = False
+        self.next_marker = None
+        # local names of the open elements
+        self.path = []
+        self.text = []
+
+    def start(self, tag, attributes):
+        self.path.append(tag.rsplit('}', 1)[-1])
+        self.text = []
+
+    def data(self, data):
+        self.text.append(data)
+
+    def end(self, tag):
+        element = self.path[-2:]
+        text = ''.join(self.text)
+
+        if element in (['Contents', 'Key'], ['CommonPrefixes', 'Prefix']):
+            self.matching_keys.append(text)
+        elif element == ['ListBucketResult', 'IsTruncated']:
+            self.is_truncated = text.strip() == 'true'
+        elif element == ['ListBucketResult', 'NextMarker']:
+            self.next_marker = text.strip() or None
+
+        self.path.pop()
+        self.text = []
+
+    def close(self):
+        return page_keys(self.matching_keys, self.is_truncated,
+                         self.next_marker)
+
+
+def new_list_page_parser():
+    """
+    :return: XMLParser to feed a ListBucketResult page to, piece by piece
+    """
+    return cElementTree.XMLParser(target=ListPageParser())
+
+
 class Bucket:
     """
     Represent S3 Bucket object and provide actions against S3 Buckets
@@ -13,6 +80,47 @@ class Bucket:
         self.name = name
         self.connection = connection
 
+        # keys listed by list_new_keys for each prefix
+        self.listed_keys = dict()
+
+    def list_keys(self, parameters):
+        """
+        Function that lists S3 bucket keys page by page. Following pages are
+        only requested as keys are consumed
+
+        :param parameters:  query parameter that can be used to search for
+                            a key e.g. delimiter, prefix, marker, max-keys
+        :return: Generator of the matching keys in lexicographical order,
+                 including common prefixes when a delimiter is given
+        """
+        parameters = dict(parameters)
+
+        while True:
+            query_para = []
+            for k, v in parameters.iteritems():
+                query_para.append('%s=%s' % (k, urllib.quote(v)))
+
+            query_args = '&'.join(query_para) or None
+            response = self.connection.make_request('GET', self.name,
+                                                    query_args=query_args)
+            if response.status >= 300:
+                raise UnsuccessfulRequestError(response.status,
+                                               response.reason,
+                                               response.read())
+
+            # parsed while it is read, large pages are never held whole
+            parser = new_list_page_parser()
+            for data in response.iter_content():
+                parser.feed(data)
+            matching_keys, next_marker = parser.close()
+
+            for key_name in matching_keys:
+                yield key_name
+
+            if not next_marker:
+                return
+            parameters['marker'] = next_marker
+
     def search_key(self, parameters):
         """
         Function that search for S3 bucket keys
@@ -22,20 +130,35 @@ class Bucket:
         :return: The matching keys
         """
 
-        query_para = []
-        for k, v in parameters.iteritems():
-            query_para.append('%s=%s' % (k, urllib.quote(v)))
+        return list(self.list_keys(parameters))
 
-        query_args = '&'.join(query_para) or None
-        response = \
-            self.connection.make_request('GET', self.name,
-                                         response_class='ListBucketResult',
-                                         query_args=query_args)
+    def list_new_keys(self, parameters):
+        """
+        Function that lists only the keys that have not been listed by
+        previous calls with the same prefix. The prefix is listed from the
+        start every time since a key delivered later can sort before keys
+        listed already, e.g. ELB logs whose names only differ in the node ip
+        and a random suffix. Markers only page through a single listing
 
-        matching_keys = [common_prefix.prefix for common_prefix in
-                         response.common_prefixes.data]
+        :param parameters:  query parameter that can be used to search for
+                            a key e.g. delimiter, prefix
+        :return: Generator of the new matching keys
+        """
+        prefix = parameters.get('prefix', '')
+        listed_keys = self.listed_keys.setdefault(prefix, set())
 
-        return matching_keys
+        for key_name in self.list_keys(parameters):
+            if key_name not in listed_keys:
+                listed_keys.add(key_name)
+                yield key_name
+
+    def forget_keys(self, prefix):
+        """
+        Function that makes list_new_keys list the prefix from the start again
+
+        :param prefix:  The prefix passed to list_new_keys
+        """
+        self.listed_keys.pop(prefix, None)
 
     def get_key(self, key_name):
         """
@@ -1,7 +1,7 @@
 import errno
 import re
 
-from etc.configuration import cfg
+from etc.configuration import get_settings
 from utilities.exception import S3Exception, UnsuccessfulRequestError
 
 
@@ -12,7 +12,11 @@ class Key(object):
 
     DefaultContentType = 'application/octet-stream'
 
-    BufferSize = cfg.get_int('s3', 'key_buffer_size', 8192)
+    @property
+    def BufferSize(self):
+        # [s3] key_buffer_size of the current settings, so that a reload
+        # applies to keys already made
+        return get_settings().key_buffer_size
 
     def __init__(self, bucket=None, name=None):
         self.bucket = bucket
@@ -45,21 +49,69 @@ class Key(object):
             raise StopIteration
         return data
 
+    @staticmethod
+    def _write_fragment(fp, content_fragment):
+        try:
+            fp.write(content_fragment)
+        except IOError, e:
+            if e.errno == errno.ENOSPC:
+                raise S3Exception('Out of space for saving file '
+                                  '%s' % fp.name)
+            raise
+
     def get_contents_to_file(self, fp):
+        """
+        Save the key content to a file
 
+        :param fp:  File opened for writing
+        """
         self.open_read()
         data_size = 0
 
+        # a single buffer is reused for the whole content and written
+        # without copying the part filled
+        buf = bytearray(self.BufferSize)
         try:
-            for content_fragment in self:
-                fp.write(content_fragment)
-                data_size += len(content_fragment)
+            while True:
+                fragment_size = self.response.readinto(buf)
+                if not fragment_size:
+                    break
+                self._write_fragment(fp, buffer(buf, 0, fragment_size))
+                data_size += fragment_size
+        finally:
+            self.close()
 
-        except IOError, e:
-            if e.errno == errno.ENOSPC:
-                raise S3Exception('Out of space for saving file '
-                                  '%s' % fp.name)
-            raise
+        if self.size is None:
+            self.size = data_size
+
+    def iter_line_blocks(self, fp=None, block_size=None):
+        """
+        Group the key content into blocks of complete lines while it is
+        being downloaded, so that it can be processed without waiting for the
+        whole content
+
+        :param fp:          File that the content is also saved to, if any
+        :param block_size:  Minimum size of blocks, BufferSize by default
+        :return:            Blocks of lines. Every block but the last one ends
+                            with a line break
+        """
+        splitter = LineBlockSplitter(block_size or self.BufferSize)
+
+        self.open_read()
+        data_size = 0
+
+        for content_fragment in self:
+            if fp:
+                self._write_fragment(fp, content_fragment)
+            data_size += len(content_fragment)
+
+            block = splitter.feed(content_fragment)
+            if block:
+                yield block
+
+        block = splitter.flush()
+        if block:
+            yield block
 
         if self.size is None:
             self.size = data_size
@@ -119,6 +171,50 @@ class Key(object):
         """
 
         if self.response and not consume:
-            self.response.read()
+            # the rest is read piece by piece rather than as a whole
+            for data in self.response.iter_content(self.BufferSize):
+                pass
+
+        self.response = None
 
-        self.response = None
\ No newline at end of file
+
+class LineBlockSplitter(object):
+    """
+    Groups fragments of a line based content into blocks of complete lines
+    """
+
+    def __init__(self, block_size):
+        """
+        :param block_size:  Minimum size of blocks
+        """
+        self.block_size = block_size
+        self.fragments = []
+        self.fragments_size = 0
+
+    def feed(self, fragment):
+        """
+        :return: A block of lines ending with a line break once at least
+                 block_size bytes are buffered, None otherwise
+        """
+        self.fragments.append(fragment)
+        self.fragments_size += len(fragment)
+        if self.fragments_size < self.block_size:
+            return None
+
+        data = ''.join(self.fragments)
+        end = data.rfind('\n') + 1
+
+        # the beginning of a line that continues in the next fragment
+        self.fragments = [data[end:]]
+        self.fragments_size = len(data) - end
+
+        return data[:end] or None
+
+    def flush(self):
+        """
+        :return: What is left buffered, the last line may lack a line break
+        """
+        data = ''.join(self.fragments)
+        self.fragments = []
+        self.fragments_size = 0
+        return data or None
@@ -0,0 +1,146 @@
+"""
+Micro-benchmark of the ELB access log accumulator.
+
+Compares ClientTrafficAccumulator with the per line loop read_log used
+before on a synthetic access log. Run from the repository root:
+
+    python -m benchmarks.elb_accumulator --size 1024
+"""
+import optparse
+import os
+import random
+import tempfile
+import time
+
+from data_parser.s3.process_access_log import ClientTrafficAccumulator, \
+    access_log_batch_bytes
+
+CLIENT_IPS = {'54.254.18.173': 'ap_south_1_client_1',
+              '54.241.195.22': 'us_west_1_client_1'}
+
+# ips that do not belong to any client
+OTHER_IPS = ['10.0.0.%d' % i for i in xrange(1, 5)]
+
+
+def legacy_accumulate(lines, client_ips_name_pair):
+    """
+    The loop of read_log before the batched accumulator, kept as the
+    baseline
+    """
+    client_in_dict = dict((c_name, 0)
+                          for c_name in client_ips_name_pair.values())
+    client_out_dict = dict(client_in_dict)
+
+    for line in lines:
+        split_str = line.split(' ')
+
+        if len(split_str) < 11:
+            continue
+
+        client_ip = split_str[2].split(":")[0]
+        if client_ip not in client_ips_name_pair.keys():
+            continue
+
+        c_name = client_ips_name_pair[client_ip]
+
+        received_byte = int(split_str[9])
+        sent_byte = int(split_str[10])
+
+        client_in_dict[c_name] += received_byte
+        client_out_dict[c_name] += sent_byte
+
+    return client_in_dict, client_out_dict
+
+
+def write_synthetic_log(file_path, size, seed=0):
+    """
+    Write an ELB access log of about size bytes
+    """
+    rand = random.Random(seed)
+    ips = CLIENT_IPS.keys() * 5 + OTHER_IPS
+    written = 0
+
+    with open(file_path, 'w') as f:
+        while written < size:
+            lines = []
+            for i in xrange(1000):
+                lines.append(
+                    '2014-02-15T23:39:43.%06dZ xueshi-station-1 %s:%d '
+                    '10.0.0.1:80 0.000073 0.%06d 0.000057 200 200 %d %d '
+                    '"GET http://www.example.com:80/shop/%d HTTP/1.1"\n'
+                    % (rand.randint(0, 999999), rand.choice(ips),
+                       rand.randint(1024, 65535), rand.randint(0, 999999),
+                       rand.randint(0, 2000), rand.randint(0, 200000),
+                       rand.randint(0, 1000)))
+            data = ''.join(lines)
+            f.write(data)
+            written += len(data)
+
+
+def measure(file_path, accumulate):
+    start = time.time()
+    with open(file_path) as f:
+        results = accumulate(f)
+    return time.time() - start, results
+
+
+def accumulate_in_batches(f):
+    """
+    Feed the accumulator with blocks of complete lines like
+    Key.iter_line_blocks does
+    """
+    accumulator = ClientTrafficAccumulator(CLIENT_IPS)
+
+    remainder = ''
+    while True:
+        data = f.read(access_log_batch_bytes)
+        if not data:
+            break
+
+        data = remainder + data
+        end = data.rfind('\n') + 1
+        remainder = data[end:]
+        if end:
+            accumulator.add_block(data[:end])
+
+    if remainder:
+        accumulator.add_block(remainder)
+
+    # the baseline does not count requests
+    return accumulator.results()[:2]
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--size', type='int', default=1024,
+                      help='size of the synthetic log in MB')
+    parser.add_option('--log', help='existing access log to read instead')
+    options, args = parser.parse_args()
+
+    file_path = options.log
+    if not file_path:
+        fd, file_path = tempfile.mkstemp(suffix='.log', prefix='elb_log_')
+        os.close(fd)
+        print 'Writing %s MB to %s' % (options.size, file_path)
+        write_synthetic_log(file_path, options.size * 1024 * 1024)
+
+    size = os.path.getsize(file_path) / 1024.0 / 1024
+
+    try:
+        results = []
+        for name, accumulate in \
+                [('before (per line loop)',
+                  lambda lines: legacy_accumulate(lines, CLIENT_IPS)),
+                 ('after (batched)', accumulate_in_batches)]:
+            elapsed, result = measure(file_path, accumulate)
+            results.append(result)
+            print '%-24s %.2fs, %.1f MB/s' % (name, elapsed, size / elapsed)
+
+        print 'Same results: %s' % (results[0] == results[1])
+    finally:
+        if not options.log:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
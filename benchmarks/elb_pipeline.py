@@ -0,0 +1,308 @@
+"""
+End-to-end benchmark of the ELB access log pipeline against the local S3
+stand-in.
+
+Synthetic access logs of the configured stations are written for the next
+logging intervals, one minute long, and served by benchmarks.s3_stand_in
+with a delivery delay. process_elb_access_log then runs as it does in main,
+polling, downloading and counting each interval's logs.
+
+Timings come from the requests the stand-in records:
+- found: first request for a log after it was delivered
+- counted: last byte of the log sent
+- MB/s: bytes of an interval over the time any of its logs was downloaded
+
+Since logs are parsed while they are downloaded, the time a log is counted
+is close to the time its last byte is sent. The run fails unless every log
+written for the intervals the pipeline collects was counted. Run from the
+repository root; a run takes about a minute per interval:
+
+    python -m benchmarks.elb_pipeline --intervals 3 --size 16
+"""
+import Queue
+import calendar
+import json
+import optparse
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from etc.configuration import cfg, refresh_settings
+
+# minutes per logging interval, the shortest S3 supports is 5 but the
+# pipeline works the same with any
+LOG_INTERVAL = 1
+
+TIME_PATTERN = re.compile(r'_(\d{8}T\d{4}Z)_')
+
+
+def configure(port, options):
+    """
+    Point the pipeline at the stand-in. Some settings are read when modules
+    are imported, hence this is done before the pipeline is imported
+    """
+    settings = [('s3', 'host', '127.0.0.1'),
+                ('s3', 'port', str(port)),
+                ('s3', 'is_secure', 'false'),
+                ('s3', 'path_style', 'true'),
+                ('s3', 'fetch_engine', options.engine),
+                ('s3', 'log_emitting_time', str(LOG_INTERVAL)),
+                ('s3', 'log_polling_interval', str(options.polling_interval)),
+                # every log is downloaded and none is kept
+                ('s3', 'access_log_index', ''),
+                ('s3', 'keep_access_logs', 'false'),
+                ('Default', 'measurement_interval',
+                 str(options.intervals * LOG_INTERVAL))]
+    for section, name, value in settings:
+        cfg.set(section, name, value)
+    refresh_settings()
+
+
+def write_logs(root, elbs, num_intervals, num_nodes, template_path):
+    """
+    Write a log per elb node for each of the next num_intervals + 1
+    intervals, the extra one in case the pipeline starts in the next minute.
+    Each log is a copy of template_path whose modification time is the end
+    of its interval
+
+    :param elbs:    (elb name, elb region, bucket name) of each elb
+    :return:        Key names of the logs by (bucket name, interval end
+                    time as in the key names)
+    """
+    written = dict()
+    rand = random.Random(0)
+    first = datetime.utcnow().replace(second=0, microsecond=0)
+
+    from data_parser.s3.process_access_log import elb_log_key_prefix
+
+    for k in xrange(1, num_intervals + 2):
+        log_time = first + timedelta(minutes=k * LOG_INTERVAL)
+        end_time = calendar.timegm(log_time.utctimetuple())
+
+        for elb_name, elb_region, bucket_name in elbs:
+            key_prefix = elb_log_key_prefix(elb_region, elb_name, log_time)
+            for node in xrange(num_nodes):
+                key_name = '%s_10.0.0.%d_%08x.log' \
+                           % (key_prefix, node + 1, rand.getrandbits(32))
+                path = os.path.join(root, bucket_name, *key_name.split('/'))
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+
+                shutil.copyfile(template_path, path)
+                os.utime(path, (end_time, end_time))
+
+                written.setdefault(
+                    (bucket_name, log_time.strftime('%Y%m%dT%H%MZ')),
+                    []).append(key_name)
+
+    return written
+
+
+def collected_intervals(start, num_intervals):
+    """
+    :param start:   Time the pipeline started at
+    :return:        End times, as in the key names, of the intervals the
+                    pipeline collects: the next num_intervals ones
+    """
+    first = datetime.utcfromtimestamp(start).replace(second=0, microsecond=0)
+    return [(first + timedelta(minutes=k * LOG_INTERVAL)).strftime(
+        '%Y%m%dT%H%MZ') for k in xrange(1, num_intervals + 1)]
+
+
+def missing_logs(written, downloads, intervals):
+    """
+    :param written:     Key names of the logs written by write_logs
+    :param downloads:   Complete downloads by (bucket name, key name)
+    :param intervals:   End times of the intervals collected
+    :return:            (bucket name, key name) of the logs written for the
+                        intervals that were not downloaded in full
+    """
+    return sorted((bucket_name, key_name)
+                  for (bucket_name, end_time), key_names in
+                  written.iteritems() if end_time in intervals
+                  for key_name in key_names
+                  if (bucket_name, key_name) not in downloads)
+
+
+def start_stand_in(root, events_path, options):
+    """
+    :return: (stand-in process, port it listens on)
+    """
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.s3_stand_in', '--root', root,
+         '--port', '0', '--delay', str(options.delay),
+         '--jitter', str(options.jitter), '--events', events_path],
+        cwd=repository, stdout=subprocess.PIPE)
+
+    line = process.stdout.readline()
+    match = re.search(r':(\d+)$', line.strip())
+    if not match:
+        process.kill()
+        raise RuntimeError('S3 stand-in did not start: %r' % line)
+    return process, int(match.group(1))
+
+
+def read_events(events_path):
+    with open(events_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def busy_time(spans):
+    """
+    :param spans:   (start, end) of downloads
+    :return:        Seconds during which at least one download ran
+    """
+    total = 0
+    last_end = None
+    for start, end in sorted(spans):
+        if last_end is not None:
+            start = max(start, last_end)
+        if end > start:
+            total += end - start
+        last_end = max(end, last_end)
+    return total
+
+
+def report(events, elapsed, size):
+    counts = dict()
+    for event in events:
+        counts[event['method']] = counts.get(event['method'], 0) + 1
+    print 'Wall time %.1fs' % elapsed
+    print 'Requests: %s' % ', '.join('%d %s' % (count, method) for
+                                     method, count in sorted(counts.items()))
+
+    first_request = dict()
+    downloads = dict()
+    for event in events:
+        if event['method'] == 'LIST' or event['status'] >= 300:
+            continue
+        log_id = (event['bucket'], event['key'])
+        first_request.setdefault(log_id, event['start'])
+        if event['method'] == 'GET' and event['bytes'] == size:
+            downloads[log_id] = event
+
+    intervals = dict()
+    for log_id, event in downloads.iteritems():
+        intervals.setdefault(TIME_PATTERN.search(log_id[1]).group(1),
+                             []).append((log_id, event))
+
+    for end_time, logs in sorted(intervals.iteritems()):
+        found = max(first_request[log_id] - event['visible_at']
+                    for log_id, event in logs)
+        counted = max(event['end'] - event['visible_at']
+                      for log_id, event in logs)
+        span = busy_time([(event['start'], event['end'])
+                          for log_id, event in logs])
+        total = sum(event['bytes'] for log_id, event in logs) / 1024.0 / 1024
+
+        print 'Interval %s: %d logs, %.1f MB, found after %.1fs, counted ' \
+              '%.1fs after delivery, %.1f MB/s' \
+              % (end_time, len(logs), total, found, counted,
+                 total / max(span, 1e-6))
+
+    return downloads
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--intervals', type='int', default=3,
+                      help='number of logging intervals to collect')
+    parser.add_option('--nodes', type='int', default=2,
+                      help='logs per elb and interval')
+    parser.add_option('--size', type='int', default=16,
+                      help='size of each log in MB')
+    parser.add_option('--delay', type='float', default=15,
+                      help='seconds logs are delivered after their interval')
+    parser.add_option('--jitter', type='float', default=10,
+                      help='maximum seconds added to the delivery delay')
+    parser.add_option('--polling-interval', type='int', default=10,
+                      help='seconds between listings until delays are learnt')
+    parser.add_option('--engine', default='threads',
+                      choices=['threads', 'event_loop'],
+                      help='fetch engine of the pipeline')
+    options, args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='s3_stand_in_')
+    events_path = os.path.join(root, 'events.txt')
+    template_path = os.path.join(root, 'template.log')
+    process = None
+
+    try:
+        process, port = start_stand_in(root, events_path, options)
+        configure(port, options)
+
+        from benchmarks.elb_accumulator import legacy_accumulate, \
+            write_synthetic_log, CLIENT_IPS
+        from data_parser.s3.process_access_log import process_elb_access_log
+        from utilities.utils import get_station_region, get_elb_buckets_map
+
+        elb_regions = get_station_region()
+        elb_buckets = get_elb_buckets_map()
+        elbs = [(station, region, elb_buckets[station])
+                for station, region in elb_regions.iteritems()]
+
+        print 'Writing %d logs of %d MB to %s' \
+              % (len(elbs) * options.nodes * (options.intervals + 1),
+                 options.size, root)
+        write_synthetic_log(template_path, options.size * 1024 * 1024)
+        written = write_logs(root, elbs, options.intervals, options.nodes,
+                             template_path)
+
+        # what each log has to be counted as
+        with open(template_path) as f:
+            log_in, log_out = legacy_accumulate(f, CLIENT_IPS)
+
+        elb_buckets_dict = dict(('%s:%s' % (station, region),
+                                 unicode(bucket_name))
+                                for station, region, bucket_name in elbs)
+        queue = Queue.Queue()
+
+        start = time.time()
+        process_elb_access_log(elb_buckets_dict, queue)
+        elapsed = time.time() - start
+
+        data_in, data_out = queue.get()[:2]
+
+        print ''
+        print 'Engine %s, %d elbs with %d logs of %d MB per interval, ' \
+              'delivered %.0fs to %.0fs after their interval' \
+              % (options.engine, len(elbs), options.nodes, options.size,
+                 options.delay, options.delay + options.jitter)
+        downloads = report(read_events(events_path), elapsed,
+                           os.path.getsize(template_path))
+
+        intervals = collected_intervals(start, options.intervals)
+        missing = missing_logs(written, downloads, intervals)
+        for bucket_name, key_name in missing:
+            print 'Missing %s/%s' % (bucket_name, key_name)
+
+        # every log written for the collected intervals has to be counted
+        num_logs = options.nodes * options.intervals
+        correct = not missing
+        for station, region, bucket_name in elbs:
+            for c_name in log_in:
+                correct &= data_in[station][c_name] == \
+                    num_logs * log_in[c_name]
+                correct &= data_out[station][c_name] == \
+                    num_logs * log_out[c_name]
+        print 'Counted bytes match the %d logs written per elb: %s' \
+              % (num_logs, correct)
+    finally:
+        if process:
+            process.kill()
+            process.wait()
+        shutil.rmtree(root)
+
+    if not correct:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
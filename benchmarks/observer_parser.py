@@ -0,0 +1,185 @@
+"""
+Micro-benchmark of the observer log property parser.
+
+Compares the table-driven MetricStateMachine with the string comparison
+parser it replaced on a synthetic observer log. Run from the repository
+root:
+
+    python -m benchmarks.observer_parser --lines 10000000
+"""
+import optparse
+import os
+import random
+import tempfile
+import time
+
+from data_parser.client_server.observer_records import ParseStats, \
+    iter_file_rows, iter_metric_records
+
+PROPERTIES = ['isAbout', 'isProducedBy', 'hasMonitoredMetric', 'hasValue',
+              'hasTimeStamp']
+
+METRICS = ['CPUUtil', 'CPUUtilStolen', 'Timestamps_SIGAR_CPU', 'ResponseInfo']
+
+
+def legacy_iter_metric_records(rows, stats):
+    """
+    The parser before it became table driven, kept as the baseline
+    """
+    metric_name = None
+    last_metric_id = None
+    metric_value = None
+    timestamps = None
+    vm_id = None
+
+    expected_properties = ['isAbout', 'isProducedBy',
+                           'hasMonitoredMetric', 'hasValue',
+                           'hasTimeStamp']
+    expected_prop_idx = 0
+
+    for metric_id, metric_prop, value in rows:
+
+        if 'MonitoringDatum' not in metric_id:
+            continue
+
+        if not last_metric_id:
+            last_metric_id = metric_id
+
+        if metric_prop != expected_properties[expected_prop_idx] or \
+           (expected_prop_idx != 0 and metric_id != last_metric_id):
+
+            stats.skipped += 1
+
+            if metric_prop == 'isAbout':
+                expected_prop_idx = 0
+                last_metric_id = metric_id
+            else:
+                expected_prop_idx = 0
+                last_metric_id = None
+                continue
+
+        if expected_prop_idx == len(expected_properties) - 1:
+            expected_prop_idx = 0
+        else:
+            expected_prop_idx += 1
+
+        if last_metric_id != metric_id:
+            if vm_id and metric_name and metric_value and timestamps:
+                yield vm_id, metric_name, metric_value, timestamps
+
+            last_metric_id = metric_id
+
+        if metric_prop == "isAbout":
+            vm_id = value.replace("Compute#", "")
+        elif metric_prop == "hasMonitoredMetric":
+            metric_name = value.replace("QoSMetric#", "")
+        elif metric_prop == "hasValue":
+            metric_value = value
+        elif metric_prop == "hasTimeStamp":
+            timestamps = value
+
+
+def write_synthetic_log(file_path, num_lines, seed=0):
+    """
+    Write an observer log of roughly num_lines lines. Batches of metrics
+    start with an ObserverReceivedTimesampt header and about one metric in
+    a thousand has its properties mixed up
+    """
+    rand = random.Random(seed)
+    timestamp = 1404206624163
+    metric_num = 0
+    written = 0
+
+    with open(file_path, 'w') as f:
+        while written < num_lines:
+            f.write('%08x-uuid\tObserverReceivedTimesampt\t%d\n' % (written,
+                                                                   timestamp))
+            written += 1
+
+            for i in xrange(20):
+                metric_id = 'MonitoringDatum#M%d' % metric_num
+                metric_num += 1
+                metric_name = rand.choice(METRICS)
+                if metric_name == 'ResponseInfo':
+                    value = '2014,07,01,09,26,32,434,' \
+                            'http-bio-0.0.0.0-8080-exec-9,login,' \
+                            'Request Done,0.585'
+                else:
+                    value = '%.4f' % rand.random()
+
+                values = ['Compute#vm%d' % rand.randint(1, 2),
+                          'DataCollector#dc1',
+                          'QoSMetric#' + metric_name, value, str(timestamp)]
+                order = range(len(PROPERTIES))
+                if rand.random() < 0.001:
+                    rand.shuffle(order)
+
+                for k in order:
+                    f.write('%s\t%s\t%s\t \n' % (metric_id, PROPERTIES[k],
+                                                 values[k]))
+                written += len(PROPERTIES)
+                timestamp += 7
+
+    return written
+
+
+def measure(file_path, parser):
+    """
+    :return: (seconds, number of records, number of skipped entries)
+    """
+    stats = ParseStats(0)
+    num_records = 0
+
+    start = time.time()
+    with open(file_path) as f:
+        rows = iter_file_rows(f, stats)
+        if parser:
+            for record in parser(rows, stats):
+                num_records += 1
+        else:
+            # cost of reading and splitting lines alone
+            for row in rows:
+                pass
+    elapsed = time.time() - start
+
+    return elapsed, num_records, stats.skipped
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--lines', type='int', default=10000000,
+                      help='number of lines of the synthetic log')
+    parser.add_option('--log', help='existing observer log to parse instead')
+    options, args = parser.parse_args()
+
+    file_path = options.log
+    if not file_path:
+        fd, file_path = tempfile.mkstemp(suffix='.txt',
+                                         prefix='observer_log_')
+        os.close(fd)
+        print 'Writing %s lines to %s' % (options.lines, file_path)
+        write_synthetic_log(file_path, options.lines)
+
+    with open(file_path) as f:
+        num_lines = sum(1 for line in f)
+
+    try:
+        split_time = measure(file_path, None)[0]
+        print 'reading and splitting: %.2fs' % split_time
+
+        for name, record_parser in \
+                [('before (string comparisons)', legacy_iter_metric_records),
+                 ('after (table driven)', iter_metric_records)]:
+            elapsed, num_records, skipped = measure(file_path, record_parser)
+            parse_time = max(elapsed - split_time, 1e-9)
+            print '%-28s %.2fs, %d lines/s overall, %d lines/s parsing ' \
+                  'only, %d records, %d skipped' \
+                  % (name, elapsed, num_lines / elapsed,
+                     num_lines / parse_time, num_records, skipped)
+    finally:
+        if not options.log:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+Local stand-in for the part of S3 the ELB access log pipeline talks to.
+
+Files under the root directory are served as objects, <root>/<bucket>/<key>:
+
+    HEAD /<bucket>              whether the bucket exists
+    GET  /<bucket>?prefix=...   ListBucketResult with Contents and
+                                CommonPrefixes, paged by marker and max-keys
+    HEAD /<bucket>/<key>        ETag, Content-Length and Last-Modified
+    GET  /<bucket>/<key>        content, Range requests included
+
+Objects are delivered the way S3 delivers ELB access logs: an object is
+neither listed nor served before delivery_delay seconds, plus up to
+delivery_jitter seconds depending on its key, after the modification time
+of its file. Logs can hence be written ahead of time with the end of their
+logging interval as modification time.
+
+Requests may address buckets by host name, as S3Connection does by default,
+or by path with [s3] path_style = true. Signatures are not checked. Run from
+the repository root:
+
+    python -m benchmarks.s3_stand_in --root /tmp/s3 --port 8000
+"""
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import optparse
+import os
+import re
+import sys
+import threading
+import time
+import urllib
+import urlparse
+from xml.sax.saxutils import escape
+
+# bytes written to the socket at a time
+CHUNK_SIZE = 65536
+
+MAX_KEYS = 1000
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def http_date(timestamp):
+    return time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(timestamp))
+
+
+def iso_date(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+class S3StandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves the files under root as S3 objects, each request on its own
+    thread
+    """
+    daemon_threads = True
+
+    def __init__(self, address, root, delivery_delay=0, delivery_jitter=0,
+                 events_path=None, verbose=False):
+        """
+        :param address:         (host, port) to listen on, port 0 for any
+        :param root:            Directory holding a directory per bucket
+        :param delivery_delay:  Seconds after the modification time of a
+                                file its object becomes visible
+        :param delivery_jitter: Maximum seconds added to delivery_delay,
+                                fixed per key
+        :param events_path:     File every request is appended to as a json
+                                line, None to not record requests
+        :param verbose:         Whether to log every request
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, S3StandInHandler)
+        self.root = os.path.abspath(root)
+        self.delivery_delay = delivery_delay
+        self.delivery_jitter = delivery_jitter
+        self.verbose = verbose
+
+        self.events_lock = threading.Lock()
+        self.events = None
+        if events_path:
+            self.events = open(events_path, 'a')
+
+    def record(self, event):
+        if not self.events:
+            return
+        with self.events_lock:
+            self.events.write(json.dumps(event) + '\n')
+            self.events.flush()
+
+    def bucket_names(self):
+        return [name for name in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, name))]
+
+    def file_path(self, bucket_name, key_name):
+        return os.path.join(self.root, bucket_name, *key_name.split('/'))
+
+    def visible_at(self, key_name, stat):
+        """
+        :return: Time the object of a file with the given os.stat() result
+                 is delivered at
+        """
+        fraction = int(hashlib.md5(key_name).hexdigest()[:8], 16) / 2.0 ** 32
+        return stat.st_mtime + self.delivery_delay + \
+            self.delivery_jitter * fraction
+
+    def lookup(self, bucket_name, key_name):
+        """
+        :return: os.stat() of the file of a delivered object, None if there
+                 is no such object yet
+        """
+        try:
+            stat = os.stat(self.file_path(bucket_name, key_name))
+        except OSError:
+            return None
+
+        if not os.path.isfile(self.file_path(bucket_name, key_name)) or \
+                self.visible_at(key_name, stat) > time.time():
+            return None
+        return stat
+
+    def list_objects(self, bucket_name, prefix):
+        """
+        :return: Sorted (key name, os.stat()) of the delivered objects whose
+                 key starts with prefix
+        """
+        bucket_dir = os.path.join(self.root, bucket_name)
+        # only the directory the prefix points into is walked
+        start = os.path.join(bucket_dir, *prefix.split('/')[:-1])
+
+        now = time.time()
+        objects = []
+        for directory, dir_names, file_names in os.walk(start):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                key_name = os.path.relpath(path, bucket_dir) \
+                    .replace(os.sep, '/')
+                if not key_name.startswith(prefix):
+                    continue
+
+                stat = os.stat(path)
+                if self.visible_at(key_name, stat) <= now:
+                    objects.append((key_name, stat))
+
+        objects.sort()
+        return objects
+
+
+def entity_tag(key_name, stat):
+    return '"%s"' % hashlib.md5('%s:%d:%r' % (key_name, stat.st_size,
+                                              stat.st_mtime)).hexdigest()
+
+
+class S3StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers the requests of one connection, which is kept open between them
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'S3StandIn'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format,
+                                                              *args)
+
+    def _target(self):
+        """
+        :return: (bucket name, key name, query parameters) of the request,
+                 the key name is empty for requests to the bucket
+        """
+        url = urlparse.urlsplit(self.path)
+        path = urllib.unquote(url.path).lstrip('/')
+        query = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+
+        host = (self.headers.get('host') or '').split(':')[0]
+        for bucket_name in self.server.bucket_names():
+            if host.startswith(bucket_name + '.'):
+                return bucket_name, path, query
+
+        bucket_name, _, key_name = path.partition('/')
+        return bucket_name, key_name, query
+
+    def _send_error(self, status, code, message):
+        body = '<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>%s' \
+               '</Code><Message>%s</Message></Error>' % (code, message)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return len(body)
+
+    def _handle(self):
+        start = time.time()
+        bucket_name, key_name, query = self._target()
+        event = {'method': self.command, 'bucket': bucket_name,
+                 'key': key_name, 'start': start}
+
+        if not bucket_name or \
+                not os.path.isdir(os.path.join(self.server.root,
+                                               bucket_name)):
+            status, sent = 404, self._send_error(404, 'NoSuchBucket',
+                                                 'No such bucket')
+        elif not key_name:
+            event['method'] = 'LIST' if self.command == 'GET' else 'HEAD'
+            status, sent = self._bucket(bucket_name, query, event)
+        else:
+            status, sent = self._object(bucket_name, key_name, event)
+
+        event.update({'status': status, 'bytes': sent, 'end': time.time()})
+        self.server.record(event)
+
+    do_GET = _handle
+    do_HEAD = _handle
+
+    def _bucket(self, bucket_name, query, event):
+        if self.command == 'HEAD':
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return 200, 0
+
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter', '')
+        marker = query.get('marker', '')
+        max_keys = min(int(query.get('max-keys') or MAX_KEYS), MAX_KEYS)
+        event['prefix'] = prefix
+
+        contents = []
+        common_prefixes = []
+        is_truncated = False
+        last = None
+        for key_name, stat in self.server.list_objects(bucket_name, prefix):
+            common_prefix = None
+            if delimiter:
+                end = key_name.find(delimiter, len(prefix))
+                if end >= 0:
+                    common_prefix = key_name[:end + len(delimiter)]
+
+            entry = common_prefix or key_name
+            if entry <= marker or entry == last:
+                continue
+            if len(contents) + len(common_prefixes) == max_keys:
+                is_truncated = True
+                break
+
+            if common_prefix:
+                common_prefixes.append(common_prefix)
+            else:
+                contents.append((key_name, stat))
+            last = entry
+
+        event['listed'] = [key_name for key_name, stat in contents] + \
+            common_prefixes
+
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/'
+                 '2006-03-01/">',
+                 '<Name>%s</Name>' % escape(bucket_name),
+                 '<Prefix>%s</Prefix>' % escape(prefix),
+                 '<Marker>%s</Marker>' % escape(marker)]
+        if is_truncated and delimiter:
+            parts.append('<NextMarker>%s</NextMarker>' % escape(last))
+        parts.append('<MaxKeys>%d</MaxKeys>' % max_keys)
+        if delimiter:
+            parts.append('<Delimiter>%s</Delimiter>' % escape(delimiter))
+        parts.append('<IsTruncated>%s</IsTruncated>'
+                     % ('true' if is_truncated else 'false'))
+        for key_name, stat in contents:
+            parts.append('<Contents><Key>%s</Key><LastModified>%s'
+                         '</LastModified><ETag>%s</ETag><Size>%d</Size>'
+                         '<Owner><ID>stand-in</ID><DisplayName>stand-in'
+                         '</DisplayName></Owner><StorageClass>STANDARD'
+                         '</StorageClass></Contents>'
+                         % (escape(key_name), iso_date(stat.st_mtime),
+                            escape(entity_tag(key_name, stat)),
+                            stat.st_size))
+        for common_prefix in common_prefixes:
+            parts.append('<CommonPrefixes><Prefix>%s</Prefix>'
+                         '</CommonPrefixes>' % escape(common_prefix))
+        parts.append('</ListBucketResult>')
+        body = ''.join(parts)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return 200, len(body)
+
+    def _object(self, bucket_name, key_name, event):
+        stat = self.server.lookup(bucket_name, key_name)
+        if not stat:
+            return 404, self._send_error(404, 'NoSuchKey', 'No such key')
+        event['visible_at'] = self.server.visible_at(key_name, stat)
+
+        size = stat.st_size
+        first, last = 0, size - 1
+        status = 200
+
+        byte_range = self.headers.get('range')
+        if byte_range:
+            match = RANGE_PATTERN.match(byte_range.strip())
+            if not match or not (match.group(1) or match.group(2)):
+                return 416, self._send_error(416, 'InvalidRange',
+                                             'Invalid range')
+            if match.group(1):
+                first = int(match.group(1))
+                if match.group(2):
+                    last = min(int(match.group(2)), size - 1)
+            else:
+                # the last n bytes
+                first = max(size - int(match.group(2)), 0)
+            if first > last:
+                return 416, self._send_error(416, 'InvalidRange',
+                                             'Range not satisfiable')
+            status = 206
+
+        self.send_response(status)
+        self.send_header('ETag', entity_tag(key_name, stat))
+        self.send_header('Last-Modified', http_date(stat.st_mtime))
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(last - first + 1))
+        if status == 206:
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (first, last, size))
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return status, 0
+
+        remaining = last - first + 1
+        with open(self.server.file_path(bucket_name, key_name), 'rb') as f:
+            f.seek(first)
+            while remaining:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+        return status, last - first + 1 - remaining
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--root', help='directory with a directory per bucket')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8000,
+                      help='port to listen on, 0 for any free one')
+    parser.add_option('--delay', type='float', default=0,
+                      help='seconds objects are delivered after the '
+                           'modification time of their file')
+    parser.add_option('--jitter', type='float', default=0,
+                      help='maximum seconds added to the delay per key')
+    parser.add_option('--events', help='file requests are recorded in')
+    parser.add_option('--verbose', action='store_true')
+    options, args = parser.parse_args()
+
+    if not options.root:
+        parser.error('--root is required')
+
+    server = S3StandIn((options.host, options.port), options.root,
+                       options.delay, options.jitter, options.events,
+                       options.verbose)
+    # the first line tells the port when it was picked by the system
+    print 'Serving %s on %s:%d' % ((server.root,) + server.server_address)
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
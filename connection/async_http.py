@@ -0,0 +1,438 @@
+"""
+Single threaded event loop for issuing many HTTP(S) requests concurrently.
+
+Python 2 has no asyncio, hence the loop is built on asyncore: every connection
+is a non-blocking socket multiplexed with select() and timers stand in for
+sleeping. Responses are handed over as they arrive, so bodies can be
+processed while they are being downloaded.
+"""
+import asyncore
+import collections
+import errno
+import heapq
+import itertools
+import socket
+import ssl
+import sys
+import time
+
+from etc.configuration import log, get_settings
+
+# bytes read from a socket at a time
+RECV_SIZE = 65536
+
+# upper bound of the time spent in select() so that timers stay accurate
+MAX_SELECT_TIMEOUT = 1.0
+
+
+class EventLoop(object):
+    """
+    Runs connections and timers until there is nothing left to wait for
+    """
+
+    def __init__(self):
+        # socket map of asyncore
+        self.map = dict()
+        self.timers = []
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, func, *args):
+        """
+        Call func with args after delay seconds
+        """
+        heapq.heappush(self.timers, (time.time() + max(0, delay),
+                                     next(self._sequence), func, args))
+
+    def _busy(self):
+        return any(not connection.idle for connection in self.map.values())
+
+    def _check_timeouts(self):
+        # seconds a busy connection may go without any traffic
+        timeout = get_settings().http_socket_timeout
+        now = time.time()
+        for connection in self.map.values():
+            if not connection.idle and \
+                    now - connection.last_activity > timeout:
+                connection.handle_timeout()
+
+    def run(self):
+        """
+        Run until no timer is pending and no connection is busy. Idle
+        connections are closed on return
+        """
+        try:
+            while self.timers or self._busy():
+                now = time.time()
+                while self.timers and self.timers[0][0] <= now:
+                    func, args = heapq.heappop(self.timers)[2:]
+                    try:
+                        func(*args)
+                    except Exception:
+                        # one failed callback must not stop the others
+                        log.exception('Callback %r failed' % func)
+
+                timeout = MAX_SELECT_TIMEOUT
+                if self.timers:
+                    timeout = min(timeout,
+                                  max(0, self.timers[0][0] - time.time()))
+
+                if self._busy():
+                    asyncore.loop(timeout=timeout, map=self.map, count=1)
+                    self._check_timeouts()
+                elif timeout:
+                    time.sleep(timeout)
+        finally:
+            for connection in self.map.values():
+                connection.close()
+
+
+class HTTPClientConnection(asyncore.dispatcher):
+    """
+    A non-blocking HTTP/1.1 connection that carries one request at a time
+    and is kept open between requests unless the server closes it
+    """
+
+    def __init__(self, client, host, port, is_secure):
+        asyncore.dispatcher.__init__(self, map=client.loop.map)
+        self.client = client
+        self.address = (host, port, is_secure)
+        self.is_secure = is_secure
+
+        self.idle = False
+        self.handshaking = False
+        self.want_write = False
+        self.reused = False
+        self.handler = None
+        self.request_data = None
+        self.last_activity = time.time()
+
+        self.out_buffer = ''
+        self.in_buffer = ''
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((host, port))
+
+    def start(self, request_data, handler):
+        """
+        :param request_data:    The request as it is sent
+        :param handler:         Object with on_response(status, reason,
+                                headers), on_data(data) and on_done(error)
+        """
+        self.idle = False
+        self.handler = handler
+        self.request_data = request_data
+        self.out_buffer = request_data
+        self.in_buffer = ''
+        self.last_activity = time.time()
+
+        self.response_started = False
+        self.phase = 'status'
+        self.status = None
+        self.reason = None
+        self.headers = dict()
+        self.remaining = None
+
+    # asyncore callbacks
+
+    def handle_connect(self):
+        if not self.is_secure:
+            return
+
+        context = ssl.create_default_context()
+        self.socket = context.wrap_socket(
+            self.socket, server_hostname=self.address[0],
+            do_handshake_on_connect=False)
+        self.handshaking = True
+        self._handshake()
+
+    def _handshake(self):
+        try:
+            self.socket.do_handshake()
+            self.handshaking = False
+            self.want_write = False
+        except ssl.SSLWantReadError:
+            self.want_write = False
+        except ssl.SSLWantWriteError:
+            self.want_write = True
+
+    def readable(self):
+        return not self.handshaking or not self.want_write
+
+    def writable(self):
+        if not self.connected:
+            return True
+        if self.handshaking:
+            return self.want_write
+        return bool(self.out_buffer)
+
+    def handle_write(self):
+        self.last_activity = time.time()
+        if self.handshaking:
+            self._handshake()
+            return
+
+        try:
+            sent = self.socket.send(self.out_buffer)
+        except ssl.SSLWantWriteError:
+            return
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        self.out_buffer = self.out_buffer[sent:]
+
+    def handle_read(self):
+        self.last_activity = time.time()
+        if self.handshaking:
+            self._handshake()
+            return
+
+        while True:
+            try:
+                data = self.socket.recv(RECV_SIZE)
+            except ssl.SSLWantReadError:
+                return
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+            if not data:
+                self.handle_close()
+                return
+
+            self._receive(data)
+            if not self.connected or not self.is_secure:
+                # plain sockets are read again once select() says so,
+                # ssl ones may hold decrypted data select() cannot see
+                return
+
+    def handle_close(self):
+        if self.handler and self.phase == 'body' and \
+                self.body_mode == 'close':
+            self._finish(None, keep_alive=False)
+        elif self.handler:
+            self._fail(IOError(errno.ECONNRESET, 'Connection closed by %s'
+                               % self.address[0]))
+        else:
+            self._discard()
+
+    def handle_error(self):
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error):
+            log.debug('HTTP connection to %s failed: %s'
+                      % (self.address[0], error))
+        else:
+            # raised while parsing the response or by on_response/on_data
+            log.exception('Response from %s could not be handled'
+                          % self.address[0])
+        self._fail(error)
+
+    def handle_timeout(self):
+        self._fail(socket.timeout('timed out'))
+
+    # response parsing
+
+    def _receive(self, data):
+        self.in_buffer += data
+        if self.handler:
+            self.response_started = True
+
+        while self.handler and self.in_buffer:
+            if self.phase == 'status' or self.phase == 'headers':
+                end = self.in_buffer.find('\r\n')
+                if end < 0:
+                    return
+                line = self.in_buffer[:end]
+                self.in_buffer = self.in_buffer[end + 2:]
+                self._header_line(line)
+
+            elif self.phase == 'body':
+                self._body()
+
+            elif self.phase == 'chunk_size':
+                end = self.in_buffer.find('\r\n')
+                if end < 0:
+                    return
+                size = int(self.in_buffer[:end].split(';')[0], 16)
+                self.in_buffer = self.in_buffer[end + 2:]
+                if size:
+                    self.remaining = size
+                    self.phase = 'chunk'
+                else:
+                    self.phase = 'trailer'
+
+            elif self.phase == 'chunk':
+                data = self.in_buffer[:self.remaining]
+                self.in_buffer = self.in_buffer[len(data):]
+                self.remaining -= len(data)
+                self.handler.on_data(data)
+                if not self.remaining:
+                    self.phase = 'chunk_end'
+
+            elif self.phase == 'chunk_end':
+                if len(self.in_buffer) < 2:
+                    return
+                self.in_buffer = self.in_buffer[2:]
+                self.phase = 'chunk_size'
+
+            elif self.phase == 'trailer':
+                end = self.in_buffer.find('\r\n')
+                if end < 0:
+                    return
+                self.in_buffer = self.in_buffer[end + 2:]
+                if not end:
+                    self._finish(None)
+
+    def _header_line(self, line):
+        if self.phase == 'status':
+            version, status, reason = (line.split(' ', 2) + [''])[:3]
+            self.status = int(status)
+            self.reason = reason
+            self.phase = 'headers'
+            return
+
+        if line:
+            name, value = line.split(':', 1)
+            self.headers[name.strip().lower()] = value.strip()
+            return
+
+        # end of headers
+        if self.status == 100:
+            self.phase = 'status'
+            self.headers = dict()
+            return
+
+        self.handler.on_response(self.status, self.reason, self.headers)
+
+        if self.handler.method == 'HEAD' or self.status in (204, 304):
+            self._finish(None)
+        elif 'chunked' in self.headers.get('transfer-encoding', ''):
+            self.phase = 'chunk_size'
+        elif 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+            self.body_mode = 'length'
+            self.phase = 'body'
+            if not self.remaining:
+                self._finish(None)
+        else:
+            self.body_mode = 'close'
+            self.phase = 'body'
+
+    def _body(self):
+        data = self.in_buffer
+        if self.body_mode == 'length':
+            data = data[:self.remaining]
+            self.remaining -= len(data)
+
+        self.in_buffer = self.in_buffer[len(data):]
+        self.handler.on_data(data)
+
+        if self.body_mode == 'length' and not self.remaining:
+            self._finish(None)
+
+    def _finish(self, error, keep_alive=True):
+        handler = self.handler
+        self.handler = None
+
+        keep_alive = keep_alive and error is None and \
+            self.headers.get('connection', '').lower() != 'close'
+        if keep_alive:
+            self.idle = True
+            self.reused = True
+        else:
+            self._discard()
+
+        self.client.release(self, handler, error)
+
+    def _fail(self, error):
+        self._discard()
+        if self.handler:
+            handler = self.handler
+            self.handler = None
+            # a kept open connection may have been closed by the server
+            # while it was idle, the request is worth another try then
+            retry = self.reused and not self.response_started
+            self.client.release(self, handler, error, retry=retry)
+
+    def _discard(self):
+        self.idle = False
+        self.close()
+        self.client.forget(self)
+
+
+class HTTPClient(object):
+    """
+    Issues requests on an EventLoop with at most max_concurrency of them in
+    flight, reusing connections to the same host
+    """
+
+    def __init__(self, loop, max_concurrency):
+        """
+        :param loop:            The EventLoop
+        :param max_concurrency: Maximum number of requests in flight
+        """
+        self.loop = loop
+        self.max_concurrency = max(1, max_concurrency)
+        self.in_flight = 0
+        self.pending = collections.deque()
+        # idle connections by (host, port, is_secure)
+        self.idle = collections.defaultdict(list)
+
+    def request(self, host, port, is_secure, request_data, handler):
+        """
+        Queue a request
+
+        :param request_data:    The request as it is sent
+        :param handler:         Object with a method attribute and
+                                on_response(status, reason, headers),
+                                on_data(data) and on_done(error), called as
+                                the response arrives
+        """
+        self.pending.append(((host, port, is_secure), request_data, handler))
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.pending and self.in_flight < self.max_concurrency:
+            address, request_data, handler = self.pending.popleft()
+
+            connections = self.idle[address]
+            if connections:
+                connection = connections.pop()
+            else:
+                try:
+                    connection = HTTPClientConnection(self, *address)
+                except socket.error, e:
+                    self.loop.call_later(0, handler.on_done, e)
+                    continue
+
+            self.in_flight += 1
+            connection.start(request_data, handler)
+
+    def release(self, connection, handler, error, retry=False):
+        """
+        Called by connections once their request is done
+        """
+        self.in_flight -= 1
+
+        if connection.idle:
+            self.idle[connection.address].append(connection)
+
+        if retry:
+            self.pending.appendleft((connection.address,
+                                     connection.request_data, handler))
+        else:
+            # on_done runs from the event loop rather than from within
+            # the connection, see EventLoop.run
+            self.loop.call_later(0, handler.on_done, error)
+
+        self._dispatch()
+
+    def forget(self, connection):
+        """
+        Called by connections once they are closed
+        """
+        connections = self.idle.get(connection.address)
+        if connections and connection in connections:
+            connections.remove(connection)
+
@@ -0,0 +1,223 @@
+"""
+S3 requests issued on an EventLoop rather than on blocking httplib
+connections.
+
+Requests are built and signed like those of S3Connection. Results are handed
+to callbacks as callback(result, error) where error is None on success.
+"""
+import random
+import urllib
+
+from action.s3.bucket import new_list_page_parser
+from action.s3.key import Key
+from connection.async_http import HTTPClient
+from connection.aws_http_connection import PORTS
+from connection.s3_connection import S3Connection
+from etc.configuration import cfg, log, get_settings
+from utilities import utils
+from utilities.exception import UnsuccessfulRequestError
+
+# maximum number of S3 requests in flight over all buckets
+max_concurrent_requests = cfg.get_int('s3', 'max_concurrent_requests', 32)
+
+
+class AsyncResponse(object):
+    """
+    Status, headers and, unless it was streamed, body of a response
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class _S3RequestHandler(object):
+    """
+    Receives the response of a request and retries the request on server
+    errors the way AWSHTTPConnection._make_request does
+    """
+
+    def __init__(self, connection, method, request_args, on_data, callback):
+        self.connection = connection
+        self.method = method
+        self.request_args = request_args
+        self.on_data_callback = on_data
+        self.callback = callback
+        self.attempt = 0
+
+        # the same settings for all attempts, even if reloaded meanwhile
+        self.settings = get_settings()
+
+    def send(self):
+        self.status = None
+        self.reason = None
+        self.headers = dict()
+        self.body = []
+        self.streamed = False
+
+        request = self.connection.build_request(self.method,
+                                                *self.request_args)
+        # signed for every attempt since the signature covers the date
+        request.authorize(connection=self.connection)
+        # httplib adds the host header itself
+        if not utils.find_matching_headers('host', request.headers):
+            host = request.host
+            if request.port != PORTS[self.connection.is_secure]:
+                host = '%s:%d' % (host, request.port)
+            request.headers['Host'] = host
+
+        lines = ['%s %s HTTP/1.1' % (request.method, request.path)]
+        for name, value in request.headers.iteritems():
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            lines.append('%s: %s' % (name, value))
+        request_data = '\r\n'.join(lines) + '\r\n\r\n' + (request.body or '')
+
+        self.connection.http_client.request(request.host, request.port,
+                                            self.connection.is_secure,
+                                            request_data, self)
+
+    def on_response(self, status, reason, headers):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+    def on_data(self, data):
+        if self.on_data_callback and 200 <= self.status < 300:
+            self.streamed = True
+            self.on_data_callback(data)
+        else:
+            self.body.append(data)
+
+    def on_done(self, error):
+        body = ''.join(self.body)
+        retriable = error is not None or self.status in [500, 502, 503, 504]
+
+        # a streamed body cannot be taken back, hence not retried
+        if retriable and not self.streamed and \
+                self.attempt < self.settings.num_retries:
+            # binary exponential back-off to avoid traffic congestion
+            wait_time = min(random.random() * (2 ** self.attempt),
+                            self.settings.max_retry_delay)
+            log.debug('S3 %s request failed (%s), re-attempting in %3.1f '
+                      'seconds' % (self.method, error or self.status,
+                                   wait_time))
+            self.attempt += 1
+            self.connection.loop.call_later(wait_time, self.send)
+            return
+
+        if error is None and self.status >= 300 and \
+                not (self.method == 'HEAD' and self.status == 404):
+            error = UnsuccessfulRequestError(self.status, self.reason, body)
+
+        if error is not None:
+            self.callback(None, error)
+        else:
+            self.callback(AsyncResponse(self.status, self.reason,
+                                        self.headers, body), None)
+
+
+class AsyncS3Connection(S3Connection):
+    """
+    S3Connection whose requests run concurrently on an EventLoop, with at most
+    max_concurrency of them in flight
+    """
+
+    def __init__(self, loop, max_concurrency=max_concurrent_requests,
+                 **kwargs):
+        """
+        :param loop:            The EventLoop requests run on
+        :param max_concurrency: Maximum number of requests in flight
+        :param kwargs:          Arguments of S3Connection
+        """
+        super(AsyncS3Connection, self).__init__(**kwargs)
+        self.loop = loop
+        self.http_client = HTTPClient(loop, max_concurrency)
+
+    def request(self, method, bucket='', key='', headers=None,
+                query_args=None, on_data=None, callback=None):
+        """
+        Queue a request
+
+        :param on_data:     Called with each piece of a successful response
+                            body as it arrives, the body is kept in the
+                            response otherwise
+        :param callback:    Called as callback(AsyncResponse, error) once the
+                            response is complete
+        """
+        _S3RequestHandler(self, method, (bucket, key, headers, query_args),
+                          on_data, callback).send()
+
+    def list_keys(self, bucket_name, parameters, callback):
+        """
+        List bucket keys page by page like Bucket.list_keys
+
+        :param callback:    Called as callback(matching keys, error)
+        """
+        parameters = dict(parameters)
+        matching_keys = []
+        # pages are parsed as they arrive
+        parsers = []
+
+        def on_page(response, error):
+            if error is not None:
+                callback(None, error)
+                return
+
+            page_keys, next_marker = parsers.pop().close()
+            matching_keys.extend(page_keys)
+
+            if next_marker:
+                parameters['marker'] = next_marker
+                list_page()
+            else:
+                callback(matching_keys, None)
+
+        def list_page():
+            query_args = '&'.join('%s=%s' % (k, urllib.quote(v))
+                                  for k, v in parameters.iteritems()) or None
+            parsers.append(new_list_page_parser())
+            self.request('GET', bucket_name, query_args=query_args,
+                         on_data=parsers[-1].feed, callback=on_page)
+
+        list_page()
+
+    def get_key(self, bucket, key_name, callback):
+        """
+        Get the metadata of a key with a HEAD request like Bucket.get_key
+
+        :param bucket:      The Bucket of the key
+        :param callback:    Called as callback(Key, error), Key is None if
+                            the key does not exist
+        """
+        def on_head(response, error):
+            if error is not None or response.status == 404:
+                callback(None, error)
+                return
+
+            k = Key(bucket, key_name)
+            k.entity_tag = response.getheader('etag')
+            k.content_type = response.getheader('content-type')
+            k.last_modified = response.getheader('last-modified')
+            k.size = int(response.getheader('content-length') or 0)
+            callback(k, None)
+
+        self.request('HEAD', bucket.name, key_name, callback=on_head)
+
+    def get_contents(self, key, on_data, callback):
+        """
+        Download the content of a key
+
+        :param on_data:     Called with each piece of the content as it
+                            arrives
+        :param callback:    Called as callback(AsyncResponse, error) once the
+                            content is complete
+        """
+        self.request('GET', key.bucket.name, key.name, on_data=on_data,
+                     callback=callback)
+
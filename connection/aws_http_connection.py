@@ -1,4 +1,5 @@
 from __future__ import with_statement
+import functools
 import httplib
 import random
 import socket
@@ -7,7 +8,8 @@ import time
 from datetime import datetime
 
 from connection.Authentication import auth
-from etc.configuration import cfg, log
+from connection.connection_pool import get_connection_pool
+from etc.configuration import cfg, log, get_settings
 from connection.http_communication import HTTPRequest, HTTPResponse
 from models.xml_classes.xml_class import NoXMLBindingAvailableError
 from models.xml_classes.xml_class_selector import get_xml_class
@@ -33,9 +35,6 @@ class AWSHTTPConnection(object):
         self.access_key = cfg.get('Default', 'AWS_ACCESS_KEY')
         self.secret_key = cfg.get('Default', 'AWS_SECRET_KEY')
 
-        # default number of retries value
-        self.num_retries = 6
-
         self.is_secure = is_secure
 
         if port:
@@ -63,11 +62,15 @@ class AWSHTTPConnection(object):
         # Set default socket time out as suggested:
         # http://docs.aws.amazon.com/amazonswf/latest/apireference/
         # API_PollForActivityTask.html
-        self.http_connection_kwargs = {'timeout': cfg.get_int(
-            'HTTPConnection', 'http_socket_timeout', 70)}
+        self.http_connection_kwargs = {
+            'timeout': get_settings().http_socket_timeout}
 
         self._connection = (self.host, self.port, self.is_secure)
 
+        # whether connections are kept open in the shared pool between
+        # requests
+        self.keep_alive = get_settings().keep_alive
+
         self.auth_handler = auth.get_auth_handler(
             host, cfg, self._target_aws_service())
 
@@ -87,7 +90,11 @@ class AWSHTTPConnection(object):
         # Connection factories below expect a port keyword argument
         http_connection_kwargs['port'] = port
 
-        connection = httplib.HTTPSConnection(host, **http_connection_kwargs)
+        if self.is_secure:
+            connection = httplib.HTTPSConnection(host,
+                                                 **http_connection_kwargs)
+        else:
+            connection = httplib.HTTPConnection(host, **http_connection_kwargs)
 
         if self.debug > 1:
             connection.set_debuglevel(self.debug)
@@ -97,6 +104,27 @@ class AWSHTTPConnection(object):
         connection.response_class = HTTPResponse
         return connection
 
+    def get_http_connection(self, host, port):
+        """
+        :return: An idle connection to host and port from the pool, a new
+                 connection if there is none
+        """
+        connection = None
+        if self.keep_alive:
+            connection = get_connection_pool().get(host, port, self.is_secure)
+
+        return connection or self.new_http_connection(host, port)
+
+    def release_http_connection(self, host, port, connection, reusable):
+        """
+        Put a connection whose response is done with back in the pool, close
+        it if it cannot carry another request
+        """
+        if self.keep_alive and reusable:
+            get_connection_pool().put(host, port, self.is_secure, connection)
+        else:
+            connection.close()
+
     def set_host_header(self, request):
         try:
             request.headers['Host'] = \
@@ -114,16 +142,16 @@ class AWSHTTPConnection(object):
         body = None
         e = None   # exception to raise if any "unretriable"
 
-        num_retries = cfg.get_int('HTTPConnection', 'num_retries',
-                                  self.num_retries)
+        # the same settings for all attempts, even if reloaded meanwhile
+        settings = get_settings()
 
-        connection = self.new_http_connection(request.host, request.port)
         counter = 0
-        while counter <= num_retries:
+        while counter <= settings.num_retries:
             # Use binary exponential back-off to avoid traffic congestion
-            max_retry_delay = cfg.get('HTTPConnection', 'max_retry_delay', 60)
-            wait_time = min(random.random() * (2 ** counter), max_retry_delay)
+            wait_time = min(random.random() * (2 ** counter),
+                            settings.max_retry_delay)
 
+            connection = self.get_http_connection(request.host, request.port)
             try:
                 # sign the request with AWS access key
                 request.authorize(connection=self)
@@ -136,6 +164,11 @@ class AWSHTTPConnection(object):
                 connection.request(request.method, request.path,
                                    request.body, request.headers)
                 response = connection.getresponse()
+                # the connection goes back to the pool once the response has
+                # been read to the end
+                response.release = functools.partial(
+                    self.release_http_connection, request.host, request.port,
+                    connection)
 
                 location = response.getheader('location')
 
@@ -162,24 +195,16 @@ class AWSHTTPConnection(object):
 
                 elif response.status < 300 or response.status >= 400 or \
                         not location:
-                    # close the connection if it is set
-                    # to be closed by the other end
-                    conn_header_value = response.getheader('connection')
-                    if conn_header_value == 'close':
-                        connection.close()
-
                     return response
 
             except PleaseRetryException, e:
                 log.debug('encountered a retry exception: %s' % e)
-                connection = self.new_http_connection(request.host,
-                                                      request.port)
+                connection.close()
                 response = e.response
             except self.http_exceptions, e:
                 log.debug('encountered %s exception, reconnecting'
                           % e.__class__.__name__)
-                connection = self.new_http_connection(request.host,
-                                                      request.port)
+                connection.close()
             time.sleep(wait_time)
             counter += 1
 
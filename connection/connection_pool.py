@@ -0,0 +1,127 @@
+"""
+Pool of idle keep-alive httplib connections shared by all AWSHTTPConnection
+objects and threads.
+
+A connection is taken out of the pool for a request and put back once its
+response has been read to the end, so that the next request to the same
+host skips the TCP and TLS handshakes. Connections idle for longer than
+idle_timeout, or found closed by the server when they are taken, are
+dropped.
+"""
+import collections
+import select
+import threading
+import time
+
+from etc.configuration import get_settings
+
+
+def is_connection_usable(connection):
+    """
+    :return: Whether an idle httplib connection can carry another request.
+             An idle connection that is readable has either been closed by
+             the server or got data no request asked for
+    """
+    sock = connection.sock
+    if sock is None:
+        return False
+
+    try:
+        readable, writable, failed = select.select([sock], [], [sock], 0)
+    except (select.error, ValueError, TypeError):
+        return False
+    return not readable and not failed
+
+
+class HTTPConnectionPool(object):
+    """
+    Idle connections by (host, port, is_secure), safe to use from many
+    threads
+    """
+
+    def __init__(self, max_size=None, idle_timeout=None):
+        """
+        :param max_size:        Maximum number of idle connections kept per
+                                (host, port, is_secure), [HTTPConnection]
+                                pool_size by default
+        :param idle_timeout:    Seconds an idle connection is kept,
+                                [HTTPConnection] pool_idle_timeout by default.
+                                Servers close them after a while
+        """
+        settings = get_settings()
+        self.max_size = max_size or settings.pool_size
+        self.idle_timeout = idle_timeout or settings.pool_idle_timeout
+        self.lock = threading.Lock()
+        # (connection, time it was put back) by (host, port, is_secure),
+        # most recently used last
+        self.idle = collections.defaultdict(list)
+
+    def get(self, host, port, is_secure):
+        """
+        :return: An idle connection to host and port that passes the health
+                 check, None if there is none
+        """
+        key = (host, port, is_secure)
+        while True:
+            with self.lock:
+                connections = self.idle.get(key)
+                if not connections:
+                    return None
+                connection, released = connections.pop()
+
+            if time.time() - released <= self.idle_timeout and \
+                    is_connection_usable(connection):
+                return connection
+            connection.close()
+
+    def put(self, host, port, is_secure, connection):
+        """
+        Keep a connection whose last response has been read to the end
+        """
+        key = (host, port, is_secure)
+        now = time.time()
+        expired = []
+
+        with self.lock:
+            connections = self.idle[key]
+            # connections are put back in time order, so expired ones are
+            # at the front
+            while connections and \
+                    now - connections[0][1] > self.idle_timeout:
+                expired.append(connections.pop(0)[0])
+
+            if len(connections) < self.max_size:
+                connections.append((connection, now))
+            else:
+                expired.append(connection)
+
+        for connection in expired:
+            connection.close()
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            connections = [connection for pooled in self.idle.values()
+                           for connection, released in pooled]
+            self.idle.clear()
+
+        for connection in connections:
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    :return: The pool shared by all connections
+    """
+    global _pool
+
+    with _pool_lock:
+        if not _pool:
+            _pool = HTTPConnectionPool()
+        return _pool
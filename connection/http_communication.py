@@ -1,6 +1,12 @@
+import errno
+import functools
 import httplib
+import socket
 import urllib
 
+# bytes read at a time when a response body is streamed
+STREAM_CHUNK_SIZE = 65536
+
 
 class HTTPRequest(object):
     def __init__(self, method, protocol, host, port, path, auth_path,
@@ -69,11 +75,20 @@ class HTTPResponse(httplib.HTTPResponse):
         httplib.HTTPResponse.__init__(self, *args, **kwargs)
         self._cached_response = ''
 
+        # whether the body read in full is kept so that read() returns it
+        # again, off by default since bodies can be large
+        self.cache_body = False
+
+        # called as release(reusable) once the response is done with,
+        # reusable tells whether its connection can carry another request
+        self.release = None
+        self._reading = False
+
     def read(self, buffer_size=None):
         """ Wrapper over httplib.HTTPResponse.read.
 
-        If no buffer size specified it will return cached response from the
-        first reading of this httplib.HTTPResponse
+        If no buffer size specified it will return the rest of the body. With
+        cache_body set it is kept and returned again by later reads
 
         if buffer size specified, response will be read buffer_size by
         buffer_size
@@ -81,8 +96,106 @@ class HTTPResponse(httplib.HTTPResponse):
         """
         if buffer_size is None:
 
-            if not self._cached_response:
-                self._cached_response = httplib.HTTPResponse.read(self)
-            return self._cached_response
+            if self._cached_response:
+                return self._cached_response
+
+            body = self._read()
+            if self.cache_body:
+                self._cached_response = body
+            return body
         else:
-            return httplib.HTTPResponse.read(self, buffer_size)
\ No newline at end of file
+            return self._read(buffer_size)
+
+    def iter_content(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        :param chunk_size:  Maximum size of pieces
+        :return:            Pieces of the body as they are read
+        """
+        while True:
+            data = self._read(chunk_size)
+            if not data:
+                return
+            yield data
+
+    def readinto(self, buffer):
+        """
+        Read the next piece of the body into a buffer, which can be reused
+        for every piece instead of getting a new string each time
+
+        :param buffer:  bytearray or writable memoryview
+        :return:        Number of bytes read into the start of buffer, 0 at
+                        the end of the body
+        """
+        if self._receives_into():
+            view = memoryview(buffer)[:self.length]
+            return self._reading_body(self._recv_into, view)
+
+        # chunked bodies and bytes httplib has read ahead already are copied
+        data = self._read(len(buffer))
+        memoryview(buffer)[:len(data)] = data
+        return len(data)
+
+    def _receives_into(self):
+        """
+        Whether the rest of the body can be received straight from the
+        socket, i.e. it is the given number of bytes after the headers
+        """
+        if self.fp is None or self.chunked or not self.length or \
+                self._method == 'HEAD':
+            return False
+
+        read_ahead = getattr(self.fp, '_rbuf', None)
+        if read_ahead is None or not hasattr(self.fp, '_sock'):
+            return False
+        read_ahead.seek(0, 2)
+        return not read_ahead.tell()
+
+    def _recv_into(self, view):
+        # the counterpart of httplib.HTTPResponse.read for a given amount
+        while True:
+            try:
+                received = self.fp._sock.recv_into(view, len(view))
+                break
+            except socket.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+        if not received:
+            # ended before its length, like httplib the response is closed
+            self.close()
+            return 0
+
+        self.length -= received
+        if not self.length:
+            self.close()
+        return received
+
+    def _read(self, *args):
+        return self._reading_body(
+            functools.partial(httplib.HTTPResponse.read, self), *args)
+
+    def _reading_body(self, read, *args):
+        self._reading = True
+        try:
+            result = read(*args)
+        except:
+            self._reading = False
+            self._release(False)
+            raise
+        self._reading = False
+
+        # httplib closes the response once its end has been read
+        if self.isclosed():
+            self._release(not self.will_close)
+        return result
+
+    def close(self):
+        httplib.HTTPResponse.close(self)
+        if not self._reading:
+            # closed before its end, the rest of it is still on the way
+            self._release(False)
+
+    def _release(self, reusable):
+        release, self.release = self.release, None
+        if release:
+            release(reusable)
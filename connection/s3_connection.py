@@ -3,7 +3,7 @@ import urllib
 from action.s3.bucket import Bucket
 from action.s3.key import Key
 from connection.aws_http_connection import AWSHTTPConnection
-from etc.configuration import log
+from etc.configuration import cfg, log
 from utilities import utils
 from utilities.exception import ServerError, ClientError, \
     GeneralError
@@ -42,11 +42,26 @@ def compose_path_base(key=''):
 class S3Connection(AWSHTTPConnection):
     DefaultHost = 's3.amazonaws.com'
 
-    def __init__(self, is_secure=True, port=None, host=None, anon=False):
+    def __init__(self, is_secure=None, port=None, host=None, anon=False,
+                 path_style=None):
+        """
+        Arguments left out are read from the [s3] section of the
+        configuration, which points at AWS by default
+
+        :param path_style:  Whether the bucket name is put in the path of
+                            requests rather than in the host name
+        """
+        if is_secure is None:
+            is_secure = cfg.get_bool('s3', 'is_secure', True)
+        if not port:
+            port = cfg.get_int('s3', 'port', 0) or None
         if not host:
-            host = self.DefaultHost
+            host = cfg.get('s3', 'host') or self.DefaultHost
+        if path_style is None:
+            path_style = cfg.get_bool('s3', 'path_style', False)
 
         self.anon = anon
+        self.path_style = path_style
         super(S3Connection, self).__init__(host, is_secure, port)
 
     def _target_aws_service(self):
@@ -77,9 +92,9 @@ class S3Connection(AWSHTTPConnection):
         else:
             raise GeneralError(msg=response.reason)
 
-    def make_request(self, method, bucket='', key='', headers=None,
-                     query_args=None, response_class=None):
-        """Build S3 specific HTTP URL with query parameters
+    def compose_request_path(self, bucket='', key='', query_args=None):
+        """
+        :return: (path, auth_path, host) of a request to the bucket key
         """
 
         # use key and bucket name to build query arguments.
@@ -95,7 +110,11 @@ class S3Connection(AWSHTTPConnection):
         auth_path = compose_auth_path(bucket, key)
         log.debug('auth_path=%s' % auth_path)
 
-        host = compose_host_str(self.host, bucket)
+        if self.path_style:
+            path = auth_path
+            host = self.host
+        else:
+            host = compose_host_str(self.host, bucket)
 
         if query_args:
             path += '?' + query_args
@@ -103,6 +122,26 @@ class S3Connection(AWSHTTPConnection):
             auth_path += '?' + query_args
             log.debug('auth_path=%s' % auth_path)
 
+        return path, auth_path, host
+
+    def build_request(self, method, bucket='', key='', headers=None,
+                      query_args=None):
+        """
+        Build the HTTP request of make_request without sending it. It still
+        has to be signed with request.authorize(connection=self)
+        """
+        path, auth_path, host = self.compose_request_path(bucket, key,
+                                                          query_args)
+        return self.build_base_http_request(method, path, auth_path,
+                                            headers=headers, host=host)
+
+    def make_request(self, method, bucket='', key='', headers=None,
+                     query_args=None, response_class=None):
+        """Build S3 specific HTTP URL with query parameters
+        """
+        path, auth_path, host = self.compose_request_path(bucket, key,
+                                                          query_args)
+
         para = {'method': method,
                 'path': path,
                 'host': host,
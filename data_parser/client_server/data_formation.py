@@ -20,7 +20,64 @@ def remove_data(data, category_list, delete):
     return data, category_list, delete
 
 
-def format_data(data, period, category_list, cpu_file):
+def read_cpu_file(cpu_file):
+    """
+    Read CPU utilisation and timestamps stored on alternating lines
+
+    :return: (cpu utilisation, timestamps) without invalid readings
+    """
+    with open(cpu_file) as f:
+        count = 0
+        cpu = []
+        cpu_time = []
+        flag = 0
+        line = f.readline()
+        while line:
+            cpu_num = float(line)
+
+            if count % 2 == 0:
+                if cpu_num > 1 or math.isnan(cpu_num):
+                    flag = 1
+                else:
+                    cpu.append(cpu_num)
+            else:
+                if flag:
+                    flag = 0
+                else:
+                    cpu_time.append(cpu_num)
+
+            count += 1
+            line = f.readline()
+
+    return cpu, cpu_time
+
+
+def filter_cpu_samples(values, timestamps):
+    """
+    Same as read_cpu_file for readings already in memory
+
+    :return: (cpu utilisation, timestamps) without invalid readings
+    """
+    cpu = []
+    cpu_time = []
+    for cpu_num, timestamp in zip(values, timestamps):
+        if cpu_num > 1 or math.isnan(cpu_num):
+            continue
+        cpu.append(cpu_num)
+        cpu_time.append(timestamp)
+
+    return cpu, cpu_time
+
+
+def format_data(data, period, category_list, cpu_file=None, cpu_samples=None):
+    """
+    :param data:            raw cell matrix of requests
+    :param period:          sampling interval in milliseconds
+    :param category_list:   categories of requests
+    :param cpu_file:        file of CPU utilisation readings
+    :param cpu_samples:     (cpu utilisation, timestamps) used instead of
+                            reading cpu_file
+    """
     metric_list = ['addtocartbulk', 'checkLogin', 'checkoutoptions', 'login',
                    'logout', 'main', 'orderhistory', 'quickadd']
     delete = []
@@ -99,28 +156,9 @@ def format_data(data, period, category_list, cpu_file):
 
     data[0][len(data[0]) - 1] = data[0][0]
 
-    with open(cpu_file) as f:
-        count = 0
-        cpu = []
-        cpu_time = []
-        flag = 0
-        line = f.readline()
-        while line:
-            cpu_num = float(line)
-
-            if count % 2 == 0:
-                if cpu_num > 1 or math.isnan(cpu_num):
-                    flag = 1
-                else:
-                    cpu.append(cpu_num)
-            else:
-                if flag:
-                    flag = 0
-                else:
-                    cpu_time.append(cpu_num)
-
-            count += 1
-            line = f.readline()
+    if cpu_samples is None:
+        cpu_samples = read_cpu_file(cpu_file)
+    cpu, cpu_time = cpu_samples
 
     cpu_time = [e - 3600 * 1000 for e in cpu_time]
     indices = [i[0] for i in sorted(enumerate(cpu_time), key=lambda x: x[1])]
@@ -1,12 +1,21 @@
 from __future__ import division
 import os
+import Queue
+from array import array
 from time import mktime
 import time
 
-from datetime import datetime
+import numpy
 
-from data_parser.client_server.data_formation import format_data
+from data_parser.client_server.data_formation import format_data, \
+    filter_cpu_samples
+from data_parser.client_server.observer_agent import unpack_samples
+from data_parser.client_server.observer_records import parse_response_info
+from etc.configuration import cfg
+from utilities.mapped_file import iter_line_blocks, find_all, \
+    locate_separators, field_bounds, gather
 from utilities.multi_threading import ThreadingManager
+from utilities.process_pool import get_process_pool
 from utilities.utils import print_message
 
 
@@ -34,111 +43,469 @@ def update_data_array(data, x, y, value):
     return data
 
 
-def _generate_data(base_path, queue):
+class ResponseInfoCheckpoint(object):
+    """
+    Position reached in a single ResponseInfo file together with everything
+    parsed from it so far
+    """
+
+    def __init__(self):
+        # byte offset of the first line that has not been parsed yet. It
+        # always points to a value line, never a timestamp line
+        self.offset = 0
+        self.category_map = dict()
+        self.category_list = []
+        # arrival and response times of each category
+        self.arrivals = []
+        self.responses = []
+
+    def category_index(self, category_str):
+        if category_str not in self.category_map:
+            self.category_map[category_str] = len(self.category_list)
+            self.category_list.append(category_str)
+            self.arrivals.append(array('d'))
+            self.responses.append(array('d'))
+
+        return self.category_map[category_str]
+
+    def add_record(self, record):
+        """
+        Add a record returned by parse_response_info
+        """
+        category_str, status, arrival_time, response_time = record
+        category = self.category_index(category_str)
+
+        if status != 'Request Begun':
+            self.arrivals[category].append(arrival_time)
+            self.responses[category].append(response_time)
+
+    def __getstate__(self):
+        # pickle arrays as raw bytes when shipped between processes
+        pickled_dict = self.__dict__.copy()
+        pickled_dict['arrivals'] = [a.tostring() for a in self.arrivals]
+        pickled_dict['responses'] = [r.tostring() for r in self.responses]
+        return pickled_dict
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.arrivals = [array('d', a) for a in state['arrivals']]
+        self.responses = [array('d', r) for r in state['responses']]
+
+
+def _add_bulk_records(block, starts, ends, checkpoint):
+    """
+    Parse the ResponseInfo values found between starts and ends of the block
+    column by column with numpy and add them to the checkpoint
+
+    Raises ValueError if any of the numeric fields is malformed
+    """
+    commas = find_all(block, ',')
+    first, count = locate_separators(commas, starts, ends)
+
+    # same as the 10 fields required by parse_response_info
+    keep = count >= 9
+    starts, ends, first, count = \
+        starts[keep], ends[keep], first[keep], count[keep]
+    if not len(starts):
+        return
+
+    def column(k):
+        return gather(block, *field_bounds(commas, first, count, starts,
+                                           ends, k))
+
+    # register categories in the order they first appear
+    names, first_seen, inverse = numpy.unique(column(8), return_index=True,
+                                              return_inverse=True)
+    codes = numpy.empty(len(names), dtype=int)
+    for i in numpy.argsort(first_seen, kind='mergesort'):
+        codes[i] = checkpoint.category_index(str(names[i]))
+    categories = codes[inverse]
+
+    done = (column(9) != 'Request Begun') & (count >= 10)
+    starts, ends, first, count, categories = \
+        starts[done], ends[done], first[done], count[done], categories[done]
+    if not len(starts):
+        return
+
+    year, month, day, hour, minute, second = \
+        [column(k).astype(numpy.int64) for k in xrange(6)]
+
+    # milliseconds are parsed as fraction of second like strptime %f does
+    ms_starts, ms_ends = field_bounds(commas, first, count, starts, ends, 6)
+    digits = ms_ends - ms_starts
+    if digits.min() < 1 or digits.max() > 6:
+        raise ValueError('malformed fraction of second')
+    microsecond = gather(block, ms_starts, ms_ends).astype(numpy.int64) * \
+        10 ** (6 - digits)
+
+    # mktime is only called once per distinct hour
+    hours = ((year * 100 + month) * 100 + day) * 100 + hour
+    unique_hours, hour_idx = numpy.unique(hours, return_inverse=True)
+    hour_base = numpy.array([mktime((int(h // 1000000), int(h // 10000 % 100),
+                                     int(h // 100 % 100), int(h % 100),
+                                     0, 0, 0, 0, -1))
+                             for h in unique_hours])
+
+    date_milli = (hour_base[hour_idx] + minute * 60 + second) * 1e3 + \
+        microsecond / 1e3
+
+    response_time = column(10).astype(float)
+    arrival_time = date_milli - response_time * 1000
+
+    for category in numpy.unique(categories):
+        in_category = categories == category
+        checkpoint.arrivals[category].fromstring(
+            arrival_time[in_category].tostring())
+        checkpoint.responses[category].fromstring(
+            response_time[in_category].tostring())
+
+
+class ResponseInfoStream(object):
+    """
+    Resumable reader of ResponseInfo files. Every file remembers the byte
+    offset and category map it reached so that re-polling a growing file
+    only parses records appended since the last call
+    """
+
+    def __init__(self, use_mmap=None):
+        self.checkpoints = dict()
+
+        if use_mmap is None:
+            use_mmap = cfg.get_bool('MonitorLog', 'use_mmap')
+        self.use_mmap = use_mmap
+
+    def checkpoint(self, response_file):
+        return self.checkpoints.setdefault(response_file,
+                                           ResponseInfoCheckpoint())
+
+    def records(self, response_file):
+        """
+        Generator of the records appended to the file since the last call
+
+        Metric values and timestamps are stored on alternating lines. Only
+        complete pairs of lines are consumed, a pair that is still being
+        written will be picked up by the next call
+
+        :param response_file:   Path of the ResponseInfo file
+        :return:                (category index, arrival time, response time)
+        """
+        checkpoint = self.checkpoint(response_file)
+
+        with open(response_file) as f:
+            f.seek(checkpoint.offset)
+
+            while True:
+                value_line = f.readline()
+                timestamp_line = f.readline()
+
+                if not timestamp_line.endswith('\n'):
+                    break
+
+                checkpoint.offset = f.tell()
+
+                record = parse_response_info(value_line)
+                if not record:
+                    continue
+
+                category_str, status, arrival_time, response_time = record
+                category = checkpoint.category_index(category_str)
+
+                if status == 'Request Begun':
+                    continue
+
+                yield category, arrival_time, response_time
+
+    def update(self, response_file):
+        """
+        Parse records appended to the file since the last call and add them
+        to the ones parsed before
+
+        :param response_file:   Path of the ResponseInfo file
+        :return:                The checkpoint of the file
+        """
+        checkpoint = self.checkpoint(response_file)
+
+        if self.use_mmap:
+            self._update_from_mmap(response_file, checkpoint)
+            return checkpoint
+
+        for category, arrival_time, response_time in \
+                self.records(response_file):
+            checkpoint.arrivals[category].append(arrival_time)
+            checkpoint.responses[category].append(response_time)
+
+        return checkpoint
+
+    @staticmethod
+    def _update_from_mmap(response_file, checkpoint):
+        """
+        Bulk parse complete value and timestamp line pairs appended to a
+        memory-mapped file since the checkpoint
+        """
+        for block, block_offset, starts, ends in \
+                iter_line_blocks(response_file, checkpoint.offset,
+                                 group_size=2):
+
+            # timestamps on the odd lines are not needed
+            value_starts, value_ends = starts[::2], ends[::2]
+
+            try:
+                _add_bulk_records(block, value_starts, value_ends,
+                                  checkpoint)
+            except ValueError:
+                # Fall back to parse values of this block one by one.
+                # Nothing but categories is added in bulk if any value
+                # is malformed
+                for start, end in zip(value_starts, value_ends):
+                    record = parse_response_info(block[start:end].tostring())
+                    if record:
+                        checkpoint.add_record(record)
+
+            checkpoint.offset = block_offset + int(ends[-1]) + 1
+
+
+class VMMetricAccumulator(object):
+    """
+    In-memory counterpart of the parsed metric files of a single virtual
+    machine. Only metrics needed for generating data are kept
+    """
+
+    def __init__(self, vm_name):
+        self.vm_name = vm_name
+        self.response_info = ResponseInfoCheckpoint()
+        self.cpu = array('d')
+        self.cpu_time = array('d')
+
+    def add(self, metric_name, value, timestamp):
+        """
+        Add a metric record parsed from the observer log
+        """
+        if metric_name == 'ResponseInfo':
+            record = parse_response_info(value)
+            if record:
+                self.response_info.add_record(record)
+        elif metric_name == 'CPUUtil':
+            self.cpu.append(float(value))
+            self.cpu_time.append(float(timestamp))
+
+    def add_summary(self, summary):
+        """
+        Merge the summary of the virtual machine produced by observer_agent
+
+        :param summary: Per VM entry of the agent output
+        """
+        checkpoint = self.response_info
+        for i, category_str in enumerate(summary['categories']):
+            category = checkpoint.category_index(category_str)
+            checkpoint.arrivals[category].extend(
+                unpack_samples(summary['arrivals'][i]))
+            checkpoint.responses[category].extend(
+                unpack_samples(summary['responses'][i]))
+
+        self.cpu.extend(unpack_samples(summary['cpu']))
+        self.cpu_time.extend(unpack_samples(summary['cpu_time']))
+
+    def generate_data(self):
+        """
+        :return: (vm name, data) or None if no request has been logged yet
+        """
+        cpu_samples = filter_cpu_samples(self.cpu, self.cpu_time)
+        data = _format_vm_data(self.response_info, cpu_samples=cpu_samples)
+        if not data:
+            print_message('No request logged for %s yet\n' % self.vm_name)
+            return
+
+        return self.vm_name, data
+
+    def __getstate__(self):
+        pickled_dict = self.__dict__.copy()
+        pickled_dict['cpu'] = self.cpu.tostring()
+        pickled_dict['cpu_time'] = self.cpu_time.tostring()
+        return pickled_dict
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cpu = array('d', state['cpu'])
+        self.cpu_time = array('d', state['cpu_time'])
+
+
+def _format_vm_data(checkpoint, cpu_file=None, cpu_samples=None):
+    """
+    Turn requests parsed so far into the metric data of a virtual machine
+
+    :param checkpoint:  ResponseInfoCheckpoint that holds parsed requests
+    :param cpu_file:    File of CPU utilisation readings
+    :param cpu_samples: (cpu utilisation, timestamps) used instead of
+                        cpu_file
+    :return:            The data or None if no request has been logged yet
+    """
+    category_count = len(checkpoint.category_list)
+
+    if not category_count:
+        return
+
+    # Same layout as the cell matrix built with update_data_array. The
+    # extra column is a place holder that format_data excludes
+    data = [[[] for j in xrange(category_count + 1)] for i in xrange(8)]
+    data[2][category_count].append([[]])
+
+    for category in xrange(category_count):
+        data[2][category] = checkpoint.arrivals[category].tolist()
+        data[3][category] = checkpoint.responses[category].tolist()
+
+    raw_data = data
+
+    return format_data(raw_data, 60000, list(checkpoint.category_list),
+                       cpu_file, cpu_samples)
+
+
+def _generate_vm_data(base_path, stream):
+    """
+    Generate metric data of the virtual machine whose parsed observer log
+    is stored in base_path
+
+    :return: (vm name, data) or None if no request has been logged yet
+    """
     response_file = base_path + '/ResponseInfo.txt'
     cpu_file = base_path + '/CPUUtil.txt'
-    # cell(6,2);
-    data = [[] for j in range(7)]
-    category_map = dict()  # containers.Map;
-    category_index = 0
-    category_count = 0
-    category_list = []
-    count = 0
 
     # No ResponseInfo available in observer log yet
     if not os.path.exists(response_file):
         print_message('%s not exists yet\n' % response_file)
         return
 
-    with open(response_file) as f:
-        line = f.readline()
-        while line:
+    if not stream:
+        stream = ResponseInfoStream()
 
-            # skip odd line
-            if count % 2 != 0:
-                line = f.readline()
-                count += 1
-                continue
+    checkpoint = stream.update(response_file)
 
-            split_str = line.split(',')
+    data = _format_vm_data(checkpoint, cpu_file=cpu_file)
+    if not data:
+        print_message('%s has no request yet\n' % response_file)
+        return
 
-            if len(split_str) < 7:
-                line = f.readline()
-                count += 1
-                continue
+    seg = base_path.split('/')
+    vm_name = seg[len(seg) - 1]
 
-            date_str = [split_str[j] for j in xrange(7)]
+    return vm_name, data
 
-            date = datetime.strptime("".join(date_str), '%Y%m%d%H%M%S%f')
 
-            # date = None
-            # # python strptime thread safety bug
-            # # http://bugs.python.org/issue11108
-            # while not date:
-            # try:
-            # date = strptime("".join(date_str), '%Y%m%d%H%M%S%f')
-            # except AttributeError as e:
-            # print "[Debug]: strptime reported AttributeError\n" + \
-            # "Details: %s" % e
+def _generate_data(base_path, stream, queue):
+    results = _generate_vm_data(base_path, stream)
+    if results:
+        queue.put(results)
 
-            date_milli = mktime(date.timetuple())*1e3 + date.microsecond/1e3
 
-            category_str = split_str[8]
+def _generate_accumulated_data(accumulator, queue):
+    results = accumulator.generate_data()
+    if results:
+        queue.put(results)
 
-            if category_str not in category_map:
-                category_map[category_str] = category_index
-                category_list.append(category_str)
-                category_count += 1
 
-                category = category_index
+def _compact_data(data):
+    """
+    Convert every cell of numbers into a numpy array so that the data is
+    pickled as raw buffers rather than nested lists of floats. Cells that
+    hold anything else are left untouched
+    """
+    for row in data:
+        for i in xrange(len(row)):
+            try:
+                row[i] = numpy.asarray(row[i], dtype=float)
+            except (TypeError, ValueError):
+                pass
+
+    return data
+
 
-                data = update_data_array(data, 5, category, [])
-                data = update_data_array(data, 6, category, [])
-                data = update_data_array(data, 7, category, [])
+def _generate_data_worker(args):
+    """
+    Content of process pool workers.
 
-                category_index += 1
-            else:
-                category = category_map[category_str]
+    :param args:    (base path, checkpoint of its ResponseInfo file)
+    :return:        (results, updated checkpoint)
+    """
+    base_path, checkpoint = args
 
-            if split_str[9] == 'Request Begun':
-                continue
+    stream = ResponseInfoStream()
+    if checkpoint:
+        stream.checkpoints[base_path + '/ResponseInfo.txt'] = checkpoint
 
-            response_time = float(split_str[10])
-            arrival_time = date_milli - response_time * 1000
-            data = update_data_array(data, 2, category, arrival_time)
-            data = update_data_array(data, 3, category, response_time)
+    results = _generate_vm_data(base_path, stream)
+    if results:
+        vm_name, data = results
+        results = (vm_name, _compact_data(data))
 
-            line = f.readline()
-            count += 1
+    return results, stream.checkpoints.get(base_path + '/ResponseInfo.txt')
 
-        update_data_array(data, 2, category_index, [[]])
 
-        # fill in the gap between length of data and the target index
-        for i in xrange(len(data)):
-            for j in range(len(data[2])):
-                if len(data[i]) < len(data[2]):
-                    data[i].append([])
+def _accumulated_data_worker(accumulator):
+    """
+    Content of process pool workers for in-memory accumulators
+    """
+    results = accumulator.generate_data()
+    if results:
+        vm_name, data = results
+        results = (vm_name, _compact_data(data))
 
-        raw_data = data
+    return results
 
-        data = format_data(raw_data, 60000, category_list, cpu_file)
 
-        seg = base_path.split('/')
-        vm_name = seg[len(seg) - 1]
+def _generate_data_in_processes(pool, all_dirs, stream):
+    """
+    Run _generate_data for each directory in a pool of processes
 
-        results = (vm_name, data)
-        queue.put(results)
+    :param pool:    The shared process pool
+    :return:        Queue that stores results of each directory
+    """
+    result_queue = Queue.Queue()
 
+    if not all_dirs:
+        return result_queue
 
-def generate_data(logs_folder_path):
+    if not stream:
+        stream = ResponseInfoStream()
+
+    tasks = [(path, stream.checkpoints.get(path + '/ResponseInfo.txt'))
+             for path in all_dirs]
+
+    outputs = pool.map(_generate_data_worker, tasks)
+
+    for path, (results, checkpoint) in zip(all_dirs, outputs):
+        if checkpoint:
+            stream.checkpoints[path + '/ResponseInfo.txt'] = checkpoint
+        if results:
+            result_queue.put(results)
+
+    return result_queue
+
+
+def generate_data(logs_folder_path, stream=None, mode=None):
     """ Generate metric data for each virtual machine monitored
         by the observer
+
+    :param logs_folder_path:    Directory of the parsed observer log
+    :param stream:              ResponseInfoStream that keeps reading position
+                                of each file between calls
+    :param mode:                'thread' or 'process'. Read from config if
+                                not specified
     """
 
     # Get all "directories" that contains files
     all_dirs = [dp for dp, dn, file_names in os.walk(logs_folder_path)
                 if file_names]
 
+    if not mode:
+        mode = cfg.get('MonitorLog', 'data_generation_mode', default='thread')
+
+    # parsing is CPU bound, threads are serialised by the GIL
+    if mode == 'process':
+        pool = get_process_pool()
+        if pool:
+            return _generate_data_in_processes(pool, all_dirs, stream)
+        print_message('[Warning] No process pool was started by the main '
+                      'thread, generating data in threads')
+
     data_generators_manager = ThreadingManager()
 
     # python strptime thread safety bug. Has to call strptime once before
@@ -152,9 +519,53 @@ def generate_data(logs_folder_path):
         data_generators_manager.start_tasks(
             target_func=_generate_data,
             name="monitor_data_generator",
-            para=[logs_path]
+            para=[logs_path, stream]
         )
 
     result_queue = data_generators_manager.collect_results()
 
-    return result_queue
\ No newline at end of file
+    return result_queue
+
+
+def generate_accumulated_data(accumulators, mode=None):
+    """ Generate metric data for each virtual machine from metrics
+        accumulated in memory
+
+    :param accumulators:    VMMetricAccumulator of each virtual machine
+    :param mode:            'thread' or 'process'. Read from config if not
+                            specified
+    :return:                Queue that stores results of each virtual machine
+    """
+    if not mode:
+        mode = cfg.get('MonitorLog', 'data_generation_mode', default='thread')
+
+    pool = None
+    if mode == 'process':
+        pool = get_process_pool()
+        if not pool:
+            print_message('[Warning] No process pool was started by the main '
+                          'thread, generating data in threads')
+
+    if pool:
+        result_queue = Queue.Queue()
+        if not accumulators:
+            return result_queue
+
+        outputs = pool.map(_accumulated_data_worker, accumulators.values())
+
+        for results in outputs:
+            if results:
+                result_queue.put(results)
+
+        return result_queue
+
+    data_generators_manager = ThreadingManager()
+
+    for accumulator in accumulators.values():
+        data_generators_manager.start_tasks(
+            target_func=_generate_accumulated_data,
+            name="monitor_data_generator",
+            para=[accumulator]
+        )
+
+    return data_generators_manager.collect_results()
@@ -0,0 +1,336 @@
+"""
+Append-only binary store of parsed monitor metrics.
+
+Every metric of every VM is kept as a series of fixed-width records in
+<store>/<vm id>/<metric>.bin, read back through numpy.memmap. Each append
+writes one chunk of records and adds (first record, end record, minimum
+timestamp, maximum timestamp) of the chunk to <metric>.idx, so that time range
+queries only look at the chunks that overlap the range.
+
+ResponseInfo values are decoded before they are stored. Their category
+names are kept in ResponseInfo.categories, one per line, in order of first
+appearance and records refer to them by position.
+"""
+import os
+
+import numpy
+
+from data_parser.client_server.data_generation import VMMetricAccumulator
+from data_parser.client_server.observer_records import parse_response_info
+
+# timestamp and value of a metric reading
+METRIC_DTYPE = numpy.dtype([('timestamp', '<f8'), ('value', '<f8')])
+
+# timestamp, arrival time (ms), response time (s) and category of a request
+RESPONSE_DTYPE = numpy.dtype([('timestamp', '<f8'), ('arrival', '<f8'),
+                              ('response', '<f8'), ('category', '<u4')])
+
+# first record, end record, minimum and maximum timestamp of a chunk
+INDEX_DTYPE = numpy.dtype([('start', '<i8'), ('stop', '<i8'),
+                           ('t_min', '<f8'), ('t_max', '<f8')])
+
+
+def _read_array(file_path, dtype):
+    """
+    Memory-map a file of fixed-width records
+
+    :return: Read only array of the records, empty if the file does not exist
+    """
+    if not os.path.exists(file_path) or \
+            os.path.getsize(file_path) < dtype.itemsize:
+        return numpy.empty(0, dtype=dtype)
+
+    return numpy.memmap(file_path, dtype=dtype, mode='r',
+                        shape=(os.path.getsize(file_path) // dtype.itemsize,))
+
+
+def _truncate(file_path, size):
+    if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+        with open(file_path, 'r+b') as f:
+            f.truncate(size)
+
+
+class MetricSeries(object):
+    """
+    Fixed-width records of a single metric of a VM
+    """
+
+    dtype = METRIC_DTYPE
+
+    def __init__(self, path_prefix):
+        """
+        :param path_prefix: Path of the series without extension
+        """
+        self.data_path = path_prefix + '.bin'
+        self.index_path = path_prefix + '.idx'
+
+        self.pending = []
+        self._recover()
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.data_path)
+
+    def _recover(self):
+        """
+        Drop whatever an interrupted append has left beyond the last chunk in
+        the index. Records are written before the index entry of their chunk
+        """
+        _truncate(self.index_path, os.path.getsize(self.index_path)
+                  // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+                  if os.path.exists(self.index_path) else 0)
+
+        index = self.index()
+        records = int(index['stop'][-1]) if len(index) else 0
+        _truncate(self.data_path, records * self.dtype.itemsize)
+
+    def __len__(self):
+        index = self.index()
+        return int(index['stop'][-1]) if len(index) else 0
+
+    def index(self):
+        return _read_array(self.index_path, INDEX_DTYPE)
+
+    def records(self):
+        """
+        :return: Every record of the series, memory-mapped
+        """
+        return _read_array(self.data_path, self.dtype)[:len(self)]
+
+    def add(self, value, timestamp):
+        """
+        Buffer a reading parsed from the observer log until the next flush
+
+        :return: Whether the value could be stored
+        """
+        try:
+            self.pending.append((float(timestamp), float(value)))
+        except ValueError:
+            # only numeric metrics are stored
+            return False
+        return True
+
+    def append(self, records):
+        """
+        Append records as a new chunk
+
+        :param records: Array of the record dtype of the series
+        """
+        if not len(records):
+            return
+
+        start = len(self)
+        chunk = numpy.zeros(1, dtype=INDEX_DTYPE)
+        chunk['start'] = start
+        chunk['stop'] = start + len(records)
+        chunk['t_min'] = records['timestamp'].min()
+        chunk['t_max'] = records['timestamp'].max()
+
+        with open(self.data_path, 'ab') as f:
+            f.write(records.tostring())
+        with open(self.index_path, 'ab') as f:
+            f.write(chunk.tostring())
+
+    def flush(self):
+        """
+        Append readings buffered by add() as a chunk
+        """
+        if not self.pending:
+            return
+
+        records = numpy.array(self.pending, dtype=self.dtype)
+        self.pending = []
+        self.append(records)
+
+    def query(self, start=None, end=None, since=0):
+        """
+        Records whose timestamp lies within [start, end)
+
+        :param start:   Lower bound of timestamps, None for no bound
+        :param end:     Upper bound of timestamps, None for no bound
+        :param since:   Only look at records from this position on
+        :return:        Array of matching records in order of appending
+        """
+        index = self.index()
+        index = index[index['stop'] > since]
+
+        if start is not None:
+            index = index[index['t_max'] >= start]
+        if end is not None:
+            index = index[index['t_min'] < end]
+
+        if not len(index):
+            return numpy.empty(0, dtype=self.dtype)
+
+        records = self.records()
+        chunks = [records[max(int(s), since):int(e)]
+                  for s, e in zip(index['start'], index['stop'])]
+        selected = numpy.concatenate(chunks)
+
+        mask = numpy.ones(len(selected), dtype=bool)
+        if start is not None:
+            mask &= selected['timestamp'] >= start
+        if end is not None:
+            mask &= selected['timestamp'] < end
+
+        return selected[mask]
+
+
+class ResponseSeries(MetricSeries):
+    """
+    Decoded ResponseInfo records of a VM and the categories they refer to
+    """
+
+    dtype = RESPONSE_DTYPE
+
+    def __init__(self, path_prefix):
+        self.categories_path = path_prefix + '.categories'
+        self.categories = []
+        self.category_map = dict()
+        self.new_categories = []
+
+        if os.path.exists(self.categories_path):
+            with open(self.categories_path) as f:
+                for line in f:
+                    self._register(line.rstrip('\n'))
+
+        MetricSeries.__init__(self, path_prefix)
+
+    def _register(self, category_str):
+        self.category_map[category_str] = len(self.categories)
+        self.categories.append(category_str)
+
+    def add(self, value, timestamp):
+        record = parse_response_info(value)
+        if not record:
+            return False
+
+        category_str, status, arrival_time, response_time = record
+        if category_str not in self.category_map:
+            self._register(category_str)
+            self.new_categories.append(category_str)
+
+        # begun requests only register their category
+        if status != 'Request Begun':
+            self.pending.append((float(timestamp), arrival_time,
+                                 response_time,
+                                 self.category_map[category_str]))
+        return True
+
+    def flush(self):
+        # categories are written first so that records never refer to an
+        # unknown one
+        if self.new_categories:
+            with open(self.categories_path, 'a') as f:
+                for category_str in self.new_categories:
+                    f.write(category_str + '\n')
+            self.new_categories = []
+
+        MetricSeries.flush(self)
+
+
+class MetricStore(object):
+    """
+    Binary counterpart of the parsed metric files, one directory per VM
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.series_map = dict()
+
+    def __repr__(self):
+        return '<MetricStore: %s>' % self.store_dir
+
+    def vm_ids(self):
+        if not os.path.exists(self.store_dir):
+            return []
+        return sorted(d for d in os.listdir(self.store_dir)
+                      if os.path.isdir(os.path.join(self.store_dir, d)))
+
+    def metric_names(self, vm_id):
+        vm_dir = os.path.join(self.store_dir, vm_id)
+        return sorted(f[:-len('.bin')] for f in os.listdir(vm_dir)
+                      if f.endswith('.bin'))
+
+    def series(self, vm_id, metric_name):
+        """
+        :return: The MetricSeries of the metric, created if it does not exist
+        """
+        key = (vm_id, metric_name)
+        if key not in self.series_map:
+            vm_dir = os.path.join(self.store_dir, vm_id)
+            if not os.path.exists(vm_dir):
+                os.makedirs(vm_dir)
+
+            path_prefix = os.path.join(vm_dir, metric_name)
+            if metric_name == 'ResponseInfo':
+                self.series_map[key] = ResponseSeries(path_prefix)
+            else:
+                self.series_map[key] = MetricSeries(path_prefix)
+
+        return self.series_map[key]
+
+    def add(self, vm_id, metric_name, value, timestamp):
+        """
+        Buffer a metric record parsed from the observer log
+        """
+        return self.series(vm_id, metric_name).add(value, timestamp)
+
+    def flush(self):
+        for series in self.series_map.values():
+            series.flush()
+
+    def positions(self):
+        """
+        :return: Number of records of each (vm id, metric name) stored so far
+        """
+        return dict(((vm_id, metric_name),
+                     len(self.series(vm_id, metric_name)))
+                    for vm_id in self.vm_ids()
+                    for metric_name in self.metric_names(vm_id))
+
+    def load_accumulators(self, start=None, end=None, since=None):
+        """
+        Replay stored requests and CPU readings into in-memory accumulators
+
+        :param start:   Lower bound of timestamps, None for no bound
+        :param end:     Upper bound of timestamps, None for no bound
+        :param since:   Positions returned by positions(), only records
+                        stored after them are loaded
+        :return:        Dictionary of VMMetricAccumulator by VM id
+        """
+        since = since or dict()
+        accumulators = dict()
+
+        for vm_id in self.vm_ids():
+            accumulator = VMMetricAccumulator(vm_id)
+            metric_names = self.metric_names(vm_id)
+
+            if 'ResponseInfo' in metric_names:
+                series = self.series(vm_id, 'ResponseInfo')
+                records = series.query(start, end,
+                                       since.get((vm_id, 'ResponseInfo'), 0))
+
+                checkpoint = accumulator.response_info
+                codes = numpy.unique(records['category'])
+                # register categories in order of first appearance
+                for category in sorted(codes):
+                    checkpoint.category_index(series.categories[category])
+
+                for category in codes:
+                    in_category = records[records['category'] == category]
+                    index = checkpoint.category_index(
+                        series.categories[category])
+                    checkpoint.arrivals[index].extend(
+                        in_category['arrival'].tolist())
+                    checkpoint.responses[index].extend(
+                        in_category['response'].tolist())
+
+            if 'CPUUtil' in metric_names:
+                records = self.series(vm_id, 'CPUUtil').query(
+                    start, end, since.get((vm_id, 'CPUUtil'), 0))
+                accumulator.cpu.extend(records['value'].tolist())
+                accumulator.cpu_time.extend(records['timestamp'].tolist())
+
+            accumulators[vm_id] = accumulator
+
+        return accumulators
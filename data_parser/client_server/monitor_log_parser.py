@@ -1,23 +1,189 @@
+import json
 import os
+import threading
 import time
 
 import numpy
 
 import Resources
-from data_parser.client_server.data_generation import generate_data
+from data_parser.client_server import observer_agent, observer_records
+from data_parser.client_server.data_generation import generate_data, \
+    generate_accumulated_data, ResponseInfoStream, VMMetricAccumulator
+from data_parser.client_server.metric_store import MetricStore
+from data_parser.client_server.parallel_parser import \
+    parse_log_in_processes
+from data_parser.client_server.observer_records import ParseStats, \
+    iter_file_rows, skip_to_observer_header, iter_metric_records
 from etc.configuration import cfg
-from utilities.utils import sync_files, print_message
+from utilities.file_watcher import FileWatcher
+from utilities.mapped_file import iter_line_blocks, find_all, \
+    locate_separators, field_bounds, gather
+from utilities.process_pool import get_process_pool
+from utilities.remote_log import get_log_tailer
+from utilities.utils import sync_files, print_message, \
+    execute_remote_command, upload_files
 
+# bytes of a memory-mapped observer log scanned at a time and rows of them
+# converted to strings at a time
+MMAP_BLOCK_SIZE = 8 * 1024 * 1024
+MMAP_BATCH_ROWS = 65536
 
-def parse_monitor_log(input_files_dir, line_counter):
+
+class LogOffset(object):
+    """
+    Position reached in the observer log.
+
+    Besides the byte offset, the inode, size and first bytes of the file are
+    kept in order to tell whether the log has been truncated or replaced
+    since
+    """
+
+    HeadSize = 256
+
+    def __init__(self, file_path, offset):
+        stat = os.stat(file_path)
+
+        self.offset = offset
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+
+        with open(file_path, 'rb') as f:
+            self.head = f.read(self.HeadSize)
+
+    def __repr__(self):
+        return '<LogOffset: %s>' % self.offset
+
+    def resume_offset(self, file_path):
+        """
+        :param file_path:   Path of the observer log
+        :return:            The offset to resume from, or 0 if the log has
+                            been truncated or replaced by another log
+        """
+        stat = os.stat(file_path)
+
+        if stat.st_size < self.size:
+            print_message('%s has been truncated, parsing from the start'
+                          % file_path)
+            return 0
+
+        # rsync replaces the log with a new copy on every synchronisation,
+        # only a different beginning means that it is a different log
+        if stat.st_ino != self.inode:
+            with open(file_path, 'rb') as f:
+                head = f.read(len(self.head))
+
+            if head != self.head:
+                print_message('%s has been replaced, parsing from the start'
+                              % file_path)
+                return 0
+
+        return self.offset
+
+
+def _iter_mmap_rows(file_path, offset, stats):
+    """
+    Same rows as iter_file_rows but located in a memory-mapped observer
+    log and split column by column with numpy. Rows are converted to
+    strings MMAP_BATCH_ROWS at a time so that memory stays bounded
+    """
+    for block, block_offset, starts, ends in \
+            iter_line_blocks(file_path, offset, block_size=MMAP_BLOCK_SIZE):
+        stats.offset = block_offset + int(ends[-1]) + 1
+
+        tabs = find_all(block, '\t')
+        first, count = locate_separators(tabs, starts, ends)
+
+        keep = count >= 2
+        starts, ends, first, count = \
+            starts[keep], ends[keep], first[keep], count[keep]
+
+        for i in xrange(0, len(starts), MMAP_BATCH_ROWS):
+            batch = slice(i, i + MMAP_BATCH_ROWS)
+            bounds = (tabs, first[batch], count[batch], starts[batch])
+
+            metric_ids = gather(block, *field_bounds(*(bounds +
+                                                       (ends[batch], 0))))
+            metric_props = gather(block, *field_bounds(*(bounds +
+                                                         (ends[batch], 1))))
+
+            # like str.split the value keeps the line break if it is the
+            # last field of the line
+            values = gather(block, *field_bounds(*(bounds +
+                                                   (ends[batch] + 1, 2))))
+
+            for row in zip(metric_ids.tolist(), metric_props.tolist(),
+                           values.tolist()):
+                yield row
+
+
+def iter_monitor_log(file_path, offset=0, use_mmap=False, stats=None):
+    """
+    Generator of the metric records of the observer log
+
+    :param file_path:   Path of the observer log
+    :param offset:      Byte offset to start from
+    :param use_mmap:    Read the log from a memory-mapped buffer instead of
+                        file iteration
+    :param stats:       ParseStats that is updated with the offset reached
+                        and the number of skipped entries
+    :return:            (vm id, metric name, metric value, timestamp)
+    """
+    if not stats:
+        stats = ParseStats(offset)
+
+    with open(file_path) as f:
+
+        if use_mmap:
+            rows = _iter_mmap_rows(file_path, offset, stats)
+        else:
+            f.seek(offset)
+            rows = iter_file_rows(f, stats)
+
+        skip_to_observer_header(rows)
+
+        for record in iter_metric_records(rows, stats):
+            yield record
+
+
+def parse_monitor_log(input_files_dir, log_offset, use_mmap=None,
+                      accumulators=None, persist=True, store=None,
+                      parallel=None):
+    """
+    Parse the observer log into one file per metric of each VM and/or
+    in-memory accumulators
+
+    :param input_files_dir: Directory that contains the observer log
+    :param log_offset:      LogOffset reached by the previous call, None to
+                            parse from the start
+    :param use_mmap:        Parse the log from a memory-mapped buffer instead
+                            of file iteration. Read from config if not
+                            specified
+    :param accumulators:    Dictionary of VMMetricAccumulator by VM id that
+                            records are added to. Accumulators of VMs seen
+                            for the first time are created
+    :param persist:         Whether to write records to the parsed metric
+                            files
+    :param store:           MetricStore that records are persisted to
+                            instead of the parsed metric files
+    :param parallel:        Parse backlogs larger than [MonitorLog]
+                            parallel_min_bytes in a pool of processes. Read
+                            from config if not specified
+    :return:                (directory of parsed results, LogOffset)
+    """
     if not input_files_dir:
         print 'Please supply the directory that contains observer results'
         return
 
+    if use_mmap is None:
+        use_mmap = cfg.get_bool('MonitorLog', 'use_mmap')
+
+    if parallel is None:
+        parallel = cfg.get_bool('MonitorLog', 'parallel_parsing')
+
     original_file_dir = input_files_dir
     parsed_file_dir = original_file_dir + "parsed_results/"
 
-    if not os.path.exists(parsed_file_dir):
+    if persist and not store and not os.path.exists(parsed_file_dir):
         os.makedirs(parsed_file_dir)
 
     # get time to store current reading
@@ -31,176 +197,150 @@ def parse_monitor_log(input_files_dir, line_counter):
     sub_folder_name = '%s/%s/' % (file_name[0: file_name.rfind('.')],
                                   current_time)
 
-    metric_name = None
+    file_path = os.path.abspath(original_file_dir + '/' + file_name)
 
-    # keep track of last metric id
-    # in order to save reading of last metric when
-    # encounter new metric
-    last_metric_id = None
+    # seek straight to the position left over last time
+    offset = 0
+    if log_offset:
+        offset = log_offset.resume_offset(file_path)
+
+    stats = ParseStats(offset)
+
+    backlog = os.path.getsize(file_path) - offset
+    pool = None
+    if parallel and backlog >= cfg.get_int('MonitorLog', 'parallel_min_bytes',
+                                           64 * 1024 * 1024):
+        pool = get_process_pool()
+        if not pool:
+            print_message('[Warning] No process pool was started by the main '
+                          'thread, parsing %s serially' % file_path)
+
+    if pool:
+        print_message('[Debug] Parsing %s bytes of %s in parallel'
+                      % (backlog, file_path))
+        vm_records, stats = parse_log_in_processes(file_path, offset,
+                                                   pool=pool)
+        records = ((vm_id,) + record
+                   for vm_id, vm_record_list in vm_records.iteritems()
+                   for record in vm_record_list)
+    else:
+        records = iter_monitor_log(file_path, offset, use_mmap, stats)
+
+    # parsed metric files are kept open for the whole pass
+    parsed_files = dict()
+    try:
+        _save_records(records, parsed_file_dir + sub_folder_name,
+                      parsed_files, accumulators, persist, store)
+    finally:
+        for parsed_f in parsed_files.values():
+            parsed_f.close()
+
+    print_message('[Debug] Skipped: %s' % stats.skipped)
+
+    if store:
+        store.flush()
+        return store.store_dir, LogOffset(file_path, stats.offset)
+
+    return parsed_file_dir + sub_folder_name, LogOffset(file_path,
+                                                        stats.offset)
+
+
+def _save_records(records, result_dir, parsed_files, accumulators, persist,
+                  store):
+    """
+    Add parsed records to accumulators and persist them, see
+    parse_monitor_log
 
-    metric_value = None
-    timestamps = None
-    vm_id = None
+    :param records:         (vm id, metric name, metric value, timestamp)
+    :param result_dir:      Directory of the parsed metric files
+    :param parsed_files:    Open parsed metric files by path
+    """
+    for vm_id, metric_name, metric_value, timestamps in records:
 
-    file_path = os.path.abspath(original_file_dir + '/' + file_name)
+        if accumulators is not None:
+            if vm_id not in accumulators:
+                accumulators[vm_id] = VMMetricAccumulator(vm_id)
+            accumulators[vm_id].add(metric_name, metric_value, timestamps)
 
-    # debug
-    # with open(file_path) as test_f:
-    #     print_message('File length: %s' % (len(test_f.readlines())))
-    #     print_message('Line counter %s\n' % line_counter)
+        if not persist:
+            continue
 
-    # counter for number of skip due to incorrect format of some
-    # csparql log entries
-    skip_counter = 0
+        if store:
+            store.add(vm_id, metric_name, metric_value, timestamps)
+            continue
 
-    # counter to skip to the last
-    with open(file_path) as f:
+        result_file_path = '%s%s/%s.txt' % (result_dir, vm_id, metric_name)
 
-        # count = 0  # counter for skip to the line left over last time
-        # while count < line_counter:
-        # try:
-        # f.next()
-        # except StopIteration as e:
-        # # print 'StopIteration\n' + str(e.message)
-        # count += 1
-        #     count += 1
-
-        # current_line = 1  # default to 1 to enable the while loop
-
-        count = 0  # counter for skip to the line left over last time
-        if line_counter != 0:
-            for current_line in f:
-                if count == int(line_counter):
-                    break
-                count += 1
-
-        # Skip to the line after ObserverReceivedTimestamp
-        for current_line in f:
-            line_counter += 1
-            line_segments = current_line.split("\t")
-            if len(line_segments) < 3:
-                continue
-            if 'ObserverReceivedTimesampt' in line_segments[1]:
-                break
-
-        # The csparql log sometimes contain entries with "MonitorDatum"
-        # entries mixed up, hence we explicitly set the program to expect
-        # metrics in the expected order and skip those mixed entries
-        # since it is way to difficult to parse it for external program
-        # like this one and it is actually the job of the csparql
-        # observer to print metrics in a consistent format which on the
-        # other hand is the efficient fix of this issue
-        expected_properties = ['isAbout', 'isProducedBy',
-                               'hasMonitoredMetric', 'hasValue',
-                               'hasTimeStamp']
-        expected_prop_idx = 0  # counter to keep track of order of
-        # expected properties encountered
-
-        for current_line in f:
-            line_counter += 1
-
-            # parse current line of the file
-            # current_line = f.readline()
-            # line_counter += 1
-
-            # [metric_id, metric_prop, value, dump]
-            # = current_line.split("\t")
-            line_segments = current_line.split("\t")
-            if len(line_segments) < 3:
-                continue
-
-            metric_id = line_segments[0]
-            metric_prop = line_segments[1]
-            value = line_segments[2]
-
-            # if the line is not about metric continue to read next line
-            if 'MonitoringDatum' not in metric_id:
-                continue
-
-            # For the first time
-            if not last_metric_id:
-                last_metric_id = metric_id
-
-            # Check the metric property is currently expected and the
-            # metric id is the same one as the one that we'd been
-            # reading other expected properties for
-
-            # If the property is not expected skip to next bundle of metric
-            # i.e next 'isAbout'. OR if it is expected but the metric ID
-            # is not the same as other metric property we've been reading
-            #  for the current metric ID we skip as well. Except
-            # that when expecting 'isAbout' i.e the first property,
-            # we don't check for metric ID, since it could be a new metric
-            if metric_prop != expected_properties[expected_prop_idx] or \
-               (expected_prop_idx != 0 and metric_id != last_metric_id):
-
-                # as long as it enters here it is one skip already
-                skip_counter += 1
-
-                # if an 'isAbout' encountered we assume the following
-                # lines could possible be in order
-                if metric_prop == 'isAbout':
-                    # start fresh
-                    expected_prop_idx = 0
-                    last_metric_id = metric_id
-                else:
-                    # Skip to the next 'isAbout' line
-                    expected_prop_idx = 0  # expecting the 'isAbout'
-                    last_metric_id = None
-                    continue
-
-            # if the metric property is expected then expect the next one
-            if expected_prop_idx == len(expected_properties) - 1:
-                expected_prop_idx = 0
-            else:
-                expected_prop_idx += 1
+        parsed_f = parsed_files.get(result_file_path)
+        if not parsed_f:
+            result_dir_path = result_dir + vm_id
+            if not os.path.exists(result_dir_path):
+                os.makedirs(result_dir_path)
+
+            parsed_f = open(result_file_path, 'a')
+            parsed_files[result_file_path] = parsed_f
+
+        parsed_f.write(metric_value + '\n')
+        parsed_f.write(timestamps + '\n')
 
-            # save reading of last metric since following reading
-            # will be of a new metric id
-            if last_metric_id != metric_id:
-                # check whether any of the 4 properties :
-                # vm_id, metric name, metric value, timestamp
-                # is none, which means that the very end of the file
-                # has one record that is only partially written, hence
-                # ignore this record
 
-                # This "if" shouldn't be here since I skipped those records that
-                # are mixed up... but for some reason values below could
-                # still be None... It is much more convenient to fix csparql log
-                # rather than thinking out logic to patching up for this
-                if vm_id and metric_name and metric_value and timestamps:
+# files uploaded to observer hosts that run the agent
+AGENT_FILES = [observer_agent.__file__.replace('.pyc', '.py'),
+               observer_records.__file__.replace('.pyc', '.py')]
 
-                    result_dir_path = parsed_file_dir + sub_folder_name + vm_id
+# directory the agent is uploaded to, relative to the home directory
+AGENT_DIR = 'agile_routing_agent'
 
-                    if not os.path.exists(result_dir_path):
-                        os.makedirs(result_dir_path)
+# observer hosts the agent has been uploaded to in this run
+_deployed_agents = set()
+_deployed_agents_lock = threading.Lock()
 
-                    result_file_path = \
-                        result_dir_path + '/' + metric_name + '.txt'
 
-                    with open(result_file_path, 'a') as parsed_f:
-                        parsed_f.write(metric_value + '\n')
-                        parsed_f.write(timestamps + '\n')
+def fetch_observer_summary(observer_ip, pk_path, remote_log_path, offset,
+                           accumulators):
+    """
+    Run observer_agent on the observer host and merge the summary of what
+    has been appended to the observer log since offset into accumulators
+
+    :param observer_ip:     IP of the observer host
+    :param pk_path:         Private key used to login
+    :param remote_log_path: Path of the observer log on the observer host
+    :param offset:          Byte offset returned by the previous call
+    :param accumulators:    Dictionary of VMMetricAccumulator by VM id
+    :return:                Byte offset reached in the remote log, or the
+                            given offset if the agent failed
+    """
+    with _deployed_agents_lock:
+        if observer_ip not in _deployed_agents:
+            upload_files(observer_ip, AGENT_FILES, AGENT_DIR, 'ubuntu',
+                         private_key=pk_path)
+            _deployed_agents.add(observer_ip)
+
+    command = 'python ~/%s/observer_agent.py %s --offset %d' \
+              % (AGENT_DIR, remote_log_path, offset)
+    output, error = execute_remote_command(observer_ip, command, 'ubuntu',
+                                           private_key=pk_path)
 
-                # current metric become the last after finish
-                # processing its value
-                last_metric_id = metric_id
+    try:
+        summary = json.loads(output)
+    except ValueError:
+        print_message('Unexpected output of observer agent on %s: %s'
+                      % (observer_ip, output))
+        return offset
 
-            if metric_prop == "isAbout":
-                vm_id = value.replace("Compute#", "")
-            elif metric_prop == "hasMonitoredMetric":
-                metric_name = value.replace("QoSMetric#", "")
-            elif metric_prop == "hasValue":
-                metric_value = value
-            elif metric_prop == "hasTimeStamp":
-                timestamps = value
+    if summary['reset']:
+        # previously merged samples are kept, the new log is appended
+        print_message('%s shrunk on %s, parsed from the start'
+                      % (remote_log_path, observer_ip))
 
-                # record the position left over
-                # line_counter = f.tell()
+    for vm_id, vm_summary in summary['vms'].iteritems():
+        if vm_id not in accumulators:
+            accumulators[vm_id] = VMMetricAccumulator(vm_id)
+        accumulators[vm_id].add_summary(vm_summary)
 
-    print_message('[Debug] Skipped: %s' % skip_counter)
+    print_message('[Debug] Skipped: %s' % summary['skipped'])
 
-    return parsed_file_dir + sub_folder_name, line_counter
+    return summary['offset']
 
 
 def calculate_total_requests(data):
@@ -280,13 +420,15 @@ def calculate_metrics(data_list):
     return total_requests, station_arrival_rate, service_rate_para_list
 
 
-def process_monitor_log(base_dir, observer_addr, line_counter, queue):
+def process_monitor_log(base_dir, observer_addr, log_offset, queue):
     """Parse the monitor log and calculate various metric for all servers in
     the service station monitored by the observer
 
     :param base_dir:        Base directory of monitor log
     :param observer_addr:   Service station name and observer ips pair
-    :param line_counter:    Counter for continuously reading the single log file
+    :param log_offset:      LogOffset for continuously reading the single log
+                            file, or the byte offset reached in the remote
+                            log when it is parsed by observer_agent
 
     :param queue:           Queue that store metrics needed for optimisation
                             generated by current thread
@@ -304,30 +446,129 @@ def process_monitor_log(base_dir, observer_addr, line_counter, queue):
     # Flag indicates whether the logs of all servers contain useful data or not
     all_has_info = False
 
-    while not all_has_info:
-
-        print_message('')
-        print_message('Synchronising log from observer at: %s' % observer_ip)
-
-        module_path = os.path.dirname(Resources.__file__)
-        private_key_file_path = module_path + '/ec2_private_key'
-
-        sync_files(host_ip=observer_ip, username='ubuntu',
-                   host_file_path='~/results.txt',
-                   pk_path=private_key_file_path, dst_loc=monitor_log_path)
+    # remembers how far each ResponseInfo file has been read so that every
+    # pass below only parses what has been appended since the last one
+    response_info_stream = ResponseInfoStream()
+
+    # In pipeline mode parsed metrics go straight to per VM accumulators
+    # rather than through the parsed metric files
+    in_memory = cfg.get_bool('MonitorLog', 'in_memory_pipeline')
+    log_transport = cfg.get('MonitorLog', 'log_transport', default='rsync')
+    accumulators = None
+    persist = True
+    if in_memory or log_transport == 'agent':
+        accumulators = dict()
+        persist = cfg.get_bool('MonitorLog', 'persist_parsed_metrics', True)
+
+    # parsed metrics can be kept in the binary store instead of text files.
+    # Without accumulators the data is then generated from what has been
+    # stored since this call started
+    store = None
+    store_positions = None
+    if persist and \
+            cfg.get('MonitorLog', 'parsed_metrics_format',
+                    default='text') == 'binary':
+        store = MetricStore(base_dir + 'parsed_results/store/')
+        store_positions = store.positions()
+
+    module_path = os.path.dirname(Resources.__file__)
+    private_key_file_path = module_path + '/ec2_private_key'
+
+    # number of servers that must have logged requests before the metrics
+    # of the station are calculated
+    num_servers = cfg.get_int('StationNumServers', station_name, 2)
+    readiness_timeout = cfg.get_float('MonitorLog', 'readiness_timeout', 5)
+
+    # A 'local' log is written in place by the observer, hence the loop
+    # waits on inotify for new bytes. Nothing writes a synchronised copy
+    # between fetches, so it is fetched every readiness_timeout seconds and
+    # the watcher only tells whether the fetch brought new bytes
+    watcher = None
+    if log_transport == 'local':
+        local_log_path = os.path.join(
+            cfg.get('MonitorLog', 'local_log_dir', default=''),
+            station_name, 'results.txt')
+        if not os.path.lexists(monitor_log_path):
+            os.symlink(os.path.abspath(local_log_path), monitor_log_path)
+        watcher = FileWatcher(monitor_log_path)
+    elif log_transport != 'agent':
+        watcher = FileWatcher(monitor_log_path, use_inotify=False)
+
+    # whether the log has grown since it was last parsed
+    has_new_bytes = False
+
+    try:
+        while not all_has_info:
+
+            print_message('')
+
+            # 'agent' parses the log on the observer host and only transfers
+            # the per VM summary of what has been appended since the last
+            # poll
+            if log_transport == 'agent':
+                print_message('Fetching log summary from observer at: %s'
+                              % observer_ip)
+                previous_offset = log_offset or 0
+                log_offset = fetch_observer_summary(
+                    observer_ip, private_key_file_path, '~/results.txt',
+                    previous_offset, accumulators)
+                has_new_bytes = log_offset != previous_offset
+            else:
+                if log_transport != 'local':
+                    print_message('Synchronising log from observer at: %s'
+                                  % observer_ip)
+
+                # 'sftp' keeps one session per observer open and only
+                # transfers the bytes appended since the last poll
+                if log_transport == 'sftp':
+                    tailer = get_log_tailer(host_ip=observer_ip,
+                                            username='ubuntu',
+                                            pk_path=private_key_file_path,
+                                            remote_path='~/results.txt',
+                                            local_path=monitor_log_path)
+                    appended = tailer.sync()
+                    print_message('[Debug] %s bytes appended to %s'
+                                  % (appended, monitor_log_path))
+                elif log_transport != 'local':
+                    sync_files(host_ip=observer_ip, username='ubuntu',
+                               host_file_path='~/results.txt',
+                               pk_path=private_key_file_path,
+                               dst_loc=monitor_log_path)
+
+                has_new_bytes = watcher.changed() or has_new_bytes
+
+                # only what has been appended since the last pass is parsed
+                if has_new_bytes:
+                    parsed_log_dir, log_offset = parse_monitor_log(
+                        base_dir, log_offset, accumulators=accumulators,
+                        persist=persist, store=store)
+
+            if has_new_bytes:
+                if accumulators is not None:
+                    result_queue = generate_accumulated_data(accumulators)
+                elif store:
+                    result_queue = generate_accumulated_data(
+                        store.load_accumulators(since=store_positions))
+                else:
+                    result_queue = generate_data(parsed_log_dir,
+                                                 response_info_stream)
 
-        parsed_log_dir, line_counter = parse_monitor_log(base_dir,
-                                                         int(line_counter))
-        result_queue = generate_data(parsed_log_dir)
+                # observer log has contain ResponseInfo if the queue if not
+                # empty
 
-        # observer log has contain ResponseInfo if the queue if not empty
+                # check all server has response info
+                all_has_info = result_queue.qsize() >= num_servers
 
-        # check all server has response info
-        # TODO: the number of server can be read from config
-        if result_queue.qsize() > 1:
-            all_has_info = True
-        else:
-            time.sleep(5)
+            if not all_has_info:
+                if log_transport == 'local':
+                    has_new_bytes = watcher.wait(readiness_timeout)
+                else:
+                    # the next fetch is due
+                    time.sleep(readiness_timeout)
+                    has_new_bytes = False
+    finally:
+        if watcher:
+            watcher.close()
 
     data_list = []
     while not result_queue.empty():
@@ -341,6 +582,6 @@ def process_monitor_log(base_dir, observer_addr, line_counter, queue):
                    'total_requests': total_requests,
                    'arrival_rate': arrival_rate,
                    'service_rate_para_list': service_rate_para_list,
-                   'line_counter': line_counter}
+                   'log_offset': log_offset}
 
     queue.put(result_dict)
\ No newline at end of file
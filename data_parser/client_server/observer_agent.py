@@ -0,0 +1,165 @@
+"""
+Pre-aggregation agent run on csparql observer hosts.
+
+The agent parses whatever has been appended to the observer log since the
+given byte offset and prints a JSON summary of it on standard output, so that
+only the reduced metrics rather than the raw log travel to the controller:
+
+    python observer_agent.py ~/results.txt --offset 1426736
+
+The summary still holds every request's arrival and response time and every
+CPU reading, packed as doubles, since format_data and calculate_metrics work
+on the individual samples. Hence the transfer shrinks by the ratio of a log
+record to its packed samples rather than to a fixed number of windows.
+
+It is uploaded next to observer_records.py and only depends on the standard
+library, hence it does not need anything installed on the observer host.
+"""
+import base64
+import json
+import math
+import optparse
+import os
+import sys
+from array import array
+
+try:
+    from data_parser.client_server.observer_records import ParseStats, \
+        iter_file_rows, skip_to_observer_header, iter_metric_records, \
+        parse_response_info
+except ImportError:
+    # deployed on the observer host next to observer_records.py
+    from observer_records import ParseStats, iter_file_rows, \
+        skip_to_observer_header, iter_metric_records, parse_response_info
+
+
+def pack_samples(samples):
+    """
+    :param samples: array of doubles
+    :return:        base64 of the samples as little-endian doubles
+    """
+    samples = array('d', samples)
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    to_bytes = getattr(samples, 'tobytes', None) or samples.tostring
+    return base64.b64encode(to_bytes()).decode('ascii')
+
+
+def unpack_samples(packed):
+    """
+    Inverse of pack_samples
+    """
+    samples = array('d')
+    from_bytes = getattr(samples, 'frombytes', None) or samples.fromstring
+    from_bytes(base64.b64decode(packed))
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    return samples
+
+
+class VMSummary(object):
+    """
+    Requests and CPU readings of a single virtual machine reduced by the
+    agent
+    """
+
+    def __init__(self):
+        # categories in order of first appearance
+        self.categories = []
+        self.category_map = dict()
+        self.arrivals = []
+        self.responses = []
+
+        self.cpu = array('d')
+        self.cpu_time = array('d')
+
+    def add(self, metric_name, value, timestamp):
+        if metric_name == 'ResponseInfo':
+            record = parse_response_info(value)
+            if not record or record[2] is None:
+                return
+
+            category_str, status, arrival_time, response_time = record
+            if category_str not in self.category_map:
+                self.category_map[category_str] = len(self.categories)
+                self.categories.append(category_str)
+                self.arrivals.append(array('d'))
+                self.responses.append(array('d'))
+
+            category = self.category_map[category_str]
+            self.arrivals[category].append(arrival_time)
+            self.responses[category].append(response_time)
+
+        elif metric_name == 'CPUUtil':
+            utilisation = float(value)
+            # the same readings format_data leaves out
+            if utilisation > 1 or math.isnan(utilisation):
+                return
+
+            self.cpu.append(utilisation)
+            self.cpu_time.append(float(timestamp))
+
+    def to_dict(self):
+        return {'categories': self.categories,
+                'arrivals': [pack_samples(a) for a in self.arrivals],
+                'responses': [pack_samples(r) for r in self.responses],
+                'cpu': pack_samples(self.cpu),
+                'cpu_time': pack_samples(self.cpu_time)}
+
+
+def aggregate(log_path, offset=0):
+    """
+    Parse the observer log from the given offset
+
+    :param log_path:    Path of the observer log
+    :param offset:      Byte offset reached by the previous run
+    :return:            Dictionary of the offset reached, whether the log
+                        has been read from the start again, the number of
+                        skipped entries and the summary of every VM
+    """
+    size = os.path.getsize(log_path)
+
+    # the log has been truncated or replaced since the previous run
+    reset = size < offset
+    if reset:
+        offset = 0
+
+    stats = ParseStats(offset)
+    summaries = dict()
+
+    with open(log_path) as f:
+        f.seek(offset)
+        rows = iter_file_rows(f, stats)
+        skip_to_observer_header(rows)
+
+        for vm_id, metric_name, value, timestamp \
+                in iter_metric_records(rows, stats):
+            if vm_id not in summaries:
+                summaries[vm_id] = VMSummary()
+            summaries[vm_id].add(metric_name, value, timestamp)
+
+    return {'offset': stats.offset,
+            'size': size,
+            'reset': reset,
+            'skipped': stats.skipped,
+            'vms': dict((vm_id, summary.to_dict())
+                        for vm_id, summary in summaries.items())}
+
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage='%prog LOG_PATH [--offset N]')
+    parser.add_option('--offset', type='int', default=0,
+                      help='byte offset reached by the previous run')
+    options, args = parser.parse_args(argv)
+
+    if len(args) != 1:
+        parser.error('path of the observer log is required')
+
+    log_path = os.path.expanduser(args[0])
+    sys.stdout.write(json.dumps(aggregate(log_path, options.offset)))
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
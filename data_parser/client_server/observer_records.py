@@ -0,0 +1,278 @@
+"""
+Parsing of csparql observer log records.
+
+This module only depends on the standard library since it is also shipped to
+observer hosts together with observer_agent.
+"""
+from __future__ import division
+from datetime import datetime
+from time import mktime
+
+
+class ParseStats(object):
+    """
+    Counters shared by the row sources and the metric parser
+    """
+
+    def __init__(self, offset):
+        # byte offset right after the last complete line consumed
+        self.offset = offset
+        # counter for number of skip due to incorrect format of some
+        # csparql log entries
+        self.skipped = 0
+
+
+def iter_file_rows(f, stats):
+    """
+    Split lines of the observer log read through file iteration into
+    (metric id, metric property, value)
+    """
+    for current_line in f:
+        # the last line could be still being written
+        if not current_line.endswith('\n'):
+            break
+
+        stats.offset += len(current_line)
+
+        # [metric_id, metric_prop, value, dump]
+        # = current_line.split("\t")
+        # fields after the value are not needed
+        line_segments = current_line.split("\t", 3)
+        if len(line_segments) < 3:
+            continue
+
+        yield line_segments[0], line_segments[1], line_segments[2]
+
+
+def skip_to_observer_header(rows):
+    """
+    Skip to the row after ObserverReceivedTimestamp
+    """
+    for metric_id, metric_prop, value in rows:
+        if 'ObserverReceivedTimesampt' in metric_prop:
+            return True
+
+    return False
+
+
+# The csparql log sometimes contain entries with "MonitorDatum" entries mixed
+# up, hence metrics are expected with their properties in the order below and
+# mixed entries are skipped. It is actually the job of the csparql observer to
+# print metrics in a consistent format
+EXPECTED_PROPERTIES = ('isAbout', 'isProducedBy', 'hasMonitoredMetric',
+                       'hasValue', 'hasTimeStamp')
+
+# codes of the properties are their positions, anything else is OTHER
+PROPERTY_CODES = dict((prop, code)
+                      for code, prop in enumerate(EXPECTED_PROPERTIES))
+OTHER = len(EXPECTED_PROPERTIES)
+
+IS_ABOUT = PROPERTY_CODES['isAbout']
+
+# property expected after each one
+NEXT_STATES = tuple((code + 1) % len(EXPECTED_PROPERTIES)
+                    for code in range(len(EXPECTED_PROPERTIES)))
+
+# Actions of the state machine:
+#   ACCEPT  - take the property and expect the next one
+#   EMIT    - an 'isAbout' of a new metric, save the reading of the last
+#             metric then take the property
+#   RESTART - an unexpected 'isAbout', count a skip and start the metric
+#             over from it assuming the following lines could be in order
+#   SKIP    - count a skip and ignore lines up to the next 'isAbout'
+ACCEPT, EMIT, RESTART, SKIP = range(4)
+
+
+def _transition_table(same_id):
+    """
+    :param same_id: Whether the line is about the metric id that has been
+                    read for the current metric
+    :return:        Action of each (expected property, property code)
+    """
+    table = []
+    for state in range(len(EXPECTED_PROPERTIES)):
+        row = []
+        for code in range(OTHER + 1):
+            # the metric id is not checked when expecting 'isAbout' since it
+            # could be a new metric
+            if code == state and (same_id or state == IS_ABOUT):
+                row.append(ACCEPT if same_id else EMIT)
+            elif code == IS_ABOUT:
+                row.append(RESTART)
+            else:
+                row.append(SKIP)
+        table.append(tuple(row))
+
+    return tuple(table)
+
+# indexed by whether the metric id is the same as the last one
+TRANSITIONS = (_transition_table(False), _transition_table(True))
+
+
+class MetricStateMachine(object):
+    """
+    Assemble rows of the observer log into metric records.
+
+    The state of the machine (expected property, last metric id and the
+    properties read so far) is kept between calls of feed() and can be
+    inspected, so the log can be fed in pieces
+    """
+
+    def __init__(self, stats=None):
+        """
+        :param stats:   ParseStats that counts the skipped entries
+        """
+        self.stats = stats or ParseStats(0)
+
+        # code of the property expected next
+        self.state = IS_ABOUT
+        # metric id the properties read so far belong to
+        self.last_id = None
+        # values of the properties read so far by their codes i.e. vm id,
+        # data collector, metric name, metric value and timestamp
+        self.fields = [None] * len(EXPECTED_PROPERTIES)
+
+    def pending(self):
+        """
+        :return:    Metric record that would be saved when the next metric
+                    starts, None if any of its properties is missing
+        """
+        vm_id, produced_by, metric_name, metric_value, timestamp = \
+            self.fields
+
+        if vm_id:
+            vm_id = vm_id.replace("Compute#", "")
+        if metric_name:
+            metric_name = metric_name.replace("QoSMetric#", "")
+
+        # the very end of a log could have one record that is only
+        # partially written. Values could also still be None since mixed up
+        # records are skipped
+        if vm_id and metric_name and metric_value and timestamp:
+            return vm_id, metric_name, metric_value, timestamp
+
+    def feed(self, rows):
+        """
+        :param rows:    (metric id, metric property, value) of each line
+        :return:        (vm id, metric name, metric value, timestamp) of every
+                        complete metric
+        """
+        # machine state is kept in locals while running
+        state = self.state
+        last_id = self.last_id
+        fields = self.fields
+        new_id_actions, same_id_actions = TRANSITIONS
+        property_codes = PROPERTY_CODES
+        expected_properties = EXPECTED_PROPERTIES
+        next_states = NEXT_STATES
+        skipped = 0
+
+        try:
+            for metric_id, metric_prop, value in rows:
+
+                if metric_id == last_id:
+                    actions = same_id_actions[state]
+                else:
+                    # if the line is not about metric continue to read next
+                    # line
+                    if 'MonitoringDatum' not in metric_id:
+                        continue
+
+                    if last_id is None:
+                        last_id = metric_id
+                        actions = same_id_actions[state]
+                    else:
+                        actions = new_id_actions[state]
+
+                # a single comparison for properties in the expected order
+                if metric_prop == expected_properties[state]:
+                    action = actions[state]
+                    code = state
+                else:
+                    code = property_codes.get(metric_prop, OTHER)
+                    action = actions[code]
+
+                # ACCEPT is zero and by far the most common
+                if action:
+                    if action == SKIP:
+                        skipped += 1
+                        state = IS_ABOUT
+                        last_id = None
+                        continue
+
+                    if action == EMIT:
+                        # save reading of last metric since following
+                        # reading will be of a new metric id, same as
+                        # pending() but inlined
+                        vm_id, produced_by, metric_name, metric_value, \
+                            timestamp = fields
+                        if vm_id and metric_name and metric_value and \
+                                timestamp:
+                            vm_id = vm_id.replace("Compute#", "")
+                            metric_name = metric_name.replace("QoSMetric#", "")
+                            if vm_id and metric_name:
+                                yield vm_id, metric_name, metric_value, \
+                                    timestamp
+                    else:
+                        # RESTART
+                        skipped += 1
+                        state = IS_ABOUT
+
+                    last_id = metric_id
+
+                # prefixes of the values are only removed once the record is
+                # complete
+                fields[code] = value
+                state = next_states[state]
+        finally:
+            self.state = state
+            self.last_id = last_id
+            self.stats.skipped += skipped
+
+
+def iter_metric_records(rows, stats):
+    """
+    Assemble rows of the observer log into metric records
+
+    :param rows:    (metric id, metric property, value) of each line
+    :param stats:   ParseStats that counts the skipped entries
+    :return:        (vm id, metric name, metric value, timestamp) of every
+                    complete metric
+    """
+    return MetricStateMachine(stats).feed(rows)
+
+
+def parse_response_info(line):
+    """
+    Parse the value of a single ResponseInfo metric e.g.
+
+    2014,07,01,09,26,32,434,http-bio-0.0.0.0-8080-exec-9,login,Request Done,
+    0.585
+
+    :param line:    The comma separated ResponseInfo value
+    :return:        (category, status, arrival_time, response_time) or None
+                    if the value is malformed. Arrival time is in milliseconds
+                    and response time in seconds, both are None for
+                    'Request Begun' entries
+    """
+    split_str = line.split(',')
+
+    if len(split_str) < 10:
+        return None
+
+    category_str = split_str[8]
+    status = split_str[9]
+
+    if status == 'Request Begun':
+        return category_str, status, None, None
+
+    if len(split_str) < 11:
+        return None
+
+    date = datetime.strptime("".join(split_str[0:7]), '%Y%m%d%H%M%S%f')
+    date_milli = mktime(date.timetuple())*1e3 + date.microsecond/1e3
+
+    response_time = float(split_str[10])
+    arrival_time = date_milli - response_time * 1000
+
+    return category_str, status, arrival_time, response_time
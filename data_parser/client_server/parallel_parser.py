@@ -0,0 +1,198 @@
+"""
+Parallel parsing of large observer log backlogs.
+
+The log is split into byte ranges that start at 'isAbout' lines i.e. at
+record boundaries, every range is parsed by MetricStateMachine in a process
+pool and the results are merged in order. At each boundary the machine of
+the previous range is reconciled with the fresh machine of the next range the
+same way a single machine would have carried on, hence records and skip
+counts are the same as parsing the log serially.
+"""
+import multiprocessing
+import os
+from cStringIO import StringIO
+
+from data_parser.client_server.observer_records import ParseStats, \
+    MetricStateMachine, iter_file_rows, skip_to_observer_header, \
+    IS_ABOUT, EXPECTED_PROPERTIES
+from utilities.process_pool import get_process_pool
+
+# bytes read at a time when looking for line ends
+SCAN_SIZE = 65536
+
+
+def _last_line_end(f, start, size):
+    """
+    :return: Offset right after the last line break between start and size
+    """
+    position = size
+    while position > start:
+        read_from = max(start, position - SCAN_SIZE)
+        f.seek(read_from)
+        found = f.read(position - read_from).rfind('\n')
+        if found >= 0:
+            return read_from + found + 1
+        position = read_from
+
+    return start
+
+
+def _is_record_start(line):
+    line_segments = line.split('\t', 3)
+    return len(line_segments) >= 3 and \
+        line_segments[1] == EXPECTED_PROPERTIES[IS_ABOUT] and \
+        'MonitoringDatum' in line_segments[0]
+
+
+def _record_boundary(f, position, end):
+    """
+    :return: Start of the first 'isAbout' line at or after position, or end
+             if there is none before it
+    """
+    # move to the start of the line that contains position - 1 plus one
+    # line i.e. the first line starting at or after position
+    f.seek(position - 1)
+    position += len(f.readline()) - 1
+
+    while position < end:
+        line = f.readline()
+        if _is_record_start(line):
+            return position
+        position += len(line)
+
+    return end
+
+
+def split_log(file_path, start, end, num_ranges):
+    """
+    Split a part of the observer log into byte ranges starting at record
+    boundaries
+
+    :param file_path:   Path of the observer log
+    :param start:       Offset of the first line of the part
+    :param end:         Offset right after the last complete line of the part
+    :param num_ranges:  Number of ranges wanted
+    :return:            List of (start, end) of ranges, less than num_ranges
+                        if records are too long to split further
+    """
+    boundaries = [start]
+    with open(file_path, 'rb') as f:
+        for i in xrange(1, num_ranges):
+            target = start + (end - start) * i // num_ranges
+            if target <= boundaries[-1]:
+                continue
+            boundary = _record_boundary(f, target, end)
+            if boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+
+    boundaries.append(end)
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def _parse_range(args):
+    """
+    Content of process pool workers
+
+    :param args:    (path of the observer log, start, end)
+    :return:        (metric id of the first metric line, records grouped by
+                    vm id in order, number of skipped entries, state, last
+                    metric id and pending record of the machine at the end)
+    """
+    file_path, start, end = args
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    stats = ParseStats(start)
+    machine = MetricStateMachine(stats)
+
+    records = dict()
+    for vm_id, metric_name, metric_value, timestamp in \
+            machine.feed(iter_file_rows(StringIO(data), stats)):
+        if vm_id not in records:
+            records[vm_id] = []
+        records[vm_id].append((metric_name, metric_value, timestamp))
+
+    first_id = None
+    if data:
+        first_id = data[:data.find('\t')]
+
+    return first_id, records, stats.skipped, machine.state, \
+        machine.last_id, machine.pending()
+
+
+def parse_log_in_processes(file_path, offset=0, num_processes=None,
+                           pool=None):
+    """
+    Parse the observer log from offset in a pool of processes
+
+    :param file_path:       Path of the observer log
+    :param offset:          Byte offset to start from
+    :param num_processes:   Number of byte ranges the log is split into,
+                            number of cores by default
+    :param pool:            Process pool the ranges are parsed by, the shared
+                            one by default. See utilities.process_pool
+    :return:                (records, stats) where records maps each vm id
+                            to its (metric name, metric value, timestamp) in
+                            order of the log and stats is the ParseStats
+                            reached
+    """
+    if not num_processes:
+        num_processes = multiprocessing.cpu_count()
+
+    stats = ParseStats(offset)
+
+    with open(file_path, 'rb') as f:
+        end = _last_line_end(f, offset, os.path.getsize(file_path))
+
+        # records are only parsed after the first header, which is also
+        # where serial parsing starts
+        f.seek(offset)
+        rows = iter_file_rows(f, stats)
+        found_header = skip_to_observer_header(rows)
+        rows.close()
+
+    start = stats.offset
+    stats.offset = end
+
+    if not found_header or start >= end:
+        return dict(), stats
+
+    ranges = split_log(file_path, start, end, num_processes)
+
+    if not pool:
+        pool = get_process_pool()
+        if not pool:
+            raise RuntimeError('No process pool was started by the main '
+                               'thread')
+
+    outputs = pool.map(_parse_range, [(file_path, range_start, range_end)
+                                      for range_start, range_end in ranges])
+
+    records = dict()
+    previous = None
+    for first_id, range_records, skipped, state, last_id, pending in outputs:
+        stats.skipped += skipped
+
+        if previous:
+            previous_state, previous_last_id, previous_pending = previous
+            if previous_state != IS_ABOUT:
+                # the 'isAbout' that starts the range interrupts the
+                # properties the previous range ended with
+                stats.skipped += 1
+            elif previous_last_id and previous_last_id != first_id and \
+                    previous_pending:
+                # the reading of the last metric of the previous range is
+                # saved when the new metric starts
+                vm_id, metric_name, metric_value, timestamp = \
+                    previous_pending
+                records.setdefault(vm_id, []).append(
+                    (metric_name, metric_value, timestamp))
+
+        for vm_id, vm_records in range_records.iteritems():
+            records.setdefault(vm_id, []).extend(vm_records)
+
+        previous = (state, last_id, pending)
+
+    return records, stats
@@ -25,12 +25,13 @@ class ServiceStationMetric:
         self.service_rate = service_rate
 
 
-def process_server_logs(base_dir, line_counters, total_users, waiting_time,
+def process_server_logs(base_dir, log_offsets, total_users, waiting_time,
                         queue):
     """
 
     :param base_dir:        Base directory of monitor log
-    :param line_counters:   Counter for continuously reading the single log file
+    :param log_offsets:     LogOffset of each station for continuously
+                            reading the single log file
     :param total_users:     The total number of users simulated
     :param queue:           Queue to store results when using in thread
     :param waiting_time:    The measurement time
@@ -61,7 +62,7 @@ def process_server_logs(base_dir, line_counters, total_users, waiting_time,
         csparql_reader.start_tasks(target_func=process_monitor_log,
                                    name='csparql_reader',
                                    para=[base_dir, observer_addr,
-                                         line_counters[station_name]])
+                                         log_offsets[station_name]])
 
     # wait for all threads to finish and collect their results
     result_queue = csparql_reader.collect_results()
@@ -81,7 +82,7 @@ def process_server_logs(base_dir, line_counters, total_users, waiting_time,
         station_total_requests = result_dict['total_requests']
         arrival_rate = result_dict['arrival_rate']
         service_rate_para_list = result_dict['service_rate_para_list']
-        line_counter = result_dict['line_counter']
+        log_offset = result_dict['log_offset']
 
         total_requests += station_total_requests
 
@@ -93,8 +94,8 @@ def process_server_logs(base_dir, line_counters, total_users, waiting_time,
 
         service_station_metric_list.append(service_station_metric)
 
-        # update the current line counter
-        line_counters[station_name] = line_counter
+        # update the current log offset
+        log_offsets[station_name] = log_offset
 
     # now calculate service rate for each station
     for station_metric in service_station_metric_list:
@@ -138,4 +139,4 @@ def process_server_logs(base_dir, line_counters, total_users, waiting_time,
 
     # store result of this thread in result the queue
     queue.put((service_station_metric_list, total_requests))
-    queue.put(line_counters)
\ No newline at end of file
+    queue.put(log_offsets)
\ No newline at end of file
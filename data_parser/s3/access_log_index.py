@@ -0,0 +1,209 @@
+"""
+Persistent index of processed ELB access logs.
+
+Each processed log is appended as a json line holding its bucket, key, ETag
+and what was counted from it e.g. the bytes received from and sent to each
+client. Since S3 gives every version of an object its own ETag, a log found
+again e.g. after a restart is answered from the index instead of being
+downloaded and parsed again.
+
+What is counted per client depends on the client ips the log was read with,
+hence entries also carry a digest of them and only answer lookups made with
+the same clients.
+
+Only logs of recent intervals are ever looked up again, hence entries older
+than the retention are dropped when the index is loaded and while it is
+being recorded to, and the file is rewritten once most of its lines are
+dropped ones.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from etc.configuration import cfg
+
+# file of the index, relative to the working directory. Empty to not keep one
+access_log_index_path = cfg.get('s3', 'access_log_index',
+                                default='data_parser/s3/access_log_index.txt')
+# seconds entries are kept for
+access_log_index_retention = cfg.get_int('s3', 'access_log_index_retention',
+                                         default=86400)
+
+# what is kept of each log
+SUMMARY_FIELDS = ['received', 'sent', 'requests', 'slots', 'latency']
+
+
+def client_map_digest(client_ips_name_pair):
+    """
+    :param client_ips_name_pair:    Client names by their ip
+    :return:                        Digest of the mapping, the same for equal
+                                    mappings
+    """
+    return hashlib.sha1(json.dumps(sorted(client_ips_name_pair.items()))) \
+        .hexdigest()
+
+
+class AccessLogIndex(object):
+    """
+    Per client byte totals of processed access logs keyed by (bucket name,
+    key name, ETag, client map digest)
+    """
+
+    def __init__(self, file_path, retention=None):
+        """
+        :param file_path:   Path of the index, created if it does not exist
+        :param retention:   Seconds entries are kept for,
+                            [s3] access_log_index_retention by default
+        """
+        self.file_path = file_path
+        self.retention = retention or access_log_index_retention
+        self.lock = threading.Lock()
+        self.entries = dict()
+        # time each entry was recorded at
+        self.recorded = dict()
+        # lines in the file, kept entries or not
+        self.num_lines = 0
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return
+
+        oldest = time.time() - self.retention
+        with open(self.file_path, 'rb+') as f:
+            end = 0
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                end += len(line)
+                self.num_lines += 1
+
+                try:
+                    entry = json.loads(line)
+                    # entries written before clients were recorded never
+                    # match
+                    log_id = (entry.pop('bucket'), entry.pop('key'),
+                              entry.pop('etag'), entry.pop('clients', None))
+                    # entries written before times were recorded are old
+                    recorded = entry.pop('recorded', 0)
+                except (ValueError, KeyError):
+                    continue
+
+                if recorded < oldest:
+                    continue
+
+                # entries written before some summaries were kept
+                for name in SUMMARY_FIELDS:
+                    entry.setdefault(name, None)
+                self.entries[log_id] = entry
+                self.recorded[log_id] = recorded
+
+            # drop a line cut short by a crash so that appending carries on
+            # at the start of a line
+            f.truncate(end)
+
+        if self.num_lines > len(self.entries):
+            self._compact()
+
+    def _expire(self):
+        oldest = time.time() - self.retention
+        for log_id, recorded in self.recorded.items():
+            if recorded < oldest:
+                del self.entries[log_id]
+                del self.recorded[log_id]
+
+    def _compact(self):
+        """
+        Rewrite the file with the kept entries only
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for log_id, summary in self.entries.iteritems():
+                f.write(self._entry_line(log_id, summary,
+                                         self.recorded[log_id]))
+            f.flush()
+            os.fsync(f.fileno())
+
+        # a crash leaves either the old or the new file
+        os.rename(temp_path, self.file_path)
+        self.num_lines = len(self.entries)
+
+    @staticmethod
+    def _entry_line(log_id, summary, recorded):
+        entry = dict(summary)
+        bucket_name, key_name, entity_tag, clients = log_id
+        entry.update({'bucket': bucket_name, 'key': key_name,
+                      'etag': entity_tag, 'clients': clients,
+                      'recorded': recorded})
+        return json.dumps(entry) + '\n'
+
+    def lookup(self, bucket_name, key_name, entity_tag, clients):
+        """
+        :param clients: client_map_digest of the client ips
+        :return:        Summary of the log as passed to record(), summaries
+                        missing from older entries are None. None if the log
+                        has not been processed with these clients
+        """
+        with self.lock:
+            return self.entries.get((bucket_name, key_name, entity_tag,
+                                     clients))
+
+    def record(self, bucket_name, key_name, entity_tag, clients, summary):
+        """
+        Add the summary of a processed log to the index
+
+        :param clients: client_map_digest of the client ips the log was read
+                        with
+        :param summary: Dictionary of the log with
+                        'received': bytes received from each client by name,
+                        'sent': bytes sent to each client by name,
+                        'requests': requests of each client by name,
+                        'slots': rows of TrafficSlots.to_rows(),
+                        'latency': rows of LatencyHistograms.to_rows()
+        """
+        log_id = (bucket_name, key_name, entity_tag, clients)
+        recorded = time.time()
+        line = self._entry_line(log_id, summary, recorded)
+
+        with self.lock:
+            self.entries[log_id] = dict(summary)
+            self.recorded[log_id] = recorded
+            self._expire()
+
+            directory = os.path.dirname(self.file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            # most of the file is expired entries
+            if self.num_lines >= 2 * len(self.entries):
+                self._compact()
+                return
+
+            with open(self.file_path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.num_lines += 1
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_access_log_index():
+    """
+    :return: The index shared by all elbs, None if it is turned off
+    """
+    global _index
+
+    if not access_log_index_path:
+        return None
+
+    with _index_lock:
+        if not _index:
+            _index = AccessLogIndex(os.path.join(os.getcwd(),
+                                                 access_log_index_path))
+        return _index
@@ -0,0 +1,133 @@
+"""
+Per client histograms of the backend processing time of an ELB.
+
+Times span several orders of magnitude, hence bins are spaced
+logarithmically between latency_histogram_min and latency_histogram_max
+seconds. Times outside of the range fall into the first or the last bin.
+"""
+from __future__ import division
+
+import numpy
+
+from etc.configuration import cfg
+
+latency_histogram_bins = cfg.get_int('s3', 'latency_histogram_bins', 60)
+latency_histogram_min = cfg.get_float('s3', 'latency_histogram_min', 1e-5)
+latency_histogram_max = cfg.get_float('s3', 'latency_histogram_max', 100)
+
+
+class LatencyHistograms(object):
+    """
+    Histogram of backend processing times of each client through one station
+    """
+
+    def __init__(self, client_names, num_bins=latency_histogram_bins,
+                 min_time=latency_histogram_min,
+                 max_time=latency_histogram_max):
+        """
+        :param client_names:    Names of clients, in the order of client
+                                indices passed to add()
+        :param num_bins:        Number of bins
+        :param min_time:        Upper edge of the first bin in seconds
+        :param max_time:        Lower edge of the last bin in seconds
+        """
+        self.client_names = list(client_names)
+        self.edges = numpy.logspace(numpy.log10(min_time),
+                                    numpy.log10(max_time), num_bins - 1)
+        self.counts = numpy.zeros((len(self.client_names), num_bins),
+                                  dtype=numpy.int64)
+        # sum of times of each client, for the mean
+        self.sums = numpy.zeros(len(self.client_names))
+
+    def add(self, clients, times):
+        """
+        :param clients: numpy array of client indices of requests
+        :param times:   numpy array of backend processing times in seconds,
+                        negative ones i.e. requests the backend did not get
+                        are left out
+        """
+        answered = times >= 0
+        clients, times = clients[answered], times[answered]
+        if not len(clients):
+            return
+
+        num_bins = self.counts.shape[1]
+        bins = numpy.searchsorted(self.edges, times, side='right')
+        self.counts += numpy.bincount(clients * num_bins + bins,
+                                      minlength=self.counts.size) \
+            .reshape(self.counts.shape)
+        self.sums += numpy.bincount(clients, weights=times,
+                                    minlength=len(self.client_names))
+
+    def merge(self, other):
+        """
+        Add the counts of other, which has the same bins
+        """
+        if other.client_names == self.client_names:
+            self.counts += other.counts
+            self.sums += other.sums
+            return
+
+        client_index = dict((c_name, i)
+                            for i, c_name in enumerate(self.client_names))
+        for i, c_name in enumerate(other.client_names):
+            if c_name in client_index:
+                self.counts[client_index[c_name]] += other.counts[i]
+                self.sums[client_index[c_name]] += other.sums[i]
+
+    def to_rows(self):
+        """
+        :return: [client name, sum of times, counts of bins] of every client
+                 with requests, e.g. to be saved as json
+        """
+        return [[c_name, float(self.sums[i]),
+                 [int(count) for count in self.counts[i]]]
+                for i, c_name in enumerate(self.client_names)
+                if self.counts[i].any()]
+
+    def add_rows(self, rows):
+        """
+        Add histograms saved by to_rows()
+        """
+        client_index = dict((c_name, i)
+                            for i, c_name in enumerate(self.client_names))
+        for c_name, time_sum, counts in rows:
+            if c_name in client_index and \
+                    len(counts) == self.counts.shape[1]:
+                self.counts[client_index[c_name]] += counts
+                self.sums[client_index[c_name]] += time_sum
+
+    def quantile(self, client_name, q):
+        """
+        :param client_name: Name of the client
+        :param q:           Quantile between 0 and 1 e.g. 0.95
+        :return:            Estimated time in seconds, geometric middle of
+                            the bin the quantile falls into. None if there
+                            were no requests
+        """
+        counts = self.counts[self.client_names.index(client_name)]
+        total = counts.sum()
+        if not total:
+            return None
+
+        k = int(numpy.searchsorted(numpy.cumsum(counts), q * total))
+        k = min(k, len(counts) - 1)
+
+        # the first and the last bin are bounded by their inner edge only
+        lower = self.edges[max(k - 1, 0)]
+        upper = self.edges[min(k, len(self.edges) - 1)]
+        return float(numpy.sqrt(lower * upper))
+
+    def summary(self):
+        """
+        :return: {client name: (requests, mean, median, 95th percentile)} of
+                 clients with requests, times in seconds
+        """
+        results = dict()
+        for i, c_name in enumerate(self.client_names):
+            requests = int(self.counts[i].sum())
+            if requests:
+                results[c_name] = (requests, float(self.sums[i] / requests),
+                                   self.quantile(c_name, 0.5),
+                                   self.quantile(c_name, 0.95))
+        return results
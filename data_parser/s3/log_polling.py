@@ -0,0 +1,180 @@
+"""
+Scheduling of S3 listings while waiting for ELB access logs.
+
+S3 delivers the access log of an interval some time after the interval ends
+and the delay of each ELB tends to be alike from one interval to the next.
+LogPollingScheduler learns the delays observed for an ELB and tells when to
+list the bucket: not before the predicted arrival, densely around it and less
+and less often afterwards. It also tells when the logs of an interval are
+complete, since an ELB delivers one log per node and the number of nodes is
+not known.
+"""
+from __future__ import division
+import collections
+import threading
+from datetime import datetime, timedelta
+
+from etc.configuration import get_settings
+
+# [s3] settings used:
+# log_polling_interval: longest time between listings
+# dense_polling_interval: seconds between listings around the predicted
+#     arrival of logs
+# polling_lead_time: seconds before the earliest predicted arrival at which
+#     listing starts, and after the latest one at which it ends
+# polling_history: number of delivery delays an elb prediction is based on
+
+# listings at most between the earliest and the latest predicted arrival
+POLLS_PER_WINDOW = 6
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[int(round(q * (len(values) - 1)))]
+
+
+class LogPollingScheduler(object):
+    """
+    Learns the delay between the end of a logging interval and the delivery
+    of its access logs for one ELB
+    """
+
+    def __init__(self, history=None):
+        """
+        :param history: Number of recent delays the prediction is based on,
+                        [s3] polling_history by default
+        """
+        self.delays = collections.deque(
+            maxlen=history or get_settings().polling_history)
+
+    def record_delay(self, delay):
+        """
+        :param delay:   Seconds between the end of a logging interval and
+                        the time one of its logs was found
+        """
+        self.delays.append(max(0, delay))
+
+    def arrival_window(self):
+        """
+        :return: (earliest, latest) seconds after the end of a logging
+                 interval its logs are expected at, None until a delay is
+                 recorded
+        """
+        if not self.delays:
+            return None
+
+        return _quantile(self.delays, 0.1), _quantile(self.delays, 0.9)
+
+    def time_before_window(self, due_time, now=None):
+        """
+        :param due_time:    UTC end time of the logging interval waited for
+        :param now:         Current UTC time
+        :return:            Seconds until listing is worth starting
+        """
+        window = self.arrival_window()
+        if not window:
+            return 0
+
+        now = now or datetime.utcnow()
+        elapsed = (now - due_time).total_seconds()
+
+        return max(0, window[0] - get_settings().polling_lead_time - elapsed)
+
+    def listing_end(self, due_time, first_found):
+        """
+        :param due_time:    UTC end time of the logging interval
+        :param first_found: UTC time the first log of the interval was found
+        :return:            UTC time after which no more logs of the interval
+                            are expected: polling_lead_time after the latest
+                            predicted arrival, but not before
+                            polling_lead_time after the first log was found
+        """
+        lead_time = timedelta(seconds=get_settings().polling_lead_time)
+        end = first_found + lead_time
+
+        window = self.arrival_window()
+        if window:
+            end = max(end, due_time + timedelta(seconds=window[1]) + lead_time)
+
+        return end
+
+    def interval_complete(self, due_time, first_found, now=None):
+        """
+        :param due_time:    UTC end time of the logging interval
+        :param first_found: UTC time the first log of the interval was found,
+                            None if none has been found yet
+        :param now:         Current UTC time
+        :return:            Whether listing the interval can stop
+        """
+        if first_found is None:
+            return False
+
+        now = now or datetime.utcnow()
+        return now >= self.listing_end(due_time, first_found)
+
+    def next_poll_delay(self, due_time, now=None, first_found=None):
+        """
+        :param due_time:    UTC end time of the logging interval waited for
+        :param now:         Current UTC time
+        :param first_found: UTC time the first log of the interval was found,
+                            if any. The interval is listed once more when it
+                            is complete rather than after a longer delay
+        :return:            Seconds to sleep before the next listing
+        """
+        now = now or datetime.utcnow()
+        delay = self._poll_delay(due_time, now)
+
+        if first_found is not None:
+            remaining = (self.listing_end(due_time, first_found) -
+                         now).total_seconds()
+            delay = min(delay, max(0, remaining))
+
+        return delay
+
+    def _poll_delay(self, due_time, now):
+        settings = get_settings()
+        log_polling_interval = settings.log_polling_interval
+
+        window = self.arrival_window()
+        if not window:
+            # nothing learnt yet, poll as regularly as before
+            return log_polling_interval
+
+        elapsed = (now - due_time).total_seconds()
+
+        earliest, latest = window
+        window_start = earliest - settings.polling_lead_time
+        window_end = latest + settings.polling_lead_time
+
+        if elapsed < window_start:
+            return window_start - elapsed
+
+        # a window spread by varying delays is covered by a fixed number of
+        # listings rather than listing every dense_polling_interval
+        window_interval = max(settings.dense_polling_interval,
+                              (window_end - window_start) / POLLS_PER_WINDOW)
+
+        if elapsed <= window_end:
+            return window_interval
+
+        # back off exponentially once logs are later than usual
+        overdue = elapsed - window_end
+        delay = window_interval
+        while delay < overdue and delay < log_polling_interval:
+            delay *= 2
+
+        return min(delay, log_polling_interval)
+
+
+_schedulers = dict()
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(elb_name):
+    """
+    :return: The scheduler of the elb, kept across measurement intervals
+    """
+    with _schedulers_lock:
+        if elb_name not in _schedulers:
+            _schedulers[elb_name] = LogPollingScheduler()
+        return _schedulers[elb_name]
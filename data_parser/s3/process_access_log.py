@@ -1,29 +1,216 @@
 from __future__ import division
+import calendar
 import os
 import time
+from datetime import datetime
+import Queue
 
+import numpy
+
+from action.s3.bucket import Bucket
+from action.s3.key import Key, LineBlockSplitter
+from connection.async_http import EventLoop
+from connection.async_s3_connection import AsyncS3Connection
 from connection.s3_connection import S3Connection
-from etc.configuration import cfg
-from utilities.multi_threading import ThreadingManager
+from data_parser.s3.access_log_index import get_access_log_index, \
+    client_map_digest
+from data_parser.s3.latency_histogram import LatencyHistograms
+from data_parser.s3.log_polling import get_scheduler
+from data_parser.s3.traffic_slots import TrafficSlots
+from etc.configuration import cfg, log
+from utilities.mapped_file import find_all, locate_separators, \
+    field_bounds, gather, parse_integers, parse_floats
+from utilities.multi_threading import ThreadingManager, ThreadPoolManager
 from utilities.utils import print_message, get_expected_num_logs, \
     get_next_nth_elb_log_time, get_available_clients, station_metadata_map
 
 
-log_polling_interval = cfg.get_int('s3', 'log_polling_interval', 60)
+# whether to save a copy of each access log while it is being processed
+keep_access_logs = cfg.get_bool('s3', 'keep_access_logs')
+
+# minimum number of bytes of access logs processed at a time
+access_log_batch_bytes = cfg.get_int('s3', 'access_log_batch_bytes',
+                                     4 * 1024 * 1024)
+
+# maximum number of access logs downloaded and processed at the same time
+# per elb
+max_download_workers = cfg.get_int('s3', 'max_download_workers', 4)
+
+# 'threads' to poll each elb in its own thread, 'event_loop' to poll and
+# download the logs of all elbs on one event loop
+fetch_engine = cfg.get('s3', 'fetch_engine', default='threads')
 
 log_file_dir = os.getcwd() + '/data_parser/s3/elb_access_logs/'
 
 
-class DataAccumulatorManager(ThreadingManager):
+def request_times(block, starts, ends):
     """
-    Class that manage all thread that reading data from logs
+    :param block:   Block of access log lines
+    :param starts:  Starts of the timestamps to convert
+    :param ends:    Ends of the timestamps
+    :return:        (numpy array of request times of the lines in seconds
+                    since the epoch with fractions of seconds left out, mask
+                    of the lines whose timestamp could be read)
+    """
+    # timestamps look like 2014-02-15T23:39:43.945958Z
+    valid = ends - starts >= 19
+    digits = numpy.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])
+    chars = block.take(starts[:, None] + digits, mode='clip')
+    valid &= ((chars >= ord('0')) & (chars <= ord('9'))).all(axis=1)
+
+    # dates are few hence converted one by one
+    dates, date_idx = numpy.unique(gather(block, starts, starts + 10),
+                                   return_inverse=True)
+    days = []
+    for date in dates.tolist():
+        try:
+            days.append(calendar.timegm(time.strptime(date, '%Y-%m-%d')))
+        except ValueError:
+            days.append(-1)
+    days = numpy.array(days, dtype=numpy.int64)
+
+    times = days[date_idx]
+    valid &= times >= 0
+
+    chars = chars[:, 8:].astype(numpy.int64) - ord('0')
+    times += (chars[:, 0] * 10 + chars[:, 1]) * 3600 + \
+        (chars[:, 2] * 10 + chars[:, 3]) * 60 + chars[:, 4] * 10 + chars[:, 5]
+
+    return times, valid
+
+
+class ClientTrafficAccumulator(object):
+    """
+    Sums up the bytes received from and sent to each client in ELB access
+    logs.
+
+    Access logs are processed a block of lines at a time. Fields are located
+    with vectorised byte searches and converted and summed up per client with
+    numpy, hence no python string is built per line
+    """
+
+    def __init__(self, client_ips_name_pair):
+        """
+        :param client_ips_name_pair:    Client names by their ip
+        """
+        self.client_ips_name_pair = client_ips_name_pair
+        self.client_names = sorted(set(client_ips_name_pair.values()))
+        self.client_index = dict((c_name, i)
+                                 for i, c_name in
+                                 enumerate(self.client_names))
+
+        self.received = [0] * len(self.client_names)
+        self.sent = [0] * len(self.client_names)
+        self.requests = [0] * len(self.client_names)
+
+        # traffic of each client over time
+        self.slots = TrafficSlots(self.client_names)
+        # backend processing time of requests of each client
+        self.latency = LatencyHistograms(self.client_names)
+
+    def add_block(self, data):
+        """
+        :param data:    Complete lines of an access log, the last one does not
+                        need to end with a line break
+        """
+        # example log entry (no line break):
+        # 2014-02-15T23:39:43.945958Z my-test-loadbalancer
+        # 192.168.131.39:2817 10.0.0.0.1 0.000073 0.001048 0.000057
+        # 200 200 0 29 "GET http://www.example.com:80/HTTP/1.1"
+        if not data.endswith('\n'):
+            data += '\n'
+        block = numpy.frombuffer(data, dtype=numpy.uint8)
+
+        ends = find_all(block, '\n')
+        starts = numpy.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+
+        spaces = find_all(block, ' ')
+        first, count = locate_separators(spaces, starts, ends)
+
+        # lines need at least 11 fields
+        keep = count >= 10
+        starts, ends, first, count = \
+            starts[keep], ends[keep], first[keep], count[keep]
+        if not len(starts):
+            return
+
+        # ip is the part of the client field before the port
+        client_starts, client_ends = field_bounds(spaces, first, count,
+                                                  starts, ends, 2)
+        colons = find_all(block, ':')
+        if len(colons):
+            next_colons = colons.take(
+                numpy.searchsorted(colons, client_starts), mode='clip')
+            has_port = (next_colons >= client_starts) & \
+                (next_colons < client_ends)
+            client_ends = numpy.where(has_port, next_colons, client_ends)
+
+        ips, ip_idx = numpy.unique(gather(block, client_starts, client_ends),
+                                   return_inverse=True)
+
+        # occasionally we got ip not from any clients
+        ip_clients = numpy.array(
+            [self.client_index.get(self.client_ips_name_pair.get(ip), -1)
+             for ip in ips.tolist()], dtype=int)
+        clients = ip_clients[ip_idx]
+
+        from_clients = clients >= 0
+        if not from_clients.any():
+            return
+
+        starts, ends, first, count, clients = \
+            starts[from_clients], ends[from_clients], first[from_clients], \
+            count[from_clients], clients[from_clients]
+
+        columns = []
+        for totals, k in [(self.received, 9), (self.sent, 10)]:
+            values = parse_integers(block, *field_bounds(spaces, first, count,
+                                                         starts, ends, k))
+            sums = numpy.bincount(clients, weights=values,
+                                  minlength=len(self.client_names))
+            for i in numpy.flatnonzero(sums):
+                totals[i] += int(round(sums[i]))
+            columns.append(values)
+
+        # one line per request
+        requests = numpy.bincount(clients, minlength=len(self.client_names))
+        for i in numpy.flatnonzero(requests):
+            self.requests[i] += int(requests[i])
+
+        # lines whose timestamp cannot be read only count towards totals
+        times, valid = request_times(block, *field_bounds(spaces, first, count,
+                                                          starts, ends, 0))
+        self.slots.add(clients[valid], times[valid],
+                       *[values[valid] for values in columns])
+
+        self.latency.add(clients, parse_floats(
+            block, *field_bounds(spaces, first, count, starts, ends, 5)))
+
+    def results(self):
+        """
+        :return: (bytes received from, bytes sent to, requests of) each
+                 client by name
+        """
+        return dict(zip(self.client_names, self.received)), \
+            dict(zip(self.client_names, self.sent)), \
+            dict(zip(self.client_names, self.requests))
+
+
+class DataAccumulatorManager(ThreadPoolManager):
+    """
+    Class that manage all thread that reading data from logs. Logs are
+    downloaded and read by at most max_download_workers threads, each of which
+    keeps its connection to the bucket host open between logs
     """
 
     def __init__(self):
-        ThreadingManager.__init__(self)
+        ThreadPoolManager.__init__(self, max_download_workers)
         self.data_sum = 0
         self.client_sent = dict()
         self.client_receive = dict()
+        self.client_requests = dict()
         self.available_client = get_available_clients()
 
         self.client_ips_name_pair = dict()
@@ -33,94 +220,189 @@ class DataAccumulatorManager(ThreadingManager):
             # initialisation
             self.client_sent.update({client_name: 0})
             self.client_receive.update({client_name: 0})
+            self.client_requests.update({client_name: 0})
 
         self.total_sent = 0
         self.total_receive = 0
 
-    def read_log(self, key, log_file_path, queue):
-
-        client_in_dict = dict()
-        client_out_dict = dict()
-
-        for client_name in self.available_client:
-            self.client_ips_name_pair.update(
-                {station_metadata_map['ip'][client_name]: client_name})
-            # initialisation
-            client_in_dict.update({client_name: 0})
-            client_out_dict.update({client_name: 0})
-
-        # download the log content
-        with open(log_file_path, 'w') as fp:
-            key.get_contents_to_file(fp)
-
-        # read log content
-        total_sent = 0
-        total_receive = 0
-        with open(log_file_path, 'r') as lf:
-            line = 1  # enable the loop
-            while line:
-                line = lf.readline()
-                # example log entry (no line break):
-                # 2014-02-15T23:39:43.945958Z my-test-loadbalancer
-                # 192.168.131.39:2817 10.0.0.0.1 0.000073 0.001048 0.000057
-                # 200 200 0 29 "GET http://www.example.com:80/HTTP/1.1"
-
-                split_str = line.split(' ')
-
-                if len(split_str) < 11:
-                    continue
-
-                # ip -> name -> record data for each name
-                client_ip = split_str[2].split(":")[0]
-                # occasionally we got ip not from any clients
-                # Suspicious...
-                if client_ip not in self.client_ips_name_pair.keys():
-                    continue
-
-                c_name = self.client_ips_name_pair[client_ip]
-
-                received_byte = int(split_str[9])
-                sent_byte = int(split_str[10])
-
-                client_in_dict[c_name] += received_byte
-                client_out_dict[c_name] += sent_byte
+        # traffic of each client over time
+        self.traffic = TrafficSlots(sorted(self.available_client))
+        # backend processing time of requests of each client
+        self.latency = LatencyHistograms(self.traffic.client_names)
+
+        # (bucket name, key name, etag) of the logs counted so far
+        self.counted_logs = set()
+        self.index = get_access_log_index()
+        # indexed results only hold for the same client ips
+        self.clients_digest = client_map_digest(self.client_ips_name_pair)
+
+    def new_accumulator(self):
+        """
+        :return: ClientTrafficAccumulator for reading one access log
+        """
+        return ClientTrafficAccumulator(self.client_ips_name_pair)
+
+    def claim(self, key):
+        """
+        :param key: Key of an access log
+        :return:    False if the log has been counted already
+        """
+        log_id = (key.bucket.name, key.name, key.entity_tag)
+        if log_id in self.counted_logs:
+            return False
+        self.counted_logs.add(log_id)
+        return True
+
+    def indexed_results(self, key):
+        """
+        :param key: Key of an access log
+        :return:    Results of the log as put in the queue by read_log, None
+                    if the log is not in the index
+        """
+        summary = None
+        if self.index and key.entity_tag:
+            summary = self.index.lookup(key.bucket.name, key.name,
+                                        key.entity_tag, self.clients_digest)
+
+        # logs indexed before requests were counted are read again
+        if not summary or summary['requests'] is None:
+            return None
+
+        print_message('%s answered from the access log index' % key.name)
+
+        slots = TrafficSlots(self.traffic.client_names)
+        slots.add_rows(summary['slots'] or [])
+        latency = LatencyHistograms(self.latency.client_names)
+        latency.add_rows(summary['latency'] or [])
+        return summary['received'], summary['sent'], summary['requests'], \
+            slots, latency
+
+    def log_results(self, key, accumulator):
+        """
+        Add the results of a read access log to the index
+
+        :param key:         Key of the access log
+        :param accumulator: ClientTrafficAccumulator the log was read into
+        :return:            Results of the log as put in the queue by
+                            read_log
+        """
+        client_in_dict, client_out_dict, client_requests = \
+            accumulator.results()
+
+        if self.index and key.entity_tag:
+            self.index.record(key.bucket.name, key.name, key.entity_tag,
+                              self.clients_digest,
+                              {'received': client_in_dict,
+                               'sent': client_out_dict,
+                               'requests': client_requests,
+                               'slots': accumulator.slots.to_rows(),
+                               'latency': accumulator.latency.to_rows()})
+
+        return client_in_dict, client_out_dict, client_requests, \
+            accumulator.slots, accumulator.latency
+
+    def add_log(self, key, log_file_path):
+        """
+        Count an access log once. Logs found in the index are answered from
+        it, others are handed to a worker to be downloaded and read
+
+        :param key:             Key of the access log
+        :param log_file_path:   Path the log is saved to, None to not keep
+                                a local copy
+        :return:                False if the log has been counted already
+        """
+        if not self.claim(key):
+            return False
+
+        results = self.indexed_results(key)
+        if results:
+            self.queue.put(results)
+        else:
+            # download and process the each log file simultaneously
+            self.start_tasks(self.read_log, 'data_accumulator',
+                             (key, log_file_path))
 
-                total_receive += received_byte
-                total_sent += sent_byte
+        return True
 
-        queue.put((client_in_dict, client_out_dict))
+    def read_log(self, key, log_file_path, queue):
+        """
+        Accumulate the amount of data of each client in an access log while
+        it is being downloaded
+
+        :param key:             Key of the access log
+        :param log_file_path:   Path the log is saved to, None to not keep
+                                a local copy
+        :param queue:           Queue that stores the results
+        """
+        accumulator = self.new_accumulator()
+
+        # read log content while downloading it
+        fp = None
+        if log_file_path:
+            fp = open(log_file_path, 'w')
+        try:
+            for block in key.iter_line_blocks(fp, access_log_batch_bytes):
+                accumulator.add_block(block)
+        finally:
+            if fp:
+                fp.close()
+
+        queue.put(self.log_results(key, accumulator))
+
+    def add_results(self, results):
+        """
+        Add the results of one access log to the totals
+
+        :param results: Results of the log as put in the queue by read_log
+        """
+        c_sent, c_receive, c_requests, slots, latency = results
+
+        self.traffic.merge(slots)
+        self.latency.merge(latency)
+
+        for c_name, data_sent in c_sent.iteritems():
+            self.client_sent[c_name] += data_sent
+
+        for c_name, data_received in c_receive.iteritems():
+            self.client_receive[c_name] += data_received
+
+        for c_name, requests in c_requests.iteritems():
+            self.client_requests[c_name] += requests
 
     def collect_results(self):
         queue = super(DataAccumulatorManager, self).collect_results()
         while not queue.empty():
-            c_sent, c_receive = queue.get()
-
-            for c_name, data_sent in c_sent.iteritems():
-                self.client_sent[c_name] += data_sent
-
-            for c_name, data_received in c_receive.iteritems():
-                self.client_receive[c_name] += data_received
+            self.add_results(queue.get())
 
 
-def calculate_key_prefix(elb_region, elb_name, last_expected_time):
-    """Function that calculate the prefix for bucket key searching
-
-    :param elb_region:
-    :param elb_name:
-    :return:
+def access_log_path(bucket_name, key_name):
     """
-    print_message('Retrieving access log for %s ...' % elb_name)
+    :return: Path the local copy of an access log is saved to, its
+             directory is created if needed
+    """
+    # compose log file directory
+    segment = key_name.split('/')
+    log_file_name = segment[len(segment) - 1]
+    log_file_path_dir = log_file_dir + bucket_name
 
-    next_expected_time, max_waiting_time\
-        = get_next_nth_elb_log_time(1, last_expected_time)
+    if not os.path.exists(log_file_path_dir):
+        os.makedirs(log_file_path_dir)
+
+    return log_file_path_dir + '/' + log_file_name
 
-    last_expected_time = next_expected_time
 
-    year, month, day, hour, minute = next_expected_time.year, \
-                                     next_expected_time.month, \
-                                     next_expected_time.day, \
-                                     next_expected_time.hour, \
-                                     next_expected_time.minute
+def elb_log_key_prefix(elb_region, elb_name, log_time):
+    """
+    :param elb_region:  Region of the elastic load balancer
+    :param elb_name:    Name of the elastic load balancer
+    :param log_time:    End time of the logging interval
+    :return:            Prefix of the keys of access logs of the interval
+    """
+    year, month, day, hour, minute = log_time.year, \
+                                     log_time.month, \
+                                     log_time.day, \
+                                     log_time.hour, \
+                                     log_time.minute
 
     # convert month, day, hour and minute to 2 digit representation
     month = '%02d' % month
@@ -135,11 +417,28 @@ def calculate_key_prefix(elb_region, elb_name, last_expected_time):
     load_balancer_name = elb_name
     end_time = time_str
 
-    key_prefix = 'AWSLogs/{0}/elasticloadbalancing/{1}/{2}/{3}/{4}/{5}' \
-                 '_elasticloadbalancing_{6}_{7}_{8}' \
+    return 'AWSLogs/{0}/elasticloadbalancing/{1}/{2}/{3}/{4}/{5}' \
+           '_elasticloadbalancing_{6}_{7}_{8}' \
         .format(aws_account_id, region, year, month, day,
                 aws_account_id, region, load_balancer_name, end_time)
 
+
+def calculate_key_prefix(elb_region, elb_name, last_expected_time):
+    """Function that calculate the prefix for bucket key searching
+
+    :param elb_region:
+    :param elb_name:
+    :return:
+    """
+    print_message('Retrieving access log for %s ...' % elb_name)
+
+    next_expected_time, max_waiting_time\
+        = get_next_nth_elb_log_time(1, last_expected_time)
+
+    last_expected_time = next_expected_time
+
+    key_prefix = elb_log_key_prefix(elb_region, elb_name, next_expected_time)
+
     request_headers = {'prefix': unicode(key_prefix), 'delimiter': '.log'}
 
     return request_headers, max_waiting_time, last_expected_time
@@ -161,15 +460,29 @@ def process_access_log(bucket, elb_region, elb_name):
                         access logs are being retrieved
     :param elb_name:    name of the elastic load balancer
     :return:            total amount of data being processed by the elb
-                        during the measurement interval
+                        and number of requests of each client during the
+                        measurement interval, its TrafficSlots over time and
+                        LatencyHistograms of backend processing time
     """
 
     if not bucket:
         print 'S3 bucket object required'
         return
 
-    # Start new threads for downloading and reading each matching log file
+    # Start worker threads for downloading and reading matching log files
     data_accumulator = DataAccumulatorManager()
+    try:
+        return _process_access_log(bucket, elb_region, elb_name,
+                                   data_accumulator)
+    finally:
+        data_accumulator.shutdown()
+
+
+def _process_access_log(bucket, elb_region, elb_name, data_accumulator):
+    """
+    Content of process_access_log, logs are handed to the workers of
+    data_accumulator
+    """
 
     # record the start time to calculate time elapsed
     # start_time = time.time()
@@ -189,6 +502,9 @@ def process_access_log(bucket, elb_region, elb_name):
     # expected number of logs that matches measurement interval
     need_to_stop = False
 
+    # learns when logs of the elb are delivered
+    scheduler = get_scheduler(elb_name)
+
     # check whether the it has reached the end of measurement interval
     # while (time.time() - start_time) / 60 <= m_interval:
     while logs_obtained < expected_logs_to_obtain and not need_to_stop:
@@ -201,19 +517,42 @@ def process_access_log(bucket, elb_region, elb_name):
         # logging interval (e.g 5 min) we need to recalculate the next
         # expected log name
         time_counter = 0
-        # Wait for polling interval while the log is not available
-        while not matching_keys or len(matching_keys) < 2:
+
+        # end of the logging interval whose logs are waited for
+        due_time = last_expected_time.replace(second=0, microsecond=0)
+
+        # no listing until shortly before logs usually arrive
+        wait_time = min(scheduler.time_before_window(due_time),
+                        max_waiting_time)
+        if wait_time > 0:
+            print_message('Waiting %d seconds for log to be emitted ...'
+                          % wait_time)
+            time.sleep(wait_time)
+            time_counter += wait_time
+
+        # UTC time the first log of the interval was found at
+        first_found = None
+
+        # Wait for polling interval until the logs of every node of the elb
+        # are expected to have arrived
+        while True:
 
             print_message('')
             print_message('Searching for bucket key(s) that start with: %s'
                           % request_headers['prefix'])
-            matching_keys = bucket.search_key(parameters=request_headers)
-
-            if matching_keys:
-                for m_key in matching_keys:
-                    print_message('Found %s' % m_key)
-                if len(matching_keys) > 1:
-                    break
+            # keys found by previous polls are left out
+            new_keys = list(bucket.list_new_keys(request_headers))
+            matching_keys.extend(new_keys)
+
+            now = datetime.utcnow()
+            for m_key in new_keys:
+                print_message('Found %s' % m_key)
+                scheduler.record_delay((now - due_time).total_seconds())
+            if new_keys and first_found is None:
+                first_found = now
+
+            if scheduler.interval_complete(due_time, first_found, now):
+                break
 
             print_message('Time elapsed since current searching: %s min(s)'
                           % (time_counter / 60))
@@ -225,6 +564,10 @@ def process_access_log(bucket, elb_region, elb_name):
             # The next expected minus should be re calculated base on its
             # last value i.e the last "next expected minus"
             if time_counter > max_waiting_time:
+                # the logs found so far are still counted
+                if matching_keys:
+                    break
+
                 # Generally if waiting time exceed the maximum time
                 # calculated there could either be some error during ELB
                 # access log omission in S3 in which case the waiting time is
@@ -233,32 +576,32 @@ def process_access_log(bucket, elb_region, elb_name):
                 need_to_stop = True
                 break
 
+            poll_delay = scheduler.next_poll_delay(due_time, now, first_found)
             print_message('Waiting for log to be emitted (polling interval %s '
-                          'seconds) ...\n' % log_polling_interval)
+                          'seconds) ...\n' % poll_delay)
+
+            time.sleep(poll_delay)
+            time_counter += poll_delay
 
-            time.sleep(log_polling_interval)
-            time_counter += log_polling_interval
+        bucket.forget_keys(request_headers['prefix'])
 
         if need_to_stop:
             break
 
         for key_name in matching_keys:
             key = bucket.get_key(key_name=key_name)
+            # get_key returns (None, response) for a key that has gone
+            # since it was listed
+            if not isinstance(key, Key):
+                print_message('Metadata of %s could not be read' % key_name)
+                continue
 
-            # compose log file directory
-            segment = key_name.split('/')
-            log_file_name = segment[len(segment) - 1]
-            log_file_path_dir = log_file_dir + bucket.name
-
-            if not os.path.exists(log_file_path_dir):
-                os.makedirs(log_file_path_dir)
+            log_file_path = None
+            if keep_access_logs:
+                log_file_path = access_log_path(bucket.name, key_name)
 
-            log_file_path = log_file_path_dir + '/' + log_file_name
-
-            # download and process the each log file simultaneously
-            data_accumulator.start_tasks(data_accumulator.read_log,
-                                         'data_accumulator',
-                                         (key, log_file_path))
+            if not data_accumulator.add_log(key, log_file_path):
+                print_message('%s has been counted already' % key_name)
 
         # Collect results from each threads
         data_accumulator.collect_results()
@@ -274,7 +617,245 @@ def process_access_log(bucket, elb_region, elb_name):
         print_message('Access log of \'%s\' obtained so far : %s\n'
                       % (elb_name, logs_obtained))
 
-    return data_accumulator.client_sent, data_accumulator.client_receive
+    return data_accumulator.client_sent, data_accumulator.client_receive, \
+        data_accumulator.client_requests, data_accumulator.traffic, \
+        data_accumulator.latency
+
+
+class ElbLogCollector(object):
+    """
+    Event loop counterpart of process_access_log. Polls the bucket of one elb
+    and downloads its logs with requests queued on the event loop of
+    connection instead of blocking a thread, so that the logs of all elbs are
+    collected concurrently by one thread
+    """
+
+    def __init__(self, connection, bucket_name, elb_region, elb_name,
+                 result_queue):
+        """
+        :param connection:      AsyncS3Connection shared by all elbs
+        :param bucket_name:     Name of the bucket that stores the access
+                                logs of the elb
+        :param elb_region:      Region of the elastic load balancer
+        :param elb_name:        Name of the elastic load balancer
+        :param result_queue:    Queue the results are put in as by
+                                counting_elb_data
+        """
+        self.connection = connection
+        self.loop = connection.loop
+        self.bucket = Bucket(connection, bucket_name)
+        self.elb_region = elb_region
+        self.elb_name = elb_name
+        self.result_queue = result_queue
+
+        self.data_accumulator = DataAccumulatorManager()
+        self.scheduler = get_scheduler(elb_name)
+
+        self.logs_obtained = 0
+        self.expected_logs_to_obtain = get_expected_num_logs()
+        self.last_expected_time = None
+
+    def start(self):
+        self._next_log()
+
+    def _next_log(self):
+        if self.logs_obtained >= self.expected_logs_to_obtain:
+            self._finish()
+            return
+
+        self.request_headers, self.max_waiting_time, \
+            self.last_expected_time = calculate_key_prefix(
+                self.elb_region, self.elb_name, self.last_expected_time)
+
+        self.matching_keys = []
+        self.first_found = None
+        self.time_counter = 0
+        self.due_time = self.last_expected_time.replace(second=0,
+                                                        microsecond=0)
+
+        # no listing until shortly before logs usually arrive
+        wait_time = min(self.scheduler.time_before_window(self.due_time),
+                        self.max_waiting_time)
+        if wait_time > 0:
+            print_message('Waiting %d seconds for log of \'%s\' to be '
+                          'emitted ...' % (wait_time, self.elb_name))
+            self.time_counter += wait_time
+            self.loop.call_later(wait_time, self._poll)
+        else:
+            self._poll()
+
+    def _poll(self):
+        print_message('Searching for bucket key(s) that start with: %s'
+                      % self.request_headers['prefix'])
+
+        # the whole prefix is listed every time since logs delivered later
+        # can sort before those found already, see Bucket.list_new_keys
+        self.connection.list_keys(self.bucket.name,
+                                  dict(self.request_headers), self._on_keys)
+
+    def _on_keys(self, keys, error):
+        if error is not None:
+            print_message('Listing access logs of \'%s\' failed: %s'
+                          % (self.elb_name, error))
+            self._finish()
+            return
+
+        # keys found by previous polls are left out
+        new_keys = [key_name for key_name in keys
+                    if key_name not in self.matching_keys]
+        self.matching_keys.extend(new_keys)
+
+        now = datetime.utcnow()
+        for m_key in new_keys:
+            print_message('Found %s' % m_key)
+            self.scheduler.record_delay((now - self.due_time).total_seconds())
+        if new_keys and self.first_found is None:
+            self.first_found = now
+
+        # see _process_access_log
+        if self.scheduler.interval_complete(self.due_time, self.first_found,
+                                            now):
+            self._fetch_keys()
+            return
+
+        print_message('Time elapsed since current searching: %s min(s)'
+                      % (self.time_counter / 60))
+
+        if self.time_counter > self.max_waiting_time:
+            if self.matching_keys:
+                self._fetch_keys()
+            else:
+                self._finish()
+            return
+
+        poll_delay = self.scheduler.next_poll_delay(self.due_time, now,
+                                                    self.first_found)
+        print_message('Waiting for log of \'%s\' to be emitted (polling '
+                      'interval %s seconds) ...\n'
+                      % (self.elb_name, poll_delay))
+        self.time_counter += poll_delay
+        self.loop.call_later(poll_delay, self._poll)
+
+    def _fetch_keys(self):
+        self.keys_pending = len(self.matching_keys)
+        for key_name in self.matching_keys:
+            self.connection.get_key(
+                self.bucket, key_name,
+                lambda key, error, key_name=key_name:
+                self._on_key(key_name, key, error))
+
+    def _on_key(self, key_name, key, error):
+        try:
+            downloading = self._count_key(key_name, key, error)
+        except Exception:
+            # the key is still done with, otherwise the elb never finishes
+            log.exception('Counting %s failed' % key_name)
+            downloading = False
+
+        if not downloading:
+            self._key_done()
+
+    def _count_key(self, key_name, key, error):
+        """
+        :return: Whether the log is being downloaded, _key_done is called
+                 once it has been counted then
+        """
+        if error is not None or key is None:
+            print_message('Metadata of %s could not be read: %s'
+                          % (key_name, error))
+            return False
+
+        if not self.data_accumulator.claim(key):
+            print_message('%s has been counted already' % key_name)
+            return False
+
+        results = self.data_accumulator.indexed_results(key)
+        if results:
+            self.data_accumulator.add_results(results)
+            return False
+
+        # read log content while downloading it
+        accumulator = self.data_accumulator.new_accumulator()
+        splitter = LineBlockSplitter(access_log_batch_bytes)
+        fp = None
+        if keep_access_logs:
+            fp = open(access_log_path(self.bucket.name, key_name), 'w')
+
+        def on_data(content_fragment):
+            if fp:
+                fp.write(content_fragment)
+            block = splitter.feed(content_fragment)
+            if block:
+                accumulator.add_block(block)
+
+        def on_done(response, error):
+            try:
+                if fp:
+                    fp.close()
+
+                if error is not None:
+                    print_message('Downloading %s failed: %s'
+                                  % (key_name, error))
+                else:
+                    block = splitter.flush()
+                    if block:
+                        accumulator.add_block(block)
+                    self.data_accumulator.add_results(
+                        self.data_accumulator.log_results(key, accumulator))
+            finally:
+                # an error is logged by the event loop
+                self._key_done()
+
+        self.connection.get_contents(key, on_data, on_done)
+        return True
+
+    def _key_done(self):
+        self.keys_pending -= 1
+        if self.keys_pending:
+            return
+
+        print_message('Total amount of data (bytes) received by \'%s\' from '
+                      'clients so far: %s'
+                      % (self.elb_name, self.data_accumulator.client_sent))
+        print_message('Total amount of data (bytes) sent by \'%s\' to '
+                      'clients so far: %s'
+                      % (self.elb_name, self.data_accumulator.client_receive))
+
+        self.logs_obtained += 1
+        print_message('Access log of \'%s\' obtained so far : %s\n'
+                      % (self.elb_name, self.logs_obtained))
+        self._next_log()
+
+    def _finish(self):
+        self.result_queue.put(
+            (self.elb_name, (self.data_accumulator.client_sent,
+                             self.data_accumulator.client_receive,
+                             self.data_accumulator.client_requests,
+                             self.data_accumulator.traffic,
+                             self.data_accumulator.latency)))
+
+
+def collect_on_event_loop(elb_buckets_dict):
+    """
+    Collect the access logs of all elbs on one event loop
+
+    :param elb_buckets_dict:    Bucket names by elb_name:elb_region
+    :return:                    Queue of the results of each elb as put by
+                                counting_elb_data
+    """
+    loop = EventLoop()
+    connection = AsyncS3Connection(loop)
+    result_queue = Queue.Queue()
+
+    for elb_region_str, bucket_name in elb_buckets_dict.iteritems():
+        elb_name, elb_region = elb_region_str.split(':')
+        ElbLogCollector(connection, bucket_name, elb_region, elb_name,
+                        result_queue).start()
+
+    # by the time the loop runs out of work it is the end of measurement
+    # interval
+    loop.run()
+    return result_queue
 
 
 def counting_elb_data(bucket, elb, queue):
@@ -291,11 +872,13 @@ def counting_elb_data(bucket, elb, queue):
     elb_name, elb_region = elb.split(':')
     results = process_access_log(bucket, elb_region, elb_name)
 
-    clients_sent, client_received = results
+    clients_sent, client_received, client_requests, traffic, latency = \
+        results
 
     # convert bucket name and total amount of data to string
     # so that the element in queue can have bucket name info
-    data_tuple = (elb_name, (clients_sent, client_received))
+    data_tuple = (elb_name, (clients_sent, client_received, client_requests,
+                             traffic, latency))
     queue.put(data_tuple)
 
 
@@ -308,38 +891,52 @@ def process_elb_access_log(elb_buckets_dict, queue):
     :return:
     """
 
-    # collecting access log for each elb with different threads
-    elb_data_manager = ThreadingManager()
-
-    for elb_region_str, bucket_name in elb_buckets_dict.iteritems():
-        c = S3Connection()
-        bucket = c.get_bucket(bucket_name)
-
-        elb_data_manager.start_tasks(
-            target_func=counting_elb_data,
-            name="elb_data_collector",
-            para=[bucket, elb_region_str]
-        )
-
-    # waiting for all threads to finish parsing S3 log
-    # by which time it will be the end of measurement interval
-    result_queue = elb_data_manager.collect_results()
+    if fetch_engine == 'event_loop':
+        result_queue = collect_on_event_loop(elb_buckets_dict)
+    else:
+        # collecting access log for each elb with different threads
+        elb_data_manager = ThreadingManager()
+
+        for elb_region_str, bucket_name in elb_buckets_dict.iteritems():
+            c = S3Connection()
+            bucket = c.get_bucket(bucket_name)
+
+            elb_data_manager.start_tasks(
+                target_func=counting_elb_data,
+                name="elb_data_collector",
+                para=[bucket, elb_region_str]
+            )
+
+        # waiting for all threads to finish parsing S3 log
+        # by which time it will be the end of measurement interval
+        result_queue = elb_data_manager.collect_results()
     # collect the total data processed by each ELB
     data_in = dict()
     data_out = dict()
+    # the number of requests of each client to each station
+    request_counts = dict()
+    # TrafficSlots of each station
+    traffic = dict()
+    # LatencyHistograms of each station
+    latency = dict()
 
     while not result_queue.empty():
         data_tuple = result_queue.get()
         station = data_tuple[0]
         # the amount of data sent and received by each client
         # *of ONE station
-        client_sent, client_received = data_tuple[1]
+        client_sent, client_received, client_requests, station_traffic, \
+            station_latency = data_tuple[1]
 
         data_in.update({station: client_sent})
         data_out.update({station: client_received})
+        request_counts.update({station: client_requests})
+        traffic.update({station: station_traffic})
+        latency.update({station: station_latency})
 
     # debug
     print_message('Data in (bytes) from clients: %s' % data_in)
     print_message('Data out (bytes) from clients: %s' % data_out)
+    print_message('Requests from clients: %s' % request_counts)
 
-    queue.put((data_in, data_out))
\ No newline at end of file
+    queue.put((data_in, data_out, request_counts, traffic, latency))
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Per client traffic of an ELB bucketed into fixed time slots.
+
+Bytes received from, bytes sent to and requests of each client are summed up
+per slot in numpy arrays of shape (number of clients, number of slots), hence
+rates can be computed for any window covered by the slots without parsing
+access logs again.
+"""
+from __future__ import division
+
+import numpy
+
+from etc.configuration import cfg
+
+# length of time slots in seconds
+traffic_slot_seconds = cfg.get_int('s3', 'traffic_slot_seconds', 60)
+
+# number of slots allocated up front, enough for a measurement interval
+INITIAL_SLOTS = 64
+
+RECEIVED, SENT, REQUESTS = range(3)
+
+
+class TrafficSlots(object):
+    """
+    Time slotted traffic of each client through one station
+    """
+
+    def __init__(self, client_names, slot_seconds=traffic_slot_seconds,
+                 capacity=INITIAL_SLOTS):
+        """
+        :param client_names:    Names of clients, in the order of client
+                                indices passed to add()
+        :param slot_seconds:    Length of time slots in seconds
+        :param capacity:        Number of slots allocated up front
+        """
+        self.client_names = list(client_names)
+        self.slot_seconds = slot_seconds
+
+        # slot number, counted from the epoch, of the first column
+        self.origin = None
+        self.num_slots = 0
+        # (counter, client, slot) with counters RECEIVED, SENT, REQUESTS
+        self.counts = numpy.zeros((3, len(self.client_names), capacity),
+                                  dtype=numpy.int64)
+
+    def _cover(self, first_slot, last_slot):
+        """
+        Make the arrays cover slots first_slot to last_slot, reallocating
+        only when they run out of capacity
+        """
+        if self.origin is None:
+            self.origin = first_slot
+
+        start = min(self.origin, first_slot)
+        stop = max(self.origin + self.num_slots, last_slot + 1)
+        shift = self.origin - start
+
+        if stop - start > self.counts.shape[2] or shift:
+            capacity = self.counts.shape[2]
+            while capacity < stop - start:
+                capacity *= 2
+
+            counts = numpy.zeros(self.counts.shape[:2] + (capacity,),
+                                 dtype=numpy.int64)
+            counts[:, :, shift:shift + self.num_slots] = \
+                self.counts[:, :, :self.num_slots]
+            self.counts = counts
+            self.origin = start
+
+        self.num_slots = stop - start
+
+    def add(self, clients, times, received, sent, requests=None):
+        """
+        Count requests
+
+        :param clients:     numpy array of client indices of requests
+        :param times:       numpy array of request times in seconds since the
+                            epoch
+        :param received:    numpy array of bytes received with requests
+        :param sent:        numpy array of bytes sent in response
+        :param requests:    numpy array of the number of requests each entry
+                            stands for, one by default
+        """
+        if not len(clients):
+            return
+
+        slots = times // self.slot_seconds
+        self._cover(int(slots.min()), int(slots.max()))
+
+        capacity = self.counts.shape[2]
+        cells = clients * capacity + (slots - self.origin)
+        size = len(self.client_names) * capacity
+
+        for counter, weights in [(RECEIVED, received), (SENT, sent),
+                                 (REQUESTS, requests)]:
+            sums = numpy.bincount(cells, weights=weights, minlength=size)
+            self.counts[counter] += \
+                numpy.round(sums).astype(numpy.int64).reshape(-1, capacity)
+
+    def merge(self, other):
+        """
+        Add the counts of other, which has the same slot length
+        """
+        if other.origin is None:
+            return
+
+        if other.client_names != self.client_names:
+            self.add_rows(other.to_rows())
+            return
+
+        self._cover(other.origin, other.origin + other.num_slots - 1)
+
+        start = other.origin - self.origin
+        self.counts[:, :, start:start + other.num_slots] += \
+            other.counts[:, :, :other.num_slots]
+
+    def to_rows(self):
+        """
+        :return: [client name, slot start time, bytes received, bytes sent,
+                 requests] of every slot with requests, e.g. to be saved as
+                 json
+        """
+        rows = []
+        if self.origin is None:
+            return rows
+
+        counts = self.counts[:, :, :self.num_slots]
+        for client, slot in zip(*numpy.nonzero(counts[REQUESTS])):
+            rows.append([self.client_names[client],
+                         (self.origin + int(slot)) * self.slot_seconds] +
+                        [int(value) for value in counts[:, client, slot]])
+        return rows
+
+    def add_rows(self, rows):
+        """
+        Add slots saved by to_rows()
+        """
+        client_index = dict((c_name, i)
+                            for i, c_name in enumerate(self.client_names))
+        rows = [row for row in rows if row[0] in client_index]
+        if not rows:
+            return
+
+        columns = [numpy.array(column, dtype=numpy.int64)
+                   for column in zip(*rows)[1:]]
+        clients = numpy.array([client_index[row[0]] for row in rows],
+                              dtype=numpy.int64)
+        self.add(clients, *columns)
+
+    def totals(self, start=None, end=None):
+        """
+        :param start:   Start of the window in seconds since the epoch,
+                        rounded down to a slot
+        :param end:     End of the window, rounded up to a slot
+        :return:        (bytes received, bytes sent, requests) dicts by
+                        client name within the window
+        """
+        counts = self.window(start, end)[0].sum(axis=2)
+
+        return tuple(dict(zip(self.client_names,
+                              [int(value) for value in counts[counter]]))
+                     for counter in (RECEIVED, SENT, REQUESTS))
+
+    def rates(self, start=None, end=None):
+        """
+        :return: (bytes received, bytes sent, requests) per second dicts by
+                 client name within the window, see totals()
+        """
+        counts, seconds = self.window(start, end)
+        counts = counts.sum(axis=2) / max(seconds, 1)
+
+        return tuple(dict(zip(self.client_names,
+                              [float(value) for value in counts[counter]]))
+                     for counter in (RECEIVED, SENT, REQUESTS))
+
+    def window(self, start=None, end=None):
+        """
+        :return: (counts of the slots within the window, length of the window
+                 in seconds). The window defaults to all slots counted
+        """
+        if self.origin is None:
+            return numpy.zeros(self.counts.shape[:2] + (0,),
+                               dtype=numpy.int64), 0
+
+        first = self.origin
+        stop = self.origin + self.num_slots
+        if start is not None:
+            first = int(start // self.slot_seconds)
+        if end is not None:
+            stop = int(-(-end // self.slot_seconds))
+
+        seconds = max(stop - first, 0) * self.slot_seconds
+
+        first = min(max(first - self.origin, 0), self.num_slots)
+        stop = min(max(stop - self.origin, first), self.num_slots)
+
+        return self.counts[:, :, first:stop], seconds
@@ -1,4 +1,5 @@
 import ConfigParser
+import collections
 import logging
 import logging.handlers
 import os
@@ -58,6 +59,83 @@ cfg = Config(config_dir + '/config.ini')
 log = logging.getLogger(__name__)
 
 
+# settings of the snapshot: (attribute, section, option, type, default)
+SNAPSHOT_SETTINGS = [
+    ('num_retries', 'HTTPConnection', 'num_retries', int, 6),
+    ('max_retry_delay', 'HTTPConnection', 'max_retry_delay', float, 60),
+    ('http_socket_timeout', 'HTTPConnection', 'http_socket_timeout', int, 70),
+    ('keep_alive', 'HTTPConnection', 'keep_alive', bool, True),
+    ('pool_size', 'HTTPConnection', 'pool_size', int, 10),
+    ('pool_idle_timeout', 'HTTPConnection', 'pool_idle_timeout', int, 30),
+    ('key_buffer_size', 's3', 'key_buffer_size', int, 8192),
+    ('log_emitting_time', 's3', 'log_emitting_time', int, 5),
+    ('log_polling_interval', 's3', 'log_polling_interval', int, 60),
+    ('dense_polling_interval', 's3', 'dense_polling_interval', int, 5),
+    ('polling_lead_time', 's3', 'polling_lead_time', int, 10),
+    ('polling_history', 's3', 'polling_history', int, 12),
+    ('measurement_interval', 'Default', 'measurement_interval', int, 10),
+]
+
+
+class ConfigSnapshot(collections.namedtuple(
+        'ConfigSnapshot', [name for name, _, _, _, _ in SNAPSHOT_SETTINGS])):
+    """
+    Settings read often e.g. on every request, converted once. Being a tuple
+    it cannot be changed, a reload builds a new one instead
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config:  Config to read, settings that are missing or cannot
+                        be converted take their default
+        """
+        values = []
+        for name, section, option, value_type, default in SNAPSHOT_SETTINGS:
+            try:
+                value = ConfigParser.SafeConfigParser.get(config, section,
+                                                          option)
+                if value_type is bool:
+                    value = value.strip().lower() == 'true'
+                else:
+                    value = value_type(value)
+            except (ConfigParser.Error, ValueError):
+                value = default
+            values.append(value)
+        return cls(*values)
+
+
+_settings = ConfigSnapshot.from_config(cfg)
+
+
+def get_settings():
+    """
+    :return: The current ConfigSnapshot. Callers keep the one they got for
+             the length of an operation, e.g. a request with its retries
+    """
+    return _settings
+
+
+def refresh_settings():
+    """
+    Build a new ConfigSnapshot from cfg as it is now e.g. after cfg.set()
+    and make it the current one
+    """
+    global _settings
+    # a single assignment, readers get either the old or the new snapshot
+    _settings = ConfigSnapshot.from_config(cfg)
+    return _settings
+
+
+def reload_settings():
+    """
+    Read the configuration file again and refresh the snapshot
+    """
+    cfg.read(config_dir + '/config.ini')
+    return refresh_settings()
+
+
 def setup_logging():
     logging.basicConfig(level=cfg.get('Logging', 'log_level'))
     handler = logging.handlers.WatchedFileHandler(
@@ -2,6 +2,8 @@ from __future__ import division
 import time
 import math
 
+import numpy
+
 from connection.route_53_connection import Route53Connection
 from data_parser.client_server.server_log_processor import process_server_logs
 from data_parser.optimization import optimisation
@@ -11,6 +13,7 @@ from models.resource_record_set import ResourceRecordSets
 from utilities.exception import UnsuccessfulRequestError
 from utilities.heart_beater import measure_latency
 from utilities.multi_threading import ThreadingManager
+from utilities.process_pool import start_process_pool
 from utilities.utils import get_station_region, get_available_stations, \
     calculate_waiting_time, get_stations_bandwidth, get_elb_buckets_map, \
     print_message, log_info, get_available_clients, station_metadata_map
@@ -149,8 +152,8 @@ def clients_optimisation(avg_data_in_per_reqs, avg_data_out_per_reqs, client,
 def main():
     setup_logging()
 
-    # line counter for reading csparql logs of each service station
-    line_counters = dict()
+    # offset for reading csparql logs of each service station
+    log_offsets = dict()
 
     # bucket and ELB info for getting access log from S3
     elb_buckets_dict = dict()
@@ -162,7 +165,7 @@ def main():
 
     stations = get_available_stations()
     for station in stations:
-        line_counters.update({station: 0})
+        log_offsets.update({station: None})
 
     log_base_dir = time.strftime("%Y_%m%d_%H%M")
     total_num_users = cfg.get_int('Default', 'total_num_users')
@@ -170,6 +173,11 @@ def main():
     # Get all available client region
     available_clients = get_available_clients()
 
+    # the process pool has to be forked before any thread is started
+    if cfg.get('MonitorLog', 'data_generation_mode', default='thread') == \
+            'process' or cfg.get_bool('MonitorLog', 'parallel_parsing'):
+        start_process_pool()
+
     # counter = 0  # For testing
     while True:
 
@@ -201,7 +209,7 @@ def main():
         server_log_processor.start_task(
             target_func=process_server_logs,
             name="server_log_processor",
-            para=[log_base_dir, line_counters, total_num_users,
+            para=[log_base_dir, log_offsets, total_num_users,
                   measurement_interval]
         )
 
@@ -220,14 +228,31 @@ def main():
         # while elb data might has delay
         server_metrics_queue = server_log_processor.collect_results()
         (station_metric_list, total_request) = server_metrics_queue.get()
-        line_counters = server_metrics_queue.get()
+        log_offsets = server_metrics_queue.get()
 
         print_message('')
         print_message('Service station logs processing finished\n')
 
         # collecting elb data now
         elb_data_queue = data_counting_task.collect_results()
-        data_in, data_out = elb_data_queue.get()
+        data_in, data_out, request_counts, traffic, backend_latency = \
+            elb_data_queue.get()
+
+        # request rates of each client over the time covered by the logs,
+        # any other window can be taken from the same time slots
+        for station_name, station_traffic in traffic.iteritems():
+            in_rates, out_rates, request_rates = station_traffic.rates()
+            print_message('Requests per second to station \'%s\' from '
+                          'clients: %s' % (station_name, request_rates))
+
+        # server side latency observed by the elbs, alongside the latency
+        # measured from clients
+        for station_name, station_latency in backend_latency.iteritems():
+            info_str = 'Backend processing time (requests, mean, median, ' \
+                       '95th percentile) of station \'%s\' per client: %s' \
+                       % (station_name, station_latency.summary())
+            print_message(info_str)
+            log_info(metric_record_file, info_str)
 
         """ Preparing optimisation parameters """
         # Calculate The "average amount of data involved in each request" for
@@ -281,53 +306,32 @@ def main():
                      '[Debug] predicted currentresponse time of service '
                      'station \'%s\': %s' % (station_name, response_time))
 
-        # TODO: calculate total requests for each client
-        # TODO: if c-sparql could record the source of each requests
-        # TODO: things would be much more easier
-        total_request_per_client = dict()
-        data_in_sum = 0
-        client_data_in_sum = dict()
-
-        for a_client in available_clients:
-            client_data_in_sum.update({a_client: 0})
-
-        for station_name in stations:
-            d_in = data_in.get(station_name)
-            for c, sent_data in d_in.iteritems():
-                # calculate total data sent by each client
-                # and the total data sent by all client
-                client_data_in_sum[c] += sent_data
-                data_in_sum += sent_data
-
-        # calculate total amount of requests sent by each client
-        for ac in available_clients:
-            t_request = math.ceil(
-                total_request * (client_data_in_sum[ac] / data_in_sum))
-            t_request = int(t_request)
-
-            # build this so that it could be used by calculating out data
-            total_request_per_client.update({ac: t_request})
-
-        for station_name in stations:
-            d_in = data_in.get(station_name)
-
-            for c, sent_data in d_in.iteritems():
-                t_request = total_request_per_client[c]
-                # convert the amount of data to GB
-                sent_data = float(sent_data / math.pow(1024, 3))
-                avg_data_in_per_req = sent_data / t_request
-                avg_data_in_per_reqs[c].update(
-                    {station_name: avg_data_in_per_req})
-
-        for station_name in stations:
-            d_out = data_out.get(station_name)
-
-            for c1, received_data in d_out.iteritems():
-                t_request = total_request_per_client[c1]
-                received_data = float(received_data / math.pow(1024, 3))
-                avg_data_out_per_req = received_data / t_request
-                avg_data_out_per_reqs[c1].update(
-                    {station_name: avg_data_out_per_req})
+        # requests, data in and data out of each client (rows) through each
+        # station (columns) as counted from elb access logs
+        def client_station_matrix(station_dicts):
+            return numpy.array([[station_dicts.get(station_name, {}).get(c, 0)
+                                 for station_name in stations]
+                                for c in available_clients], dtype=float)
+
+        requests = client_station_matrix(request_counts)
+        bytes_in = client_station_matrix(data_in)
+        bytes_out = client_station_matrix(data_out)
+
+        # total amount of requests sent by each client
+        total_request_per_client = dict(
+            zip(available_clients, requests.sum(axis=1).astype(int).tolist()))
+
+        # average amount of data in GB per request, 0 where a client sent no
+        # requests through a station
+        served = numpy.maximum(requests, 1)
+        gigabyte = math.pow(1024, 3)
+        avg_in = numpy.where(requests > 0, bytes_in / served, 0) / gigabyte
+        avg_out = numpy.where(requests > 0, bytes_out / served, 0) / gigabyte
+
+        for idx, c in enumerate(available_clients):
+            avg_data_in_per_reqs[c].update(zip(stations, avg_in[idx].tolist()))
+            avg_data_out_per_reqs[c].update(
+                zip(stations, avg_out[idx].tolist()))
 
         # For testing purpose
         info_str = \
@@ -38,17 +38,40 @@ class ListBucketResult(XMLClass):
 
     class_name = 'ListBucketResult'
 
-    _nodesOrder = [u'Name', u'Prefix', u'Marker', u'MaxKeys', u'Delimiter',
-                   u'IsTruncated', u'CommonPrefixes']
+    _nodesOrder = [u'Name', u'Prefix', u'Marker', u'NextMarker', u'MaxKeys',
+                   u'Delimiter', u'IsTruncated', u'Contents',
+                   u'CommonPrefixes']
 
     name = TextNode(name='Name')
     prefix = TextNode(name='Prefix')
     marker = TextNode(name='Marker')
+    # only returned along with a delimiter when the result is truncated
+    next_marker = TextNode(name='NextMarker', optional=True)
     maxKeys = TextNode(name='MaxKeys')
-    delimiter = TextNode(name='Delimiter')
+    delimiter = TextNode(name='Delimiter', optional=True)
     is_truncated = TextNode(name='IsTruncated')
+    contents = ListNode(u'Contents')
     common_prefixes = ListNode(u'CommonPrefixes')
 
 
+class Contents(XMLObject):
+    _nodesOrder = [u'Key', u'LastModified', u'ETag', u'Size', u'Owner',
+                   u'StorageClass']
+
+    key = TextNode(name='Key')
+    last_modified = TextNode(name='LastModified')
+    entity_tag = TextNode(name='ETag')
+    size = TextNode(name='Size')
+    owner = ItemNode(u'Owner', optional=True)
+    storage_class = TextNode(name='StorageClass')
+
+
+class Owner(XMLObject):
+    _nodesOrder = [u'ID', u'DisplayName']
+
+    id = TextNode(name='ID')
+    display_name = TextNode(name='DisplayName', optional=True)
+
+
 class CommonPrefixes(XMLObject):
     prefix = TextNode(name='Prefix')
\ No newline at end of file
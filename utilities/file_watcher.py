@@ -0,0 +1,157 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import sys
+import time
+
+from utilities.utils import print_message
+
+# inotify events that can bring new bytes to the watched file. The directory
+# is watched rather than the file since rsync replaces the file on every
+# synchronisation
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCHED_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+
+def _load_inotify():
+    """
+    :return: libc if it provides inotify, otherwise None
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+def _file_size(file_path):
+    """
+    :return: Size of the file or None if it does not exist
+    """
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None
+
+
+class FileWatcher(object):
+    """
+    Tells when bytes have been written to a file.
+
+    Waiting blocks on inotify where available and falls back to polling
+    the size of the file otherwise. Either way only the size of the file
+    decides whether it has changed, hence events that do not bring new bytes
+    e.g. a touch or an unchanged copy renamed into place do not wake the
+    waiter up
+    """
+
+    # seconds between checks when inotify is not available
+    PollInterval = 0.5
+
+    def __init__(self, file_path, use_inotify=True):
+        """
+        :param file_path:   Path of the watched file, it does not need to
+                            exist yet. A symbolic link is followed
+        :param use_inotify: Whether waiting may block on inotify. Only worth
+                            it when something writes the file while waiting
+        """
+        self.file_path = os.path.realpath(file_path)
+        self.last_size = None
+        self.fd = None
+
+        libc = use_inotify and _load_inotify()
+        if libc:
+            self._init_inotify(libc)
+
+    def __repr__(self):
+        return '<FileWatcher: %s (%s)>' % (
+            self.file_path, 'inotify' if self.fd is not None else 'polling')
+
+    def _init_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print_message('inotify not available, polling %s instead: %s'
+                          % (self.file_path,
+                             os.strerror(ctypes.get_errno())))
+            return
+
+        directory = os.path.dirname(self.file_path)
+        if libc.inotify_add_watch(fd, directory, WATCHED_EVENTS) < 0:
+            print_message('Fail to watch %s, polling %s instead: %s'
+                          % (directory, self.file_path,
+                             os.strerror(ctypes.get_errno())))
+            os.close(fd)
+            return
+
+        self.fd = fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _drain_events(self):
+        while True:
+            try:
+                if not os.read(self.fd, 4096):
+                    return
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return
+                raise
+
+    def changed(self):
+        """
+        :return: Whether the file has changed since the previous call that
+                 returned True
+        """
+        if self.fd is not None:
+            self._drain_events()
+
+        size = _file_size(self.file_path)
+        if size is None or size == self.last_size:
+            return False
+
+        self.last_size = size
+        return True
+
+    def wait(self, timeout):
+        """
+        Block until new bytes have been written to the file
+
+        :param timeout: Maximum number of seconds to wait
+        :return:        Whether the file has changed
+        """
+        deadline = time.time() + timeout
+
+        while True:
+            if self.changed():
+                return True
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            if self.fd is not None:
+                try:
+                    select.select([self.fd], [], [], remaining)
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+            else:
+                time.sleep(min(self.PollInterval, remaining))
@@ -0,0 +1,187 @@
+"""
+Helpers for parsing large line based logs directly from memory-mapped files.
+
+Lines are located with vectorised byte searches over the mapped buffer and
+fields are handed to numpy column by column, hence no python string is built
+per line.
+"""
+import mmap
+import os
+
+import numpy
+
+# number of bytes scanned for line breaks at a time
+BLOCK_SIZE = 64 * 1024 * 1024
+
+NEWLINE = ord('\n')
+
+
+def iter_line_blocks(file_path, offset=0, group_size=1, block_size=BLOCK_SIZE):
+    """
+    Memory-map a file and yield blocks of complete lines starting from offset
+
+    The blocks are views over the mapped buffer and are only valid until the
+    next block is requested. Anything kept from them has to be copied.
+
+    :param file_path:       Path of the file
+    :param offset:          Byte offset to start from
+    :param group_size:      Number of lines that make up a record. Blocks
+                            always end at record boundaries and a trailing
+                            record that is not complete yet is left out
+    :param block_size:      Number of bytes scanned at a time
+    :return:                (block, offset of the block, line starts,
+                            line ends) where line bounds are relative to the
+                            block and exclude the line break
+    """
+    size = os.path.getsize(file_path)
+    if size <= offset:
+        return
+
+    with open(file_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = numpy.frombuffer(mapped, dtype=numpy.uint8)
+        try:
+            start = offset
+            while start < size:
+                end = min(start + block_size, size)
+                block = buf[start:end]
+
+                newlines = numpy.flatnonzero(block == NEWLINE)
+                num_lines = len(newlines) - len(newlines) % group_size
+
+                if not num_lines:
+                    # a record longer than the block
+                    if end < size:
+                        block_size *= 2
+                        continue
+                    break
+
+                ends = newlines[:num_lines]
+                starts = numpy.empty(num_lines, dtype=ends.dtype)
+                starts[0] = 0
+                starts[1:] = ends[:-1] + 1
+
+                yield block[:ends[-1] + 1], start, starts, ends
+
+                start += int(ends[-1]) + 1
+        finally:
+            # the mapping can only be closed once no view refers to it
+            del buf
+            mapped.close()
+
+
+def find_all(block, char):
+    """
+    Positions of every occurrence of a single character in the block
+    """
+    return numpy.flatnonzero(block == ord(char))
+
+
+def locate_separators(separators, starts, ends):
+    """
+    :param separators:  Sorted positions of field separators in a block
+    :param starts:      Line starts
+    :param ends:        Line ends
+    :return:            (index of the first separator of each line,
+                        number of separators in each line)
+    """
+    first = numpy.searchsorted(separators, starts)
+    count = numpy.searchsorted(separators, ends) - first
+    return first, count
+
+
+def field_bounds(separators, first, count, starts, ends, k):
+    """
+    Bounds of the k-th field (zero based) of each line. The last field of a
+    line ends at the end of the line.
+    """
+    if not len(separators):
+        # nothing to take from, lines consist of a single field
+        separators = numpy.array([-1])
+
+    if k == 0:
+        field_starts = starts
+    else:
+        field_starts = separators.take(first + k - 1, mode='clip') + 1
+
+    field_ends = numpy.where(count > k,
+                             separators.take(first + k, mode='clip'), ends)
+    return field_starts, field_ends
+
+
+def gather(block, starts, ends):
+    """
+    Copy the given byte ranges of the block into a numpy string array which
+    can then be converted in bulk with astype()
+    """
+    if not len(starts):
+        return numpy.array([], dtype='S1')
+
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+
+    # numpy strings are padded with null characters
+    chars = numpy.zeros((len(starts), width), dtype=numpy.uint8)
+
+    # copied a column at a time over the ranges that are long enough, so
+    # that no index is built per byte of the result
+    rows = numpy.flatnonzero(lengths > 0)
+    for k in xrange(width):
+        rows = rows[lengths[rows] > k]
+        if not len(rows):
+            break
+        chars[rows, k] = block[starts[rows] + k]
+
+    return chars.view('S%d' % width).ravel()
+
+
+def parse_integers(block, starts, ends):
+    """
+    Convert the given byte ranges of the block into integers with digit
+    arithmetic rather than string conversion. Ranges that are anything but
+    plain digits are converted like int() does
+
+    :return: numpy array of int64
+    """
+    if not len(starts):
+        return numpy.array([], dtype=numpy.int64)
+
+    width = max(int((ends - starts).max()), 1)
+
+    # beyond 18 digits int64 could overflow
+    if width > 18:
+        return gather(block, starts, ends).astype(numpy.int64)
+
+    indices = starts[:, None] + numpy.arange(width)
+    in_range = indices < ends[:, None]
+
+    digits = block.take(indices, mode='clip').astype(numpy.int64) - ord('0')
+    if ((digits < 0) | (digits > 9))[in_range].any() or \
+            (ends <= starts).any():
+        return gather(block, starts, ends).astype(numpy.int64)
+
+    # position of each digit counted from the last one of the range
+    exponents = ends[:, None] - indices - 1
+    powers = 10 ** numpy.where(in_range, exponents, 0)
+
+    return (numpy.where(in_range, digits, 0) * powers).sum(axis=1)
+
+
+def parse_floats(block, starts, ends):
+    """
+    Convert the given byte ranges of the block into floats. Ranges that are
+    not numbers become nan
+
+    :return: numpy array of float64
+    """
+    fields = gather(block, starts, ends)
+    try:
+        return fields.astype(numpy.float64)
+    except ValueError:
+        values = numpy.empty(len(fields))
+        for i, field in enumerate(fields.tolist()):
+            try:
+                values[i] = float(field)
+            except ValueError:
+                values[i] = numpy.nan
+        return values
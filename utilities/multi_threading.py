@@ -1,5 +1,6 @@
 import Queue
 import threading
+import traceback
 
 
 class ThreadingManager(object):
@@ -72,4 +73,85 @@ class ThreadingManager(object):
         for thread in self.threads_list:
             thread.join()
 
-        return self.queue
\ No newline at end of file
+        return self.queue
+
+
+class ThreadPoolManager(ThreadingManager):
+    """
+    class that runs tasks on a bounded number of threads. Worker threads are
+    kept between rounds of tasks, hence anything they hold per thread e.g.
+    keep-alive connections is reused
+    """
+
+    def __init__(self, max_workers):
+        """
+        :param max_workers: Maximum number of threads that run tasks
+        """
+        ThreadingManager.__init__(self)
+        self.max_workers = max(1, max_workers)
+        self.tasks = Queue.Queue()
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+
+                target_func, para = task
+                try:
+                    target_func(*para)
+                except Exception:
+                    # a failed task should not take the worker down with it
+                    traceback.print_exc()
+            finally:
+                self.tasks.task_done()
+
+    def start_tasks(self, target_func, name, para):
+        """
+        Function to queue a task with input parameters, which includes a
+        synchronised queue to store results from tasks if there are any. A new
+        worker thread is started unless there are max_workers already
+
+        :param target_func: The content of the task
+        :param name:        Name prefix of worker threads
+        :param para:        Input parameter of the task
+        """
+
+        # pass queue to the worker function by default
+        para += (self.queue,)
+        self.tasks.put((target_func, para))
+
+        if len(self.threads_list) < self.max_workers:
+            new_thread = threading.Thread(
+                target=self._work,
+                name=name+str(self.thread_name_counter)
+            )
+            new_thread.daemon = True
+
+            new_thread.start()
+            self.threads_list.append(new_thread)
+            self.thread_name_counter += 1
+
+    def collect_results(self):
+        """
+        Wait for all queued tasks to finish. Results should be written to the
+        queue if there are any results
+
+        :return: The queue that stores results
+        """
+        self.tasks.join()
+
+        return self.queue
+
+    def shutdown(self):
+        """
+        Stop worker threads once the queued tasks are done
+        """
+        for thread in self.threads_list:
+            self.tasks.put(None)
+
+        for thread in self.threads_list:
+            thread.join()
+
+        self.threads_list = []
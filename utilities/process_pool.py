@@ -0,0 +1,49 @@
+"""
+Pool of processes shared by the parsers.
+
+multiprocessing forks the workers of a pool when it is created. A fork only
+copies the thread that makes it, so locks held by other threads at that time
+e.g. of logging handlers or queues stay locked forever in the workers. Hence
+the pool is created once by the main thread, before the worker threads are
+started, and the threads reuse it.
+"""
+import multiprocessing
+import threading
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def is_main_thread():
+    return threading.current_thread().name == 'MainThread'
+
+
+def start_process_pool(num_processes=None):
+    """
+    Create the shared pool. Has to be called from the main thread before
+    other threads are started
+
+    :param num_processes:   Size of the pool, number of cores by default
+    :return:                The shared pool
+    """
+    global _pool
+
+    if not is_main_thread():
+        raise RuntimeError('The process pool has to be started by the main '
+                           'thread')
+
+    with _pool_lock:
+        if not _pool:
+            _pool = multiprocessing.Pool(
+                processes=num_processes or multiprocessing.cpu_count())
+        return _pool
+
+
+def get_process_pool():
+    """
+    :return: The shared pool. It is started if this is the main thread, None
+             if it has not been started and this is another thread
+    """
+    if _pool or not is_main_thread():
+        return _pool
+    return start_process_pool()
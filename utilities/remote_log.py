@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import threading
+
+import paramiko
+
+from utilities.utils import print_message
+
+
+class RemoteLogTailer(object):
+    """
+    Keeps a single SSH/SFTP session open to a remote host and appends
+    whatever has been written to a remote log since the last call to a
+    local copy of it
+    """
+
+    # number of bytes read from the remote file at a time
+    ChunkSize = 32768
+
+    # seconds between keep alive packets of idle sessions
+    KeepAliveInterval = 30
+
+    def __init__(self, host_ip, username, pk_path, remote_path, local_path):
+        """
+        :param host_ip:     Remote Host IP
+        :param username:    Username used to login to remote machine
+        :param pk_path:     Private key used to login
+        :param remote_path: Path of the log on the remote machine, relative
+                            paths and '~/' are relative to the home directory
+        :param local_path:  Path of the local copy
+        """
+        self.host_ip = host_ip
+        self.username = username
+        self.pk_path = pk_path
+        if remote_path.startswith('~/'):
+            remote_path = remote_path[2:]
+        self.remote_path = remote_path
+        self.local_path = local_path
+
+        self.ssh = None
+        self.sftp = None
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return '<RemoteLogTailer: %s@%s:%s>' % (self.username, self.host_ip,
+                                                self.remote_path)
+
+    def _connect(self):
+        if self.sftp:
+            return
+
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(self.host_ip, username=self.username,
+                    key_filename=self.pk_path)
+        logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+        ssh.get_transport().set_keepalive(self.KeepAliveInterval)
+
+        self.ssh = ssh
+        self.sftp = ssh.open_sftp()
+
+    def close(self):
+        if self.sftp:
+            self.sftp.close()
+        if self.ssh:
+            self.ssh.close()
+
+        self.sftp = None
+        self.ssh = None
+
+    def _append_new_bytes(self):
+        remote_size = self.sftp.stat(self.remote_path).st_size
+
+        local_size = 0
+        if os.path.exists(self.local_path):
+            local_size = os.path.getsize(self.local_path)
+
+        # the remote log has been truncated or replaced
+        if remote_size < local_size:
+            print_message('%s shrunk on %s, copying it from the start'
+                          % (self.remote_path, self.host_ip))
+            open(self.local_path, 'wb').close()
+            local_size = 0
+
+        if remote_size == local_size:
+            return 0
+
+        appended = 0
+        remote_f = self.sftp.open(self.remote_path, 'rb')
+        try:
+            remote_f.seek(local_size)
+            with open(self.local_path, 'ab') as local_f:
+                while local_size + appended < remote_size:
+                    data = remote_f.read(
+                        min(self.ChunkSize,
+                            remote_size - local_size - appended))
+                    if not data:
+                        break
+                    local_f.write(data)
+                    appended += len(data)
+        finally:
+            remote_f.close()
+
+        return appended
+
+    def sync(self):
+        """
+        Append bytes written to the remote log since the last call to the
+        local copy. The session is re-established once if it has been lost
+
+        :return: The number of bytes appended
+        """
+        with self.lock:
+            for attempt in xrange(2):
+                try:
+                    self._connect()
+                    return self._append_new_bytes()
+                # socket.error is a subclass of IOError hence caught first
+                except (paramiko.SSHException, socket.error, EOFError) as e:
+                    print_message('Lost session to %s: %s'
+                                  % (self.host_ip, e))
+                    self.close()
+                    if attempt:
+                        raise
+                except IOError as e:
+                    # e.g. the remote log has not been created yet
+                    print_message('Fail to read %s on %s.\nDetails: %s'
+                                  % (self.remote_path, self.host_ip, e))
+                    return 0
+
+
+# tailers are kept open between measurement intervals
+_tailers = dict()
+_tailers_lock = threading.Lock()
+
+
+def get_log_tailer(host_ip, username, pk_path, remote_path, local_path):
+    """
+    :return: The RemoteLogTailer of the remote log and local copy, the
+             session of which is shared by all calls
+    """
+    key = (host_ip, remote_path, local_path)
+    with _tailers_lock:
+        if key not in _tailers:
+            _tailers[key] = RemoteLogTailer(host_ip, username, pk_path,
+                                            remote_path, local_path)
+        return _tailers[key]
@@ -9,7 +9,7 @@ import math
 from datetime import datetime, timedelta
 import paramiko
 
-from etc.configuration import cfg
+from etc.configuration import cfg, get_settings
 from utilities.exception import GeneralError
 from utilities.request_headers import HEADER_PREFIX_KEY, \
     HeaderInfoMap
@@ -206,12 +206,13 @@ def get_expected_num_logs():
     Function to return the number of ELB access log expected.
     (For code re-usability)
     """
-    measurement_interval = cfg.get_int('Default', 'measurement_interval', 10)
+    settings = get_settings()
+    measurement_interval = settings.measurement_interval
 
     print_message('')
     print_message('Measurement interval: %s' % measurement_interval)
 
-    logging_time = cfg.get_int('s3', 'log_emitting_time', 5)
+    logging_time = settings.log_emitting_time
     expected_logs_to_obtain = math.floor(measurement_interval / logging_time)
 
     return expected_logs_to_obtain
@@ -250,7 +251,7 @@ def get_next_nth_elb_log_time(n, last_expected_time):
     # with 5 (minutes) should be the next expected minute at which a new
     # log will be emitted
 
-    logging_interval = cfg.get_int('s3', 'log_emitting_time', 60)
+    logging_interval = get_settings().log_emitting_time
 
     if not last_expected_time:
         interval_covered = math.ceil(current_time.minute / logging_interval)
@@ -407,6 +408,43 @@ def execute_remote_command(host_address, command, username, password='',
     return [output_str, error_str]
 
 
+def upload_files(host_address, file_paths, remote_dir, username, password='',
+                 private_key=None):
+    """
+    Copy local files into a directory on a remote host over SFTP
+
+    :param host_address:    Remote Host IP
+    :param file_paths:      Paths of the local files
+    :param remote_dir:      Destination directory, relative to the home
+                            directory. It is created if it does not exist
+    :param username:        Username used to login to remote machine
+    :param password:        Password used to login
+    :param private_key:     Private key used to login
+    """
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(host_address, username=username, password=password,
+                key_filename=private_key)
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+    sftp = ssh.open_sftp()
+    try:
+        try:
+            sftp.mkdir(remote_dir)
+        except IOError:
+            # already exists
+            pass
+
+        for file_path in file_paths:
+            remote_path = remote_dir + '/' + os.path.basename(file_path)
+            print_message("[Debug] Uploading \'%s\' to %s:%s"
+                          % (file_path, host_address, remote_path))
+            sftp.put(file_path, remote_path)
+    finally:
+        sftp.close()
+        ssh.close()
+
+
 def make_qualified(value):
     """
     Ensure domain names end with "." character, which makes a domain